@@ -0,0 +1,98 @@
+"""
+Scaling benchmark for adversarial input.
+
+    python -m benchmarks.complexity
+    python -m benchmarks.complexity --engine tokenizer --growth 16
+
+Each unit below is repeated to a small and a large input and both are
+converted a few times, keeping the best time. The runner reports the ratio of
+the two times and exits with status 1 when any input scaled worse than
+linearly. Timings are noisy on shared machines, so this is a benchmark rather
+than part of the default test run.
+"""
+
+import argparse
+import sys
+import time
+
+from chatgpt_md_converter.telegram_formatter import ENGINES, telegram_format
+
+# Repeated units that leave delimiters unclosed or almost match a rule, the
+# shapes that make backtracking patterns rescan the rest of the text.
+ADVERSARIAL = {
+    "bold": "**a ",
+    "underline": "_a ",
+    "italic": "*a ",
+    "bold_italic": "***a ",
+    "strikethrough": "~~a ",
+    "spoiler": "||a ",
+    "link": "[a](",
+    "brackets": "[",
+    "nested_brackets": "[[x]",
+    "image": "![",
+    "url": "](",
+    "citation": "【a ",
+    "code_block": "```a ",
+    "inline_code": "`a ",
+    "blank_lines": "\n",
+    "bullets": "- \n",
+    "headings": "# \n",
+    "blockquotes": ">a\n",
+    "html": "&<>",
+}
+
+SMALL = 1000
+GROWTH = 8
+# Linear work grows GROWTH times, quadratic work GROWTH ** 2 times. The margin
+# absorbs timer noise and per-call overhead on the small input.
+MARGIN = 2.5
+
+
+def best_seconds(text: str, engine: str, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        telegram_format(text, engine=engine)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def measure_scaling(name: str, engine: str, growth: int = GROWTH) -> dict:
+    """
+    Times ``ADVERSARIAL[name]`` repeated ``SMALL`` and ``SMALL * growth``
+    times. ``linear`` tells whether the large input stayed within the margin.
+    """
+    unit = ADVERSARIAL[name]
+    small = best_seconds(unit * SMALL, engine)
+    large = best_seconds(unit * SMALL * growth, engine)
+    return {
+        "key": f"{engine}/{name}",
+        "small_us": small * 1e6,
+        "large_us": large * 1e6,
+        "ratio": large / small,
+        "linear": large < max(small, 1e-4) * growth * MARGIN,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--engine", action="append", choices=ENGINES)
+    parser.add_argument("--growth", type=int, default=GROWTH)
+    args = parser.parse_args(argv)
+
+    failed = False
+    print(f"{'input':<32}{'small us':>12}{'large us':>12}{'ratio':>8}")
+    for engine in args.engine or ENGINES:
+        for name in sorted(ADVERSARIAL):
+            r = measure_scaling(name, engine, args.growth)
+            mark = "" if r["linear"] else "  NONLINEAR"
+            print(
+                f"{r['key']:<32}{r['small_us']:>12.0f}{r['large_us']:>12.0f}"
+                f"{r['ratio']:>8.1f}{mark}"
+            )
+            failed = failed or not r["linear"]
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""
+Load generator for the local formatting server.
+
+    python -m benchmarks.load                          # start a server in-process
+    python -m benchmarks.load --port 8080 -c 64        # load a running server
+
+Opens ``--connections`` keep-alive clients that send the corpus replies to
+``/format`` as fast as the server answers, and reports throughput, latency
+percentiles, rejected requests and the mean batch size the server formed.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from itertools import cycle
+
+from benchmarks.run import load_corpus, percentile
+from chatgpt_md_converter.server import FormatClient, FormatServer
+
+
+async def generate_load(texts: list, requests: int, connections: int, **address):
+    """
+    Sends ``requests`` texts over ``connections`` clients and returns the
+    sorted latencies in seconds, the number of 503 answers and the total time.
+    """
+    texts = cycle(texts)
+    remaining = requests
+    latencies = []
+    rejected = 0
+
+    async def client():
+        nonlocal remaining, rejected
+        async with FormatClient(**address) as format_client:
+            while remaining > 0:
+                remaining -= 1
+                payload = {"text": next(texts)}
+                start = time.perf_counter()
+                status, _ = await format_client.request("POST", "/format", payload)
+                latencies.append(time.perf_counter() - start)
+                if status == 503:
+                    rejected += 1
+                elif status != 200:
+                    raise RuntimeError(f"Server answered {status}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(connections)))
+    seconds = time.perf_counter() - start
+    latencies.sort()
+    return latencies, rejected, seconds
+
+
+async def run_load(requests=2000, connections=32, workers=None, **address):
+    """
+    Runs the load against ``address`` (``port`` and ``host``, or ``path``),
+    or against a server started in this process when none is given.
+    """
+    texts = list(load_corpus().values())
+    if address:
+        latencies, rejected, seconds = await generate_load(
+            texts, requests, connections, **address
+        )
+        async with FormatClient(**address) as client:
+            stats = await client.health()
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "formatter.sock")
+            async with FormatServer(workers=workers) as server:
+                await server.start(path=path)
+                latencies, rejected, seconds = await generate_load(
+                    texts, requests, connections, path=path
+                )
+                stats = server.stats()
+    return {
+        "requests": len(latencies),
+        "rejected": rejected,
+        "requests_per_sec": len(latencies) / seconds,
+        "p50_ms": percentile(latencies, 0.5) * 1e3,
+        "p99_ms": percentile(latencies, 0.99) * 1e3,
+        "mean_batch_size": stats["mean_batch_size"],
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int)
+    parser.add_argument("--unix", help="Unix domain socket of a running server")
+    parser.add_argument("-n", "--requests", type=int, default=2000)
+    parser.add_argument("-c", "--connections", type=int, default=32)
+    parser.add_argument("-j", "--workers", type=int, help="in-process server workers")
+    args = parser.parse_args(argv)
+
+    address = {}
+    if args.unix is not None:
+        address = {"path": args.unix}
+    elif args.port is not None:
+        address = {"host": args.host, "port": args.port}
+    result = asyncio.run(
+        run_load(args.requests, args.connections, args.workers, **address)
+    )
+    for key, value in result.items():
+        print(f"{key:<18}{value:>12.2f}" if isinstance(value, float) else f"{key:<18}{value:>12}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+"""
+Peak memory benchmark for `telegram_format` over the checked-in corpus.
+
+    python -m benchmarks.memory                 # 1 MiB inputs
+    python -m benchmarks.memory --size 65536
+
+Each corpus file is repeated to the given input sizes and converted once per
+mode while `tracemalloc` records the allocations. The runner reports the peak
+number of bytes allocated during the conversion (including the result) per
+byte of UTF-8 input, for both engines and the low-memory mode.
+"""
+
+import argparse
+import sys
+import tracemalloc
+
+from benchmarks.run import load_corpus, scale
+from chatgpt_md_converter.telegram_formatter import telegram_format
+
+MODES = {
+    "regex": {"engine": "regex"},
+    "tokenizer": {"engine": "tokenizer"},
+    "low_memory": {"engine": "regex", "low_memory": True},
+}
+SIZES = (1024 * 1024,)
+
+
+def measure_peak(func, text: str) -> int:
+    """
+    Returns the peak number of bytes allocated while ``func(text)`` runs.
+    """
+    # Warm up, so that caches filled on the first call are not counted
+    func(text[:1024])
+    tracemalloc.start()
+    try:
+        func(text)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_memory_benchmarks(modes=tuple(MODES), sizes=SIZES):
+    results = []
+    for name, text in load_corpus().items():
+        for size in sizes:
+            sample = scale(text, size)
+            input_bytes = len(sample.encode("utf-8"))
+            for mode in modes:
+                options = MODES[mode]
+                peak = measure_peak(lambda t: telegram_format(t, **options), sample)
+                results.append(
+                    {
+                        "key": f"{mode}/{name}/{size}",
+                        "peak_bytes": peak,
+                        "peak_per_byte": peak / input_bytes,
+                    }
+                )
+    return results
+
+
+def print_results(results: list) -> None:
+    print(f"{'benchmark':<38}{'peak KiB':>12}{'per byte':>10}")
+    for r in results:
+        print(f"{r['key']:<38}{r['peak_bytes'] / 1024:>12.0f}{r['peak_per_byte']:>10.2f}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--mode", action="append", choices=tuple(MODES))
+    parser.add_argument("--size", action="append", type=int)
+    args = parser.parse_args(argv)
+
+    print_results(run_memory_benchmarks(args.mode or tuple(MODES), args.size or SIZES))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
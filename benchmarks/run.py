@@ -0,0 +1,177 @@
+"""
+Throughput and latency benchmarks for `telegram_format` over the checked-in
+corpus of LLM-style replies.
+
+    python -m benchmarks.run                    # run and compare to baseline.json
+    python -m benchmarks.run --save-baseline    # record a new baseline
+
+Each corpus file is repeated to several input sizes. For every engine, corpus
+and size the runner reports ops/sec, p50/p99 latency and cost per input byte,
+and exits with status 1 when the cost per byte regressed by more than the
+tolerance against the saved baseline. The baseline holds the cost per byte in
+units of a calibration loop of regex and string work timed next to every
+benchmark, not in nanoseconds, so that it can be compared on other machines.
+"""
+
+import argparse
+import json
+import re
+import sys
+import time
+from pathlib import Path
+
+from chatgpt_md_converter.telegram_formatter import ENGINES, telegram_format
+
+CORPUS_DIR = Path(__file__).parent / "corpus"
+BASELINE_PATH = Path(__file__).parent / "baseline.json"
+SIZES = (1024, 4096, 16384)
+
+# Work of the kind a conversion does, timed to express costs in its units
+_CALIBRATION_TEXT = "Some **bold** text, <tags> & [a link](http://x.io).\n" * 320
+_CALIBRATION_PATTERN = re.compile(r"\*\*(.*?)\*\*")
+
+
+def load_corpus() -> dict:
+    return {path.stem: path.read_text("utf-8") for path in sorted(CORPUS_DIR.glob("*.md"))}
+
+
+def scale(text: str, size: int) -> str:
+    """
+    Repeats ``text`` (separated by blank lines) and cuts it to ``size`` characters.
+    """
+    copies = size // (len(text) + 2) + 1
+    return "\n\n".join([text] * copies)[:size]
+
+
+def percentile(timings: list, fraction: float) -> int:
+    return timings[min(len(timings) - 1, int(fraction * len(timings)))]
+
+
+def measure(func, text: str, min_time: float, max_runs: int) -> list:
+    """
+    Calls ``func(text)`` until ``min_time`` seconds have passed (at least three
+    times, at most ``max_runs``) and returns the sorted timings in nanoseconds.
+    """
+    timings = []
+    deadline = time.perf_counter() + min_time
+    while len(timings) < 3 or (
+        len(timings) < max_runs and time.perf_counter() < deadline
+    ):
+        start = time.perf_counter_ns()
+        func(text)
+        timings.append(time.perf_counter_ns() - start)
+    timings.sort()
+    return timings
+
+
+def _calibration_work(text: str) -> str:
+    text = text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+    text = _CALIBRATION_PATTERN.sub(r"<b>\1</b>", text)
+    return "\n".join(line.strip() for line in text.split("\n"))
+
+
+def calibrate(min_time=0.2, max_runs=2000) -> float:
+    """
+    Returns the median cost per byte, in nanoseconds, of the calibration work:
+    HTML escaping, one regex substitution and a split and join of the lines.
+    """
+    timings = measure(_calibration_work, _CALIBRATION_TEXT, min_time, max_runs)
+    return percentile(timings, 0.5) / len(_CALIBRATION_TEXT)
+
+
+def run_benchmarks(engines=ENGINES, sizes=SIZES, min_time=0.2, max_runs=2000):
+    results = []
+    for name, text in load_corpus().items():
+        for size in sizes:
+            sample = scale(text, size)
+            for engine in engines:
+                timings = measure(
+                    lambda t: telegram_format(t, engine=engine),
+                    sample,
+                    min_time,
+                    max_runs,
+                )
+                # Timed next to each benchmark, so that load changing during
+                # the run affects both alike
+                unit = calibrate(min_time / 4, max_runs)
+                mean = sum(timings) / len(timings)
+                ns_per_byte = percentile(timings, 0.5) / len(sample)
+                results.append(
+                    {
+                        "key": f"{engine}/{name}/{size}",
+                        "runs": len(timings),
+                        "ops_per_sec": 1e9 / mean,
+                        "p50_us": percentile(timings, 0.5) / 1e3,
+                        "p99_us": percentile(timings, 0.99) / 1e3,
+                        "ns_per_byte": ns_per_byte,
+                        "relative_cost": ns_per_byte / unit,
+                    }
+                )
+    return results
+
+
+def compare(results: list, baseline: dict, tolerance: float) -> list:
+    """
+    Returns the results whose median cost per byte, relative to the
+    calibration, exceeds the baseline by more than ``tolerance`` (a fraction).
+    """
+    regressions = []
+    for result in results:
+        previous = baseline.get(result["key"])
+        if previous and result["relative_cost"] > previous * (1 + tolerance):
+            regressions.append((result, previous))
+    return regressions
+
+
+def print_results(results: list, baseline: dict) -> None:
+    header = f"{'benchmark':<38}{'ops/s':>10}{'p50 us':>10}{'p99 us':>10}"
+    print(header + f"{'ns/byte':>10}{'relative':>10}{'vs base':>9}")
+    for r in results:
+        previous = baseline.get(r["key"])
+        change = f"{r['relative_cost'] / previous - 1:+.0%}" if previous else "-"
+        print(
+            f"{r['key']:<38}{r['ops_per_sec']:>10.0f}{r['p50_us']:>10.1f}"
+            f"{r['p99_us']:>10.1f}{r['ns_per_byte']:>10.1f}"
+            f"{r['relative_cost']:>10.2f}{change:>9}"
+        )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--engine", action="append", choices=ENGINES)
+    parser.add_argument("--size", action="append", type=int)
+    parser.add_argument("--min-time", type=float, default=0.2)
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(
+        engines=args.engine or ENGINES,
+        sizes=args.size or SIZES,
+        min_time=args.min_time,
+    )
+    baseline = {}
+    if args.baseline.exists():
+        baseline = json.loads(args.baseline.read_text())
+
+    print_results(results, baseline)
+
+    if args.save_baseline:
+        baseline.update({r["key"]: round(r["relative_cost"], 3) for r in results})
+        args.baseline.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance)
+    for result, previous in regressions:
+        print(
+            f"REGRESSION {result['key']}: {result['relative_cost']:.2f} "
+            f"calibration units per byte (baseline {previous:.2f})",
+            file=sys.stderr,
+        )
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
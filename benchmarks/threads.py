@@ -0,0 +1,120 @@
+"""
+Thread-scaling benchmark for `telegram_format`.
+
+    python -m benchmarks.threads                # 1, 2, 4, ... up to the CPU count
+    python -m benchmarks.threads --threads 1 --threads 8 --engine tokenizer
+
+Every thread converts the corpus replies in a loop for ``--duration`` seconds,
+all starting together, and checks each result against a conversion made up
+front. The runner reports the total throughput and the speedup over one
+thread. On a build with the GIL the speedup stays near 1; on a free-threaded
+build (e.g. CPython 3.13t) it should grow with the number of cores.
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+from itertools import cycle
+
+from benchmarks.run import load_corpus, scale
+from chatgpt_md_converter.telegram_formatter import ENGINES, telegram_format
+
+
+def gil_enabled() -> bool:
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", None)
+    return True if is_gil_enabled is None else is_gil_enabled()
+
+
+def thread_counts(limit: int) -> list:
+    counts = []
+    count = 1
+    while count < limit:
+        counts.append(count)
+        count *= 2
+    return counts + [limit]
+
+
+def measure_threads(samples: list, threads: int, duration: float, engine: str):
+    """
+    Runs ``threads`` threads converting ``samples`` (pairs of text and
+    expected HTML) for ``duration`` seconds. Returns the number of
+    conversions and the elapsed time; raises AssertionError on a wrong result.
+    """
+    barrier = threading.Barrier(threads + 1)
+    counts = [0] * threads
+    errors = []
+    stop = 0.0
+
+    def worker(index):
+        count = 0
+        pairs = cycle(samples[index % len(samples) :] + samples[: index % len(samples)])
+        barrier.wait()
+        while time.perf_counter() < stop:
+            text, expected = next(pairs)
+            if telegram_format(text, engine=engine) != expected:
+                errors.append(text)
+                return
+            count += 1
+        counts[index] = count
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    start = time.perf_counter()
+    stop = start + duration
+    barrier.wait()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    if errors:
+        raise AssertionError(f"wrong result under {threads} threads")
+    return sum(counts), elapsed
+
+
+def run_thread_benchmarks(thread_counts, engines=ENGINES, size=4096, duration=1.0):
+    texts = [scale(text, size) for text in load_corpus().values()]
+    results = []
+    for engine in engines:
+        samples = [(text, telegram_format(text, engine=engine)) for text in texts]
+        single = None
+        for threads in thread_counts:
+            conversions, elapsed = measure_threads(samples, threads, duration, engine)
+            ops = conversions / elapsed
+            single = single or ops
+            results.append(
+                {
+                    "key": f"{engine}/{threads}",
+                    "threads": threads,
+                    "ops_per_sec": ops,
+                    "speedup": ops / single,
+                }
+            )
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--threads", action="append", type=int)
+    parser.add_argument("--engine", action="append", choices=ENGINES)
+    parser.add_argument("--size", type=int, default=4096)
+    parser.add_argument("--duration", type=float, default=1.0)
+    args = parser.parse_args(argv)
+
+    build = "GIL" if gil_enabled() else "free-threaded"
+    print(f"Python {sys.version.split()[0]} ({build}), {os.cpu_count()} CPUs")
+    results = run_thread_benchmarks(
+        args.threads or thread_counts(os.cpu_count() or 1),
+        args.engine or ENGINES,
+        args.size,
+        args.duration,
+    )
+    print(f"{'benchmark':<20}{'ops/s':>10}{'speedup':>10}")
+    for r in results:
+        print(f"{r['key']:<20}{r['ops_per_sec']:>10.0f}{r['speedup']:>10.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
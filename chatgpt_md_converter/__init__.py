@@ -1,3 +1,35 @@
-from .telegram_formatter import telegram_format
+from .aio import AsyncFormatter, async_telegram_format, async_telegram_format_many
+from .batch import telegram_format_many
+from .cache import FormatCache
+from .document import parse_document, render_html, render_text
+from .entities import telegram_format_entities
+from .helpers import truncate_html
+from .instrumentation import StageTiming, deadline_stats, profile_stages
+from .splitter import telegram_format_chunks
+from .streaming import RenderedText, StreamingFormatter, telegram_format_lines
+from .telegram_formatter import FormattedText, telegram_format
+from .validator import InvalidHTMLError, sanitize_html
 
-__all__ = ["telegram_format"]
+__all__ = [
+    "telegram_format",
+    "telegram_format_many",
+    "telegram_format_chunks",
+    "telegram_format_entities",
+    "telegram_format_lines",
+    "async_telegram_format",
+    "async_telegram_format_many",
+    "AsyncFormatter",
+    "FormatCache",
+    "StreamingFormatter",
+    "parse_document",
+    "render_html",
+    "render_text",
+    "sanitize_html",
+    "truncate_html",
+    "InvalidHTMLError",
+    "FormattedText",
+    "RenderedText",
+    "StageTiming",
+    "deadline_stats",
+    "profile_stages",
+]
@@ -0,0 +1,135 @@
+import asyncio
+import threading
+import weakref
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from .batch import _chunks, _format_chunk
+from .telegram_formatter import telegram_format
+
+
+class AsyncFormatter:
+    """
+    Runs `telegram_format` from asyncio code without blocking the event loop.
+
+    Texts up to ``inline_threshold`` characters are converted directly on the
+    loop; larger ones go to ``executor`` (a shared thread pool by default).
+    At most ``max_concurrency`` conversions per event loop are in the executor
+    at once, so a burst of huge messages cannot flood the pool.
+    """
+
+    def __init__(self, inline_threshold=4096, max_concurrency=4, executor=None):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        self.inline_threshold = inline_threshold
+        self.max_concurrency = max_concurrency
+        self._executor = executor
+        self._owns_executor = executor is None
+        self._lock = threading.Lock()
+        self._limits = weakref.WeakKeyDictionary()
+
+    @property
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_concurrency,
+                    thread_name_prefix="telegram_format",
+                )
+            return self._executor
+
+    def _limit(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        limit = self._limits.get(loop)
+        if limit is None:
+            limit = self._limits[loop] = asyncio.Semaphore(self.max_concurrency)
+        return limit
+
+    async def _offload(self, func, *args):
+        async with self._limit():
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, func, *args)
+
+    async def format(self, text: str, engine: str = "regex") -> str:
+        """
+        Converts one text, offloading it when it is above the threshold.
+        """
+        if len(text) <= self.inline_threshold:
+            return telegram_format(text, engine=engine)
+        return await self._offload(telegram_format, text, engine)
+
+    async def format_many(self, texts, engine: str = "regex", chunk_size: int = 64):
+        """
+        Converts an iterable of texts and returns the results in input order.
+        Texts are grouped in chunks; chunks above the threshold are offloaded.
+        At most ``max_concurrency`` offloaded chunks are outstanding, so the
+        texts are read only that far ahead; if a chunk fails or the call is
+        cancelled, the outstanding ones are cancelled.
+        """
+        results = []
+        # Chunks in input order: converted lists or futures of offloaded ones
+        pending = deque()
+        offloaded = 0
+        try:
+            for chunk in _chunks(texts, chunk_size):
+                if sum(map(len, chunk)) <= self.inline_threshold:
+                    pending.append(_format_chunk(chunk, engine))
+                    # Let other tasks run between inline chunks
+                    await asyncio.sleep(0)
+                    continue
+                while offloaded >= self.max_concurrency:
+                    offloaded -= await _collect_oldest(pending, results)
+                pending.append(
+                    asyncio.ensure_future(self._offload(_format_chunk, chunk, engine))
+                )
+                offloaded += 1
+            while pending:
+                await _collect_oldest(pending, results)
+            return results
+        finally:
+            futures = [chunk for chunk in pending if not isinstance(chunk, list)]
+            for future in futures:
+                future.cancel()
+            if futures:
+                await asyncio.gather(*futures, return_exceptions=True)
+
+    def close(self):
+        """
+        Shuts down the executor if it was created by this formatter.
+        """
+        with self._lock:
+            if self._owns_executor and self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+
+async def _collect_oldest(pending: deque, results: list) -> int:
+    """
+    Adds the results of the oldest pending chunk, waiting for it if it was
+    offloaded. Returns the number of offloaded chunks collected (0 or 1).
+    """
+    chunk = pending[0]
+    if isinstance(chunk, list):
+        pending.popleft()
+        results.extend(chunk)
+        return 0
+    results.extend(await chunk)
+    pending.popleft()
+    return 1
+
+
+default_formatter = AsyncFormatter()
+
+
+async def async_telegram_format(text: str, engine: str = "regex") -> str:
+    """
+    Asyncio counterpart of `telegram_format` using the shared default formatter.
+    """
+    return await default_formatter.format(text, engine=engine)
+
+
+async def async_telegram_format_many(texts, engine: str = "regex") -> list:
+    """
+    Asyncio counterpart of `telegram_format_many` returning a list in input order.
+    """
+    return await default_formatter.format_many(texts, engine=engine)
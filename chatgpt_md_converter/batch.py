@@ -0,0 +1,106 @@
+import os
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
+
+from .telegram_formatter import telegram_format
+
+EXECUTORS = ("inline", "thread", "process")
+
+
+def _format_chunk(texts: list, engine: str, timeout=None) -> list:
+    """
+    Formats one chunk of texts. Module level so process pools can pickle it.
+    """
+    return [telegram_format(text, engine=engine, timeout=timeout) for text in texts]
+
+
+def _chunks(texts, chunk_size: int):
+    iterator = iter(texts)
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def telegram_format_many(
+    texts,
+    executor="inline",
+    workers=None,
+    chunk_size: int = 64,
+    max_pending=None,
+    engine: str = "regex",
+    timeout=None,
+):
+    """
+    Formats an iterable of texts, yielding the results in input order.
+    ``timeout`` is the time budget of each text, see `telegram_format`.
+
+    ``executor`` is ``"inline"``, ``"thread"``, ``"process"`` or an existing
+    `concurrent.futures.Executor`. Texts are submitted in chunks of
+    ``chunk_size`` and at most ``max_pending`` chunks (default: twice the
+    number of workers) are in flight, so memory stays flat on long inputs.
+    """
+    yield from map_chunks(
+        _format_chunk,
+        texts,
+        (engine, timeout),
+        executor=executor,
+        workers=workers,
+        chunk_size=chunk_size,
+        max_pending=max_pending,
+    )
+
+
+def map_chunks(
+    function,
+    items,
+    args=(),
+    executor="inline",
+    workers=None,
+    chunk_size: int = 64,
+    max_pending=None,
+):
+    """
+    Calls ``function(chunk, *args)`` for chunks of ``items`` and yields the
+    elements of the returned lists in input order. The executor and bounds
+    are those of `telegram_format_many`; ``function`` must be picklable to
+    run on a process pool.
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1")
+
+    if executor == "inline":
+        for chunk in _chunks(items, chunk_size):
+            yield from function(chunk, *args)
+        return
+
+    owned = not isinstance(executor, Executor)
+    if executor == "thread":
+        executor = ThreadPoolExecutor(max_workers=workers)
+    elif executor == "process":
+        executor = ProcessPoolExecutor(max_workers=workers)
+    elif owned:
+        raise ValueError(
+            f"Unknown executor {executor!r}, expected one of {EXECUTORS} "
+            "or a concurrent.futures.Executor"
+        )
+
+    if max_pending is None:
+        pool_size = workers or getattr(executor, "_max_workers", None)
+        max_pending = 2 * (pool_size or os.cpu_count() or 1)
+
+    pending = deque()
+    try:
+        for chunk in _chunks(items, chunk_size):
+            if len(pending) >= max_pending:
+                yield from pending.popleft().result()
+            pending.append(executor.submit(function, chunk, *args))
+        while pending:
+            yield from pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+        if owned:
+            executor.shutdown(wait=True)
@@ -0,0 +1,88 @@
+import hashlib
+import sys
+import threading
+from collections import OrderedDict
+
+
+def content_key(text: str, engine: str) -> bytes:
+    """
+    Returns a 128-bit digest identifying ``text`` converted with ``engine``.
+    """
+    digest = hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16)
+    digest.update(engine.encode())
+    return digest.digest()
+
+
+class FormatCache:
+    """
+    Bounded LRU cache of `telegram_format` results, keyed by a content hash so
+    the input strings themselves are not kept alive.
+
+    The cache holds at most ``max_entries`` results and at most ``max_bytes``
+    bytes of result strings; least recently used results are evicted first.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 16 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: bytes):
+        """
+        Returns the cached result for ``key`` or None, counting a hit or miss.
+        """
+        with self._lock:
+            result = self._entries.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, key: bytes, result: str) -> None:
+        """
+        Stores ``result``, evicting least recently used entries over the limits.
+        """
+        size = sys.getsizeof(result)
+        if size > self.max_bytes or self.max_entries < 1:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= sys.getsizeof(previous)
+            self._entries[key] = result
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= sys.getsizeof(evicted)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """
+        Drops all entries; counters are kept.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        """
+        Returns the counters and current size, e.g. for a metrics exporter.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
@@ -0,0 +1,294 @@
+"""
+Converts stored markdown replies in bulk.
+
+    python -m chatgpt_md_converter replies.jsonl -o converted.jsonl
+    python -m chatgpt_md_converter --field choices.0.message.content < dump.jsonl
+    python -m chatgpt_md_converter --format text reply.md > reply.html
+
+JSONL input is read line by line; the string at ``--field`` (a dotted path,
+numbers index lists) is converted and written back, or to ``--output-field``.
+Lines that are not valid records, including lines that are not valid UTF-8,
+are written unchanged and counted as errors. In text mode every input is one
+markdown document, converted whole with ``--engine`` and ``--timeout``, or
+with ``--low-memory`` a batch of paragraphs at a time as it is read. Inputs
+are read and written in order, with the work spread over ``--workers``
+processes. Throughput and error counts are printed to stderr at the end.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from itertools import chain
+
+from .batch import map_chunks
+from .streaming import telegram_format_lines
+from .telegram_formatter import ENGINES, telegram_format
+
+
+def parse_field(spec: str) -> list:
+    """
+    Splits a dotted field path such as ``choices.0.message.content``.
+    """
+    path = spec.split(".")
+    if not all(path):
+        raise ValueError(f"Invalid field path {spec!r}")
+    return path
+
+
+def _check_utf8(text: str) -> int:
+    """
+    Returns the size in bytes of text read with ``errors="surrogateescape"``.
+    Raises `UnicodeDecodeError` if those bytes are not valid UTF-8.
+    """
+    data = text.encode("utf-8", "surrogateescape")
+    data.decode("utf-8")
+    return len(data)
+
+
+def _child(container, key: str):
+    if isinstance(container, list):
+        return container[int(key)]
+    return container[key]
+
+
+def _convert_record(
+    line: str, field: list, output_field: list, engine, timeout, low_memory
+):
+    record = json.loads(line)
+    text = record
+    for key in field:
+        text = _child(text, key)
+    if not isinstance(text, str):
+        raise TypeError(f"{'.'.join(field)} is {type(text).__name__}, not a string")
+
+    parent = record
+    for key in output_field[:-1]:
+        parent = _child(parent, key)
+    key = output_field[-1]
+    if isinstance(parent, list):
+        key = int(key)
+    parent[key] = telegram_format(
+        text, engine=engine, timeout=timeout, low_memory=low_memory
+    )
+    return json.dumps(record, ensure_ascii=False)
+
+
+# Results are (output, error, size) triples. ``size`` is the input size in
+# bytes of a record, or None for output that does not complete a record.
+
+
+def _convert_records(
+    lines: list, field: list, output_field: list, engine, timeout, low_memory
+):
+    """
+    Converts one chunk of JSONL lines. Module level so process pools can
+    pickle it.
+    """
+    results = []
+    for line in lines:
+        content = line.rstrip("\r\n")
+        if not content.strip():
+            results.append((content + "\n", None, None))
+            continue
+        size = len(content.encode("utf-8", "surrogateescape"))
+        try:
+            _check_utf8(content)
+            output = _convert_record(
+                content, field, output_field, engine, timeout, low_memory
+            )
+            results.append((output + "\n", None, size))
+        except (ValueError, TypeError, KeyError, IndexError) as error:
+            error = f"{type(error).__name__}: {error}"
+            results.append((content + "\n", error, size))
+    return results
+
+
+def _format_document(source, engine, timeout, low_memory) -> str:
+    if low_memory:
+        return "".join(telegram_format_lines(source))
+    return telegram_format(source.read(), engine=engine, timeout=timeout)
+
+
+def _convert_documents(paths: list, separator: str, engine, timeout, low_memory):
+    """
+    Converts whole markdown files, one per chunk on a process pool.
+    """
+    results = []
+    for path in paths:
+        try:
+            with open(path, encoding="utf-8") as source:
+                html = _format_document(source, engine, timeout, low_memory)
+            results.append((html + separator, None, os.path.getsize(path)))
+        except (OSError, ValueError) as error:
+            results.append(("", f"{path}: {error}", 0))
+    return results
+
+
+def _reconfigure(stream):
+    # Bytes that are not UTF-8 are read as lone surrogates, which are written
+    # back as the same bytes
+    if hasattr(stream, "reconfigure"):
+        stream.reconfigure(encoding="utf-8", errors="surrogateescape")
+
+
+@contextmanager
+def _open_input(path: str):
+    if path == "-":
+        yield sys.stdin
+    else:
+        with open(path, encoding="utf-8", errors="surrogateescape") as source:
+            yield source
+
+
+def _read_lines(paths):
+    for path in paths:
+        with _open_input(path) as source:
+            yield from source
+
+
+def _stream_document(source, separator: str):
+    """
+    Converts one document from an open file in this process, passing its
+    fragments on as soon as they are converted.
+    """
+    size = 0
+
+    def lines():
+        nonlocal size
+        for line in source:
+            size += _check_utf8(line)
+            yield line
+
+    try:
+        for fragment in telegram_format_lines(lines()):
+            yield fragment, None, None
+    except ValueError as error:
+        yield separator, f"stdin: {error}", size
+        return
+    yield separator, None, size
+
+
+def _read_document(source, separator: str, engine, timeout):
+    """
+    Converts one document from an open file in this process, read whole.
+    """
+    text = source.read()
+    try:
+        size = _check_utf8(text)
+    except ValueError as error:
+        size = len(text.encode("utf-8", "surrogateescape"))
+        return "", f"stdin: {error}", size
+    html = telegram_format(text, engine=engine, timeout=timeout)
+    return html + separator, None, size
+
+
+def _text_results(paths, args, executor):
+    """
+    Yields the results for text inputs in order. Files are converted in the
+    worker processes, stdin in this one, streamed with ``--low-memory``.
+    """
+    files = []
+    for path in chain(paths, [None]):
+        if path not in ("-", None):
+            files.append(path)
+            continue
+        if files:
+            yield from map_chunks(
+                _convert_documents,
+                files,
+                (args.separator, args.engine, args.timeout, args.low_memory),
+                executor=executor,
+                workers=args.workers,
+                chunk_size=1,
+            )
+            files = []
+        if path == "-" and args.low_memory:
+            yield from _stream_document(sys.stdin, args.separator)
+        elif path == "-":
+            yield _read_document(sys.stdin, args.separator, args.engine, args.timeout)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m chatgpt_md_converter",
+        description=__doc__.strip().splitlines()[0],
+    )
+    parser.add_argument("inputs", nargs="*", default=["-"], help="files, - for stdin")
+    parser.add_argument("-o", "--output", default="-", help="output file")
+    parser.add_argument("--format", choices=("jsonl", "text"), default="jsonl")
+    parser.add_argument("--field", default="text", help="dotted path of the text")
+    parser.add_argument("--output-field", help="where to store the HTML")
+    parser.add_argument("--separator", default="\n", help="between text documents")
+    parser.add_argument("--engine", choices=ENGINES, default="regex")
+    parser.add_argument("--timeout", type=float, help="time budget per record")
+    parser.add_argument(
+        "--low-memory", action="store_true", help="convert records in batches"
+    )
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=256)
+    parser.add_argument("-q", "--quiet", action="store_true", help="no stats")
+    args = parser.parse_args(argv)
+
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.low_memory and (args.engine != "regex" or args.timeout is not None):
+        parser.error("--low-memory needs the regex engine and no --timeout")
+    try:
+        field = parse_field(args.field)
+        output_field = parse_field(args.output_field or args.field)
+    except ValueError as error:
+        parser.error(str(error))
+    executor = "inline" if args.workers == 1 else "process"
+    _reconfigure(sys.stdin)
+
+    if args.format == "jsonl":
+        results = map_chunks(
+            _convert_records,
+            _read_lines(args.inputs),
+            (field, output_field, args.engine, args.timeout, args.low_memory),
+            executor=executor,
+            workers=args.workers,
+            chunk_size=args.chunk_size,
+        )
+    else:
+        results = _text_results(args.inputs, args, executor)
+
+    start = time.perf_counter()
+    records = errors = size = 0
+    if args.output == "-":
+        output = sys.stdout
+        _reconfigure(output)
+    else:
+        output = open(args.output, "w", encoding="utf-8", errors="surrogateescape")
+    try:
+        for text, error, length in results:
+            output.write(text)
+            if length is None:
+                continue
+            records += 1
+            size += length
+            if error is not None:
+                errors += 1
+                if not args.quiet:
+                    print(f"error in record {records}: {error}", file=sys.stderr)
+    except OSError as error:
+        print(error, file=sys.stderr)
+        return 2
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        else:
+            output.flush()
+
+    seconds = time.perf_counter() - start
+    if not args.quiet:
+        print(
+            f"{records} records, {errors} errors, {size / 1e6:.1f} MB in "
+            f"{seconds:.2f} s ({records / seconds if seconds else 0:.0f} records/s, "
+            f"{size / 1e6 / seconds if seconds else 0:.1f} MB/s)",
+            file=sys.stderr,
+        )
+    return 1 if errors else 0
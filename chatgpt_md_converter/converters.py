@@ -1,4 +1,13 @@
 import re
+from bisect import bisect_left
+from types import MappingProxyType
+
+from .instrumentation import DEADLINE_CHECK_INTERVAL, check_deadline
+
+# Headings and list items, matched line by line by both engines
+HEADING_PATTERN = re.compile(r"^(#{1,6})\s+(.+)$", re.MULTILINE)
+# The indentation does not span lines, so blank lines are not rescanned
+LIST_PATTERN = re.compile(r"^([^\S\n]*)[\-\*]\s+(.+)$", re.MULTILINE)
 
 
 def convert_html_chars(text: str) -> str:
@@ -11,17 +20,353 @@ def convert_html_chars(text: str) -> str:
     return text
 
 
+def _is_word(char: str) -> bool:
+    # Same as the regex class \w for str patterns
+    return char.isalnum() or char == "_"
+
+
+def _is_ascii_alnum(char: str) -> bool:
+    return char.isascii() and char.isalnum()
+
+
+def _word_boundary_open(before: str, after: str) -> bool:
+    return not (before and _is_word(before))
+
+
+def _word_boundary_close(before: str, after: str) -> bool:
+    return not (after and _is_word(after))
+
+
+def _italic_open(before: str, after: str) -> bool:
+    return not (before and _is_ascii_alnum(before)) and bool(after) and not after.isspace()
+
+
+def _italic_close(before: str, after: str) -> bool:
+    return not (before and before.isspace()) and not (after and _is_ascii_alnum(after))
+
+
+def _anywhere(before: str, after: str) -> bool:
+    return True
+
+
+# marker -> (opening rule, closing rule, pairs stay on one line), as the
+# emphasis passes of the regex pipeline apply them
+MARKER_RULES = MappingProxyType(
+    {
+        "***": (_anywhere, _anywhere, True),
+        "___": (_anywhere, _anywhere, True),
+        "**": (_word_boundary_open, _word_boundary_close, False),
+        "__": (_word_boundary_open, _word_boundary_close, False),
+        "~~": (_word_boundary_open, _word_boundary_close, False),
+        "||": (_word_boundary_open, _word_boundary_close, False),
+        "*": (_italic_open, _italic_close, False),
+        "_": (_word_boundary_open, _word_boundary_close, False),
+    }
+)
+
+
+def pair_delimiters(
+    text: str, md_tag: str, can_open, can_close, single_line=False, deadline=None
+):
+    r"""
+    Pairs occurrences of ``md_tag`` the way a lazy pattern like
+    ``(?<!\w)\*\*(.*?)\*\*(?!\w)`` matches them, in linear time: each
+    occurrence is classified once as a possible opener and/or closer from the
+    characters around it ("" at the text boundaries), then every opener takes
+    the first closer after it. With ``single_line`` a pair may not span lines.
+    Raises `DeadlineExceeded` once ``deadline`` has passed.
+
+    Returns a list of (opening position, closing position) pairs.
+    """
+    size = len(md_tag)
+    length = len(text)
+    openers = []
+    closers = []
+    position = text.find(md_tag)
+    found = 0
+    while position != -1:
+        found += 1
+        if not found % DEADLINE_CHECK_INTERVAL:
+            check_deadline(deadline)
+        before = text[position - 1] if position else ""
+        after = text[position + size] if position + size < length else ""
+        if can_open(before, after):
+            openers.append(position)
+        if can_close(before, after):
+            closers.append(position)
+        # Occurrences may overlap, e.g. "**" is found twice in "***"
+        position = text.find(md_tag, position + 1)
+
+    pairs = []
+    resume = 0
+    closer = 0
+    line_end = -1
+    check_deadline(deadline)
+    for opener in openers:
+        if opener < resume:
+            continue
+        while closer < len(closers) and closers[closer] < opener + size:
+            closer += 1
+        if closer == len(closers):
+            # Later openers have even fewer closers to choose from
+            break
+        if single_line:
+            if line_end < opener:
+                line_end = text.find("\n", opener)
+                if line_end == -1:
+                    line_end = length
+            if closers[closer] + size > line_end:
+                continue
+        pairs.append((opener, closers[closer]))
+        resume = closers[closer] + size
+    return pairs
+
+
+def replace_pairs(text: str, pairs, size: int, opening: str, closing: str):
+    """
+    Replaces the delimiters of length ``size`` found by `pair_delimiters` with
+    the given tags, returning the new text and the number of pairs.
+    """
+    if not pairs:
+        return text, 0
+    parts = []
+    position = 0
+    for start, end in pairs:
+        parts.append(text[position:start])
+        parts.append(opening)
+        parts.append(text[start + size : end])
+        parts.append(closing)
+        position = end + size
+    parts.append(text[position:])
+    return "".join(parts), len(pairs)
+
+
+def convert_tag(out_text: str, md_tag: str, html_tag: str, deadline=None):
+    """
+    Like `split_by_tag`, but also returns the number of replacements.
+    """
+    pairs = pair_delimiters(
+        out_text,
+        md_tag,
+        _word_boundary_open,
+        _word_boundary_close,
+        deadline=deadline,
+    )
+    # Only the tag name goes into the closing tag, e.g. for the tg-spoiler span
+    closing_tag = html_tag.split(" ", 1)[0]
+    return replace_pairs(
+        out_text, pairs, len(md_tag), f"<{html_tag}>", f"</{closing_tag}>"
+    )
+
+
 def split_by_tag(out_text: str, md_tag: str, html_tag: str) -> str:
     """
     Splits the text by markdown tag and replaces it with the specified HTML tag.
     """
-    tag_pattern = re.compile(
-        r"(?<!\w){}(.*?){}(?!\w)".format(re.escape(md_tag), re.escape(md_tag)),
-        re.DOTALL,
+    return convert_tag(out_text, md_tag, html_tag)[0]
+
+
+def convert_line_tag(
+    out_text: str, md_tag: str, opening: str, closing: str, deadline=None
+):
+    """
+    Replaces ``md_tag``-delimited text within a single line, such as ``***``
+    for bold italic, returning the new text and the number of replacements.
+    """
+    pairs = pair_delimiters(
+        out_text, md_tag, _anywhere, _anywhere, single_line=True, deadline=deadline
     )
+    return replace_pairs(out_text, pairs, len(md_tag), opening, closing)
+
+
+def convert_italic(text: str, deadline=None):
+    """
+    Converts single-asterisk italic that is neither inside a word nor a lone
+    asterisk like in ``2 * 3``, returning the new text and the number of
+    replacements.
+    """
+    pairs = pair_delimiters(text, "*", _italic_open, _italic_close, deadline=deadline)
+    return replace_pairs(text, pairs, 1, "<i>", "</i>")
+
+
+class CharPositions:
+    """
+    Sorted positions of one character in ``text[start:end]``, to find the next
+    one after any index in logarithmic time however often the same stretch of
+    text is searched.
+    """
+
+    __slots__ = ("positions",)
+
+    def __init__(self, text: str, char: str, start: int = 0, end=None):
+        if end is None:
+            end = len(text)
+        find = text.find
+        positions = []
+        position = find(char, start, end)
+        while position != -1:
+            positions.append(position)
+            position = find(char, position + 1, end)
+        self.positions = positions
+
+    def next(self, index: int) -> int:
+        """
+        Returns the first position at or after ``index``, or -1.
+        """
+        found = bisect_left(self.positions, index)
+        if found == len(self.positions):
+            return -1
+        return self.positions[found]
+
+
+# What precedes a "]" on its line inside a link label
+_NO_BRACKETS, _OPEN_BRACKET, _CLOSED_BRACKET = range(3)
+_LINK_EVENTS = re.compile(r"[\[\]\n]")
+
 
-    # Special handling for the tg-spoiler tag
-    if html_tag == 'span class="tg-spoiler"':
-        return tag_pattern.sub(r'<span class="tg-spoiler">\1</span>', out_text)
+class LinkMatcher:
+    r"""
+    Matches ``[label](url)`` links in ``text`` like the backtracking pattern
+    ``\[((?:[^\[\]]|\[.*?\])*)\]\(([^)]+)\)`` does, in linear time overall.
 
-    return tag_pattern.sub(r"<{}>\1</{}>".format(html_tag, html_tag), out_text)
+    Bracketed text inside the label may not span lines, so a "]" can end the
+    label unless an unclosed "[" precedes it on its line, and the label ends
+    at the first such "]" followed by a non-empty ``(url)``. Only
+    ``text[start:end]`` is searched. The scan state at each bracket is
+    memoized, so no stretch of text is scanned twice however many "[" precede it.
+    """
+
+    def __init__(self, text: str, start: int = 0, end=None):
+        if end is None:
+            end = len(text)
+        self.text = text
+        self._positions = [match.start() for match in _LINK_EVENTS.finditer(text, start, end)]
+        self._paren = CharPositions(text, ")", start, end)
+        # (event index, state) -> link found by a scan from there, or None
+        self._links = {}
+
+    def _url(self, label_end: int):
+        if not self.text.startswith("(", label_end + 1):
+            return None
+        url_start = label_end + 2
+        url_end = self._paren.next(url_start)
+        if url_end == -1 or url_end == url_start:
+            return None
+        return label_end, url_start, url_end
+
+    def match(self, start: int):
+        """
+        Matches a link whose label opens with the "[" at ``start``.
+        Returns (label end, url start, url end) or None.
+        """
+        text = self.text
+        positions = self._positions
+        links = self._links
+        index = bisect_left(positions, start + 1)
+        if index < len(positions) and text[positions[index]] == "]":
+            # A label without brackets, by far the most common case
+            return self._url(positions[index])
+        state = _NO_BRACKETS
+        visited = []
+        link = None
+        while index < len(positions):
+            key = (index, state)
+            if key in links:
+                link = links[key]
+                break
+            visited.append(key)
+            char = text[positions[index]]
+            if char == "]":
+                if state != _OPEN_BRACKET:
+                    link = self._url(positions[index])
+                    if link is not None or state == _NO_BRACKETS:
+                        break
+                state = _CLOSED_BRACKET
+            elif char == "[":
+                state = _OPEN_BRACKET
+            elif state == _OPEN_BRACKET:
+                break
+            else:
+                state = _NO_BRACKETS
+            index += 1
+        for key in visited:
+            links[key] = link
+        return link
+
+
+def convert_links(text: str, deadline=None):
+    """
+    Converts Markdown links and images to <a href="">…</a> tags, returning the
+    new text and the number of links. Raises `DeadlineExceeded` once
+    ``deadline`` has passed.
+    """
+    start = text.find("[")
+    if start == -1:
+        return text, 0
+    matcher = LinkMatcher(text)
+    parts = []
+    position = 0
+    count = 0
+    tried = 0
+    while start != -1:
+        tried += 1
+        if not tried % DEADLINE_CHECK_INTERVAL:
+            check_deadline(deadline)
+        link = matcher.match(start)
+        if link is None:
+            start = text.find("[", start + 1)
+            continue
+        label_end, url_start, url_end = link
+        # An image's "!" is dropped along with the brackets
+        begin = start - 1 if start > position and text[start - 1] == "!" else start
+        parts.append(text[position:begin])
+        parts.append(f'<a href="{text[url_start:url_end]}">{text[start + 1:label_end]}</a>')
+        position = url_end + 1
+        count += 1
+        start = text.find("[", position)
+    if not count:
+        return text, 0
+    parts.append(text[position:])
+    return "".join(parts), count
+
+
+def citation_end(text: str, start: int, closing: CharPositions) -> int:
+    """
+    Returns the index after a citation like 【4:0†source】 starting at
+    ``start``, or -1. ``closing`` holds the positions of "】".
+    """
+    close = closing.next(start + 1)
+    if close == -1 or close == start + 1:
+        return -1
+    return close + 1
+
+
+def remove_citations(text: str, deadline=None):
+    """
+    Removes vector storage citations like 【4:0†source】, returning the new
+    text and the number of citations removed.
+    """
+    start = text.find("【")
+    if start == -1:
+        return text, 0
+    closing = CharPositions(text, "】")
+    parts = []
+    position = 0
+    count = 0
+    tried = 0
+    while start != -1:
+        tried += 1
+        if not tried % DEADLINE_CHECK_INTERVAL:
+            check_deadline(deadline)
+        end = citation_end(text, start, closing)
+        if end == -1:
+            start = text.find("【", start + 1)
+            continue
+        parts.append(text[position:start])
+        position = end
+        count += 1
+        start = text.find("【", position)
+    if not count:
+        return text, 0
+    parts.append(text[position:])
+    return "".join(parts), count
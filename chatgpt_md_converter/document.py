@@ -0,0 +1,244 @@
+import re
+from types import MappingProxyType
+
+from .extractors import PLACEHOLDER_END
+from .tokenizer import Tag, scan_parts
+from .validator import sanitize_html
+
+_PARAGRAPH_BREAK = re.compile(r"\n{2,}")
+_NEWLINES = re.compile(r"\n{3,}")
+
+# Node kinds rendered as a plain pair of HTML tags
+_HTML_TAGS = MappingProxyType(
+    {
+        "bold": ("<b>", "</b>"),
+        "italic": ("<i>", "</i>"),
+        "underline": ("<u>", "</u>"),
+        "strikethrough": ("<s>", "</s>"),
+        "spoiler": ('<span class="tg-spoiler">', "</span>"),
+        "code": ("<code>", "</code>"),
+        "heading": ("<b>", "</b>"),
+        "blockquote": ("<blockquote>", "</blockquote>"),
+        "expandable_blockquote": ("<blockquote expandable>", "</blockquote>"),
+    }
+)
+
+
+class Node:
+    """
+    Element of the document tree built by `parse_document`.
+
+    ``kind`` is ``"document"``, ``"paragraph"``, ``"heading"`` (attrs:
+    level), ``"list_item"`` (attrs: indent), ``"blockquote"``,
+    ``"expandable_blockquote"``, ``"pre"`` (attrs: language, if given),
+    ``"code"``, ``"text_link"`` (attrs: url) or one of the emphasis kinds
+    ``"bold"``, ``"italic"``, ``"underline"``, ``"strikethrough"`` and
+    ``"spoiler"``, named like the Telegram entity types. ``children`` holds
+    nodes and plain (unescaped) strings; ``attrs`` is a dict or None.
+    """
+
+    __slots__ = ("kind", "children", "attrs")
+
+    def __init__(self, kind: str, attrs=None):
+        self.kind = kind
+        self.children = []
+        self.attrs = attrs
+
+    def __repr__(self):
+        attrs = f", {self.attrs!r}" if self.attrs else ""
+        return f"Node({self.kind!r}{attrs}, {self.children!r})"
+
+    def __eq__(self, other):
+        if not isinstance(other, Node):
+            return NotImplemented
+        return (
+            self.kind == other.kind
+            and self.attrs == other.attrs
+            and self.children == other.children
+        )
+
+    @property
+    def text(self) -> str:
+        """
+        The text of the node without markup or bullets.
+        """
+        pieces = []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, str):
+                pieces.append(node)
+            else:
+                stack.extend(reversed(node.children))
+        return "".join(pieces)
+
+
+def _opened(tag: Tag) -> list:
+    """
+    Returns (kind, attrs) of the nodes a tag opens, outermost first. The
+    attrs are copied: the tags of the scanner's tables are shared.
+    """
+    if tag.kind is not None:
+        return [(tag.kind, dict(tag.attrs) if tag.attrs else None)]
+    return [(entity, tag.extra or None) for entity in tag.entities]
+
+
+def parse_document(text: str) -> Node:
+    """
+    Parses markdown once into a tree of `Node` objects that the renderers
+    walk, e.g. `render_html` and `render_text`.
+
+    The text is scanned like ``telegram_format(text, engine="tokenizer")``.
+    Top-level text is split into paragraphs at blank lines; a blank line
+    inside a node (code, or emphasis spanning paragraphs) stays in it.
+    Overlapping markup is split so that nodes nest, and a link is never
+    put inside another link: its label stays text of the outer one.
+    """
+    document = Node("document")
+    paragraph = Node("paragraph")
+    document.children.append(paragraph)
+    stack = [paragraph]
+    # Top-level text is collected until the next tag to find paragraph breaks
+    pending = []
+    # Nodes reopened after overlapping markup closed around them
+    continued = set()
+    # Links opened inside an open link, which are kept as text
+    nested_links = 0
+
+    def flush():
+        nonlocal paragraph
+        pieces = _PARAGRAPH_BREAK.split("".join(pending))
+        pending.clear()
+        if pieces[0]:
+            paragraph.children.append(pieces[0])
+        for piece in pieces[1:]:
+            paragraph = Node("paragraph")
+            document.children.append(paragraph)
+            if piece:
+                paragraph.children.append(piece)
+        stack[0] = paragraph
+
+    def close(kind):
+        for index in range(len(stack) - 1, 0, -1):
+            if stack[index].kind == kind:
+                break
+        else:
+            return
+        inner = stack[index + 1 :]
+        node = stack[index]
+        del stack[index:]
+        if id(node) in continued and not node.children:
+            stack[-1].children.pop()
+        for node in inner:
+            if node.kind == "list_item":
+                # Only the bullet marks a list item; the rest of the line
+                # continues outside of it
+                continue
+            node = Node(node.kind, node.attrs)
+            continued.add(id(node))
+            stack[-1].children.append(node)
+            stack.append(node)
+
+    for part in scan_parts(text, escape=False):
+        if not isinstance(part, Tag) or not (part.entities or part.kind):
+            if len(stack) == 1:
+                pending.append(part)
+            elif part:
+                stack[-1].children.append(part)
+            continue
+        if "text_link" in part.entities and (
+            nested_links
+            or (not part.closing and any(n.kind == "text_link" for n in stack))
+        ):
+            nested_links += -1 if part.closing else 1
+            continue
+        if pending:
+            flush()
+        if part.closing:
+            for kind in reversed([part.kind] if part.kind else part.entities):
+                close(kind)
+            continue
+        # A list item tag is the bullet; it is rendering, not content
+        for kind, attrs in _opened(part):
+            node = Node(kind, attrs)
+            stack[-1].children.append(node)
+            stack.append(node)
+
+    if pending:
+        flush()
+    return document
+
+
+def _escape(text: str) -> str:
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def _render_html(node: Node, out: list):
+    for child in node.children:
+        if isinstance(child, str):
+            out.append(_escape(child))
+            continue
+        kind = child.kind
+        if kind == "text_link":
+            opening = '<a href="{}">'.format(_escape(child.attrs["url"]))
+            closing = "</a>"
+        elif kind == "pre":
+            language = child.attrs and child.attrs.get("language")
+            if language:
+                opening = '<pre><code class="language-{}">'.format(language)
+            else:
+                opening = "<pre><code>"
+            closing = "</code></pre>"
+        elif kind == "list_item":
+            opening = child.attrs["indent"] + "• "
+            closing = ""
+        else:
+            opening, closing = _HTML_TAGS[kind]
+        out.append(opening)
+        _render_html(child, out)
+        out.append(closing)
+
+
+# Stands in for the tags around a node in plain text, so that newlines on
+# both sides of a tag are not collapsed together, as in the HTML
+_BOUNDARY = PLACEHOLDER_END
+
+
+def _render_text(node: Node, out: list):
+    for child in node.children:
+        if isinstance(child, str):
+            out.append(child)
+        elif child.kind == "list_item":
+            out.append(child.attrs["indent"] + "• ")
+            _render_text(child, out)
+        else:
+            out.append(_BOUNDARY)
+            _render_text(child, out)
+            out.append(_BOUNDARY)
+
+
+def _render_blocks(document: Node, render) -> str:
+    paragraphs = []
+    for paragraph in document.children:
+        out = []
+        render(paragraph, out)
+        paragraphs.append("".join(out))
+    return _NEWLINES.sub("\n\n", "\n\n".join(paragraphs))
+
+
+def render_html(document: Node) -> str:
+    """
+    Renders a document tree as Telegram HTML. The HTML is checked with
+    `sanitize_html` like every conversion, so it is always accepted; for
+    markup that nests it equals ``telegram_format(text, engine="tokenizer")``.
+    """
+    return sanitize_html(_render_blocks(document, _render_html))[0].strip()
+
+
+def render_text(document: Node) -> str:
+    """
+    Renders a document tree as plain text: markup is dropped, list bullets
+    and the text of code and links are kept. Equals the text returned by
+    `telegram_format_entities`.
+    """
+    return _render_blocks(document, _render_text).replace(_BOUNDARY, "").strip()
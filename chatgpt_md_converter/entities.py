@@ -0,0 +1,106 @@
+import re
+
+from .helpers import utf16_length
+from .tokenizer import Tag, scan_parts
+from .validator import _MAX_REOPEN
+
+_NEWLINES = re.compile(r"\n{3,}")
+
+
+def telegram_format_entities(text: str):
+    """
+    Converts markdown to plain text plus a list of Telegram MessageEntity
+    dicts, ready to be sent as ``text`` and ``entities`` without a parse mode.
+
+    Offsets and lengths are in UTF-16 code units and are counted while the
+    parts produced by the tokenizer are joined, so the output is never
+    re-scanned. The result matches ``telegram_format(text, engine="tokenizer")``:
+    entities that would overlap are split so they nest, and entities left
+    open end with the text, as `sanitize_html` repairs the tags.
+    """
+    pieces = []
+    entities = []
+    # Entities waiting for their closing tag: (type, index in ``entities``)
+    pending = []
+    # Links opened inside an open link, which Telegram does not allow; their
+    # label stays part of the outer link like `sanitize_html` keeps it
+    nested_links = 0
+    offset = 0
+    # Newlines at the end of the text so far, to collapse runs like the HTML does
+    newlines = 0
+
+    for part in scan_parts(text, escape=False):
+        if isinstance(part, Tag) and part.entities:
+            newlines = 0
+            if "text_link" in part.entities and (
+                nested_links or (not part.closing and _open_link(pending))
+            ):
+                nested_links += -1 if part.closing else 1
+                continue
+            if part.closing:
+                for entity_type in reversed(part.entities):
+                    _close(entity_type, pending, entities, offset)
+            else:
+                for entity_type in part.entities:
+                    pending.append((entity_type, len(entities)))
+                    entity = {"type": entity_type, "offset": offset, "length": 0}
+                    entity.update(part.extra)
+                    entities.append(entity)
+            continue
+
+        if not part:
+            continue
+        if "\n" in part:
+            leading = len(part) - len(part.lstrip("\n"))
+            if leading and newlines + leading >= 3:
+                part = "\n" * max(0, 2 - newlines) + part[leading:]
+            part = _NEWLINES.sub("\n\n", part)
+            content = part.rstrip("\n")
+            if content:
+                newlines = len(part) - len(content)
+            else:
+                newlines += len(part)
+        else:
+            newlines = 0
+        pieces.append(part)
+        offset += utf16_length(part)
+
+    for _, index in pending:
+        entities[index]["length"] = offset - entities[index]["offset"]
+
+    plain_text = "".join(pieces)
+    stripped = plain_text.strip()
+    if len(stripped) != len(plain_text):
+        shift = utf16_length(plain_text[: len(plain_text) - len(plain_text.lstrip())])
+        offset = shift + utf16_length(stripped)
+        for entity in entities:
+            end = min(entity["offset"] + entity["length"], offset)
+            entity["offset"] = max(entity["offset"], shift)
+            entity["length"] = end - entity["offset"]
+            entity["offset"] -= shift
+
+    return stripped, [entity for entity in entities if entity["length"] > 0]
+
+
+def _close(entity_type: str, pending: list, entities: list, offset: int):
+    """
+    Ends the innermost open entity of ``entity_type`` at ``offset``. Entities
+    opened inside it that are still open end there too and are continued by
+    new ones, the way `sanitize_html` closes and reopens overlapping tags.
+    """
+    for position in range(len(pending) - 1, -1, -1):
+        if pending[position][0] == entity_type:
+            break
+    else:
+        return
+    inner = pending[position + 1 :]
+    for _, index in pending[position:]:
+        entities[index]["length"] = offset - entities[index]["offset"]
+    del pending[position:]
+    for entity_type, index in inner[-_MAX_REOPEN:]:
+        pending.append((entity_type, len(entities)))
+        entities.append(dict(entities[index], offset=offset, length=0))
+
+
+def _open_link(pending) -> bool:
+    return any(entity_type == "text_link" for entity_type, _ in pending)
@@ -1,4 +1,5 @@
 import re
+from types import MappingProxyType
 
 
 def ensure_closing_delimiters(text: str) -> str:
@@ -15,47 +16,164 @@ def ensure_closing_delimiters(text: str) -> str:
     return text
 
 
+# Placeholders are built from Unicode private-use characters: no markup rule
+# matches them and, unlike ASCII placeholders, they are not word characters.
+INLINE_CODE_MARK = "\ue000"
+CODE_BLOCK_MARK = "\ue001"
+PLACEHOLDER_END = "\ue002"
+# Stand-ins for the blockquote tags until the text around them is escaped,
+# so that tags typed by the user are never mistaken for generated ones.
+BLOCKQUOTE_MARK = "\ue003"
+EXPANDABLE_BLOCKQUOTE_MARK = "\ue004"
+BLOCKQUOTE_END = "\ue005"
+_BLOCKQUOTE_TAGS = (
+    (BLOCKQUOTE_MARK, "<blockquote>"),
+    (EXPANDABLE_BLOCKQUOTE_MARK, "<blockquote expandable>"),
+    (BLOCKQUOTE_END, "</blockquote>"),
+)
+_PLACEHOLDER_CHARS = MappingProxyType(
+    dict.fromkeys(
+        map(
+            ord,
+            INLINE_CODE_MARK
+            + CODE_BLOCK_MARK
+            + PLACEHOLDER_END
+            + BLOCKQUOTE_MARK
+            + EXPANDABLE_BLOCKQUOTE_MARK
+            + BLOCKQUOTE_END,
+        )
+    )
+)
+_BLOCKQUOTE_CHARS = MappingProxyType(
+    dict.fromkeys(
+        map(ord, BLOCKQUOTE_MARK + EXPANDABLE_BLOCKQUOTE_MARK + BLOCKQUOTE_END)
+    )
+)
+_PLACEHOLDER_PATTERN = re.compile("([\ue000\ue001])(\\d+)\ue002")
+
+_CODE_BLOCK_PATTERN = re.compile(r"```(\w*)?(\n)?(.*?)```", flags=re.DOTALL)
+_INLINE_CODE_PATTERN = re.compile(r"`([^`]+)`")
+
+
+def make_placeholder(mark: str, index: int) -> str:
+    return f"{mark}{index}{PLACEHOLDER_END}"
+
+
+def remove_placeholder_chars(text: str) -> str:
+    """
+    Drops the placeholder characters from user text so they cannot collide
+    with the placeholders created during conversion.
+    """
+    if any(chr(char) in text for char in _PLACEHOLDER_CHARS):
+        text = text.translate(_PLACEHOLDER_CHARS)
+    return text
+
+
+def escape_html(text: str) -> str:
+    """
+    Escapes HTML reserved symbols in the text outside code and turns
+    blockquote marks into their tags, so generated tags are produced once and
+    never escaped. Each replace only
+    copies the text when the symbol occurs; a translation table with
+    multi-character replacements is much slower in CPython.
+    """
+    text = text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+    for mark, tag in _BLOCKQUOTE_TAGS:
+        if mark in text:
+            text = text.replace(mark, tag)
+    return text
+
+
+def escape_code(text: str) -> str:
+    """
+    Escapes HTML reserved symbols in code. Blockquote marks that ended up in
+    the code, e.g. of a quote ending inside a code span, are dropped rather
+    than turned into tags, since code is shown as it is.
+    """
+    text = text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+    if any(mark in text for mark, _ in _BLOCKQUOTE_TAGS):
+        text = text.translate(_BLOCKQUOTE_CHARS)
+    return text
+
+
+def extract_code_blocks(text: str):
+    """
+    Extracts code blocks from the text and replaces them with placeholders,
+    after ensuring closing delimiters for unmatched blocks. Returns the
+    modified text and the list of (language, code) pairs.
+    """
+    text = ensure_closing_delimiters(text)
+    code_blocks = []
+
+    def replacer(match):
+        placeholder = make_placeholder(CODE_BLOCK_MARK, len(code_blocks))
+        code_blocks.append((match.group(1) or "", match.group(3)))
+        return placeholder
+
+    return _CODE_BLOCK_PATTERN.sub(replacer, text), code_blocks
+
+
+def code_block_html(language: str, code: str) -> str:
+    """
+    Returns the HTML of a code block with its content escaped.
+    """
+    if not language:
+        return f"<pre><code>{escape_code(code)}</code></pre>"
+    return f'<pre><code class="language-{language}">{escape_code(code)}</code></pre>'
+
+
 def extract_and_convert_code_blocks(text: str):
     """
     Extracts code blocks from the text, converting them to HTML <pre><code> format,
     and replaces them with placeholders. Also ensures closing delimiters for unmatched blocks.
+    The text is rebuilt from the match spans in a single pass.
+    Returns the modified text and the list of HTML code blocks.
     """
-    text = ensure_closing_delimiters(text)
-    placeholders = []
-    code_blocks = {}
+    text, code_blocks = extract_code_blocks(text)
+    return text, [code_block_html(language, code) for language, code in code_blocks]
+
+
+def extract_inline_code_snippets(text: str):
+    """
+    Extracts inline code (single-backtick content) from the text,
+    replacing it with placeholders, returning modified text and a list of code texts.
+    This ensures characters like '*' or '_' inside inline code won't be interpreted as Markdown.
+    """
+    code_snippets = []
 
     def replacer(match):
-        language = match.group(1) if match.group(1) else ""
-        code_content = match.group(3)
+        placeholder = make_placeholder(INLINE_CODE_MARK, len(code_snippets))
+        code_snippets.append(match.group(1))
+        return placeholder
 
-        # Properly escape HTML entities in code content
-        escaped_content = (
-            code_content.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
-        )
+    new_text = _INLINE_CODE_PATTERN.sub(replacer, text)
+    return new_text, code_snippets
 
-        placeholder = f"CODEBLOCKPLACEHOLDER{len(placeholders)}"
-        placeholders.append(placeholder)
-        if not language:
-            html_code_block = f"<pre><code>{escaped_content}</code></pre>"
-        else:
-            html_code_block = (
-                f'<pre><code class="language-{language}">{escaped_content}</code></pre>'
-            )
-        return (placeholder, html_code_block)
 
-    modified_text = text
-    for match in re.finditer(r"```(\w*)?(\n)?(.*?)```", text, flags=re.DOTALL):
-        placeholder, html_code_block = replacer(match)
-        code_blocks[placeholder] = html_code_block
-        modified_text = modified_text.replace(match.group(0), placeholder, 1)
+def reinsert_placeholders(text: str, code_snippets: list, code_blocks: list) -> str:
+    """
+    Replaces inline code and code block placeholders in a single pass.
+    Inline code snippets are HTML-escaped and wrapped in <code> tags.
+    """
+    if not code_snippets and not code_blocks:
+        return text
 
-    return modified_text, code_blocks
+    def replacer(match):
+        index = int(match.group(2))
+        if match.group(1) == CODE_BLOCK_MARK:
+            return code_blocks[index]
+        snippet = code_snippets[index]
+        escaped_snippet = escape_code(snippet)
+        if CODE_BLOCK_MARK in escaped_snippet:
+            # Inline code that swallowed a code block placeholder
+            escaped_snippet = _PLACEHOLDER_PATTERN.sub(replacer, escaped_snippet)
+        return f"<code>{escaped_snippet}</code>"
 
+    return _PLACEHOLDER_PATTERN.sub(replacer, text)
 
-def reinsert_code_blocks(text: str, code_blocks: dict) -> str:
+
+def reinsert_code_blocks(text: str, code_blocks: list) -> str:
     """
     Reinserts HTML code blocks into the text, replacing their placeholders.
     """
-    for placeholder, html_code_block in code_blocks.items():
-        text = text.replace(placeholder, html_code_block, 1)
-    return text
+    return reinsert_placeholders(text, [], code_blocks)
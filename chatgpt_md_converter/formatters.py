@@ -1,57 +1,94 @@
-def combine_blockquotes(text: str) -> str:
+import re
+
+from .instrumentation import check_deadline
+
+_EQUATION_PATTERN = re.compile(r"(\d+)\s*\*\s*(\d+)")
+# Characters of text split into lines at a time, between deadline checks
+_WINDOW_SIZE = 16 * 1024
+
+
+def _line_windows(text: str, deadline=None):
+    """
+    Yields the lines of ``text``, without their line breaks, in lists that
+    cover about ``_WINDOW_SIZE`` characters each. ``deadline`` is checked
+    before each list, so splitting a huge text never runs long unchecked.
+    """
+    start = 0
+    while True:
+        check_deadline(deadline)
+        end = text.find("\n", start + _WINDOW_SIZE)
+        if end == -1:
+            yield text[start:].split("\n")
+            return
+        yield text[start:end].split("\n")
+        start = end + 1
+
+
+def combine_blockquotes(
+    text: str,
+    opening: str = "<blockquote>",
+    expandable_opening: str = "<blockquote expandable>",
+    closing: str = "</blockquote>",
+    deadline=None,
+) -> str:
     """
     Combines multiline blockquotes into a single blockquote while keeping the \n characters.
     Supports both regular blockquotes (>) and expandable blockquotes (**>).
+    Lines inside a ``` code block are code, e.g. a ">>>" prompt, unless the
+    block was opened inside the blockquote they continue.
+    The tags can be replaced, e.g. by marks that survive HTML escaping.
+    Raises `DeadlineExceeded` once ``deadline`` has passed.
     """
-    lines = text.split("\n")
     combined_lines = []
     blockquote_lines = []
     in_blockquote = False
     is_expandable = False
+    # Code blocks pair "```" occurrences in order and none spans a line break,
+    # so a line starts inside one when an odd number of them precede it
+    in_code = False
 
-    for line in lines:
-        if line.startswith("**>"):
-            # Expandable blockquote
-            in_blockquote = True
-            is_expandable = True
-            blockquote_lines.append(line[3:].strip())
-        elif line.startswith(">"):
-            # Regular blockquote
-            if not in_blockquote:
-                # This is a new blockquote
+    for lines in _line_windows(text, deadline):
+        for line in lines:
+            # Lines of a code block opened outside a blockquote are never quoted
+            quotable = in_blockquote or not in_code
+            if line.count("```") % 2:
+                in_code = not in_code
+            if quotable and line.startswith("**>"):
+                # Expandable blockquote
                 in_blockquote = True
-                is_expandable = False
-            blockquote_lines.append(line[1:].strip())
-        else:
-            if in_blockquote:
-                # End of blockquote, combine the lines
-                if is_expandable:
-                    combined_lines.append(
-                        "<blockquote expandable>"
-                        + "\n".join(blockquote_lines)
-                        + "</blockquote>"
-                    )
-                else:
-                    combined_lines.append(
-                        "<blockquote>" + "\n".join(blockquote_lines) + "</blockquote>"
-                    )
-                blockquote_lines = []
-                in_blockquote = False
-                is_expandable = False
-            combined_lines.append(line)
+                is_expandable = True
+                blockquote_lines.append(line[3:].strip())
+            elif quotable and line.startswith(">"):
+                # Regular blockquote
+                if not in_blockquote:
+                    # This is a new blockquote
+                    in_blockquote = True
+                    is_expandable = False
+                blockquote_lines.append(line[1:].strip())
+            else:
+                if in_blockquote:
+                    # End of blockquote, combine the lines
+                    if is_expandable:
+                        combined_lines.append(
+                            expandable_opening + "\n".join(blockquote_lines) + closing
+                        )
+                    else:
+                        combined_lines.append(
+                            opening + "\n".join(blockquote_lines) + closing
+                        )
+                    blockquote_lines = []
+                    in_blockquote = False
+                    is_expandable = False
+                combined_lines.append(line)
 
     if in_blockquote:
         # Handle the case where the file ends with a blockquote
         if is_expandable:
             combined_lines.append(
-                "<blockquote expandable>"
-                + "\n".join(blockquote_lines)
-                + "</blockquote>"
+                expandable_opening + "\n".join(blockquote_lines) + closing
             )
         else:
-            combined_lines.append(
-                "<blockquote>" + "\n".join(blockquote_lines) + "</blockquote>"
-            )
+            combined_lines.append(opening + "\n".join(blockquote_lines) + closing)
 
     return "\n".join(combined_lines)
 
@@ -62,7 +99,4 @@ def fix_asterisk_equations(text: str) -> str:
     to avoid accidental italic formatting.
     e.g. '6*8' -> '6×8', '6 * 8' -> '6×8'
     """
-    import re
-
-    eq_pattern = re.compile(r"(\d+)\s*\*\s*(\d+)")
-    return eq_pattern.sub(r"\1×\2", text)
+    return _EQUATION_PATTERN.sub(r"\1×\2", text)
@@ -0,0 +1,225 @@
+"""
+Differential fuzzer: compares engines against the frozen reference pipeline.
+
+    python -m chatgpt_md_converter.fuzz                          # all engines
+    python -m chatgpt_md_converter.fuzz --engine tokenizer --runs 100000 --seed 7
+
+Random markdown in the style of LLM replies (nested emphasis, code fences,
+blockquotes, lists, links, citations, HTML characters) is converted by
+`reference_format` and by each engine. The first input on which an engine
+differs is shrunk to a minimal one that still differs, and reported together
+with both outputs. The exit status is 1 when any engine differed.
+"""
+
+import argparse
+import random
+import sys
+from collections import namedtuple
+
+from .reference import reference_format
+from .streaming import StreamingFormatter, split_lines, telegram_format_lines
+from .telegram_formatter import telegram_format
+
+
+def _streamed(text: str, step: int = 7) -> str:
+    """
+    Feeds ``text`` in deltas of ``step`` characters and renders after each.
+    Every render must equal the reference for the text fed so far; the first
+    one that does not is returned, described, so that it is reported.
+    """
+    formatter = StreamingFormatter()
+    html = formatter.render()
+    for end in range(step, len(text) + step, step):
+        formatter.feed(text[end - step : end])
+        html = formatter.render()
+        if end < len(text) and html != reference_format(text[:end]):
+            return f"{html!r} after the first {end} characters"
+    return html
+
+
+# Alternative implementations of ``telegram_format(text)``, by name
+ENGINES = {
+    "regex": telegram_format,
+    "tokenizer": lambda text: telegram_format(text, engine="tokenizer"),
+    "low_memory": lambda text: telegram_format(text, low_memory=True),
+    "streaming": _streamed,
+    "lines": lambda text: "".join(telegram_format_lines(split_lines(text))),
+}
+
+Mismatch = namedtuple("Mismatch", ["engine", "text", "expected", "actual", "original"])
+Mismatch.__doc__ = """
+An input on which an engine differs from the reference. ``text`` is the
+shrunk input, ``expected`` and ``actual`` the two outputs for it (``actual``
+describes the exception if the engine raised) and ``original`` the input that
+was generated.
+"""
+
+_WORDS = ("the", "value", "snake_case", "x*y", "2 * 3", "6*8", "a_b_c", "файл", "🤔")
+_WORDS += ("C++", "1.5", "https://example.com", "foo()", "it's", "—", "**", "_", "~")
+_MARKERS = ("**", "__", "~~", "||", "*", "_", "***", "___")
+_LANGUAGES = ("", "python", "bash", "c++", "js")
+_SPECIAL = ("<", ">", "&", "<b>", "</span>", "&amp;", '"', "`", "[", "]", "(", ")")
+
+
+def _inline(rng: random.Random, depth: int) -> str:
+    pieces = []
+    for _ in range(rng.randint(1, 6)):
+        roll = rng.random()
+        if roll < 0.45 or depth > 2:
+            pieces.append(rng.choice(_WORDS))
+        elif roll < 0.65:
+            marker = rng.choice(_MARKERS)
+            closing = marker if rng.random() < 0.85 else rng.choice(_MARKERS)
+            pieces.append(marker + _inline(rng, depth + 1) + closing)
+        elif roll < 0.72:
+            pieces.append("`" + rng.choice(_WORDS + _MARKERS + _SPECIAL) + "`")
+        elif roll < 0.82:
+            label = _inline(rng, depth + 1)
+            if rng.random() < 0.2:
+                label = f"[{label}]"
+            image = "!" if rng.random() < 0.2 else ""
+            url = rng.choice(("http://x.io/?a=1&b=2", "https://e.com/(a)", "u"))
+            pieces.append(f"{image}[{label}]({url})")
+        elif roll < 0.88:
+            pieces.append(rng.choice(("【4:0†source】", "【", "】", "【】")))
+        else:
+            pieces.append(rng.choice(_SPECIAL))
+    separator = rng.choice((" ", " ", " ", "", "\n"))
+    return separator.join(pieces)
+
+
+def _block(rng: random.Random) -> str:
+    roll = rng.random()
+    if roll < 0.4:
+        return _inline(rng, 0)
+    if roll < 0.5:
+        return "#" * rng.randint(1, 7) + " " + _inline(rng, 1)
+    if roll < 0.65:
+        items = []
+        for _ in range(rng.randint(1, 4)):
+            indent = " " * rng.choice((0, 0, 2, 4))
+            items.append(indent + rng.choice("-*") + " " + _inline(rng, 1))
+        return "\n".join(items)
+    if roll < 0.8:
+        fence = "```" + rng.choice(_LANGUAGES) + "\n"
+        # Quote markers in code, e.g. of a Python prompt, are code
+        code = "\n".join(
+            rng.choice(("", "", "", ">>> ", "> ")) + _inline(rng, 1)
+            for _ in range(rng.randint(1, 3))
+        )
+        return fence + code + ("\n```" if rng.random() < 0.85 else "")
+    lines = []
+    for _ in range(rng.randint(1, 3)):
+        prefix = rng.choice((">", "> ", ">", "**>"))
+        # A quoted code fence
+        line = "```" if rng.random() < 0.1 else _inline(rng, 1)
+        lines.append(prefix + line)
+    return "\n".join(lines)
+
+
+def generate_markdown(rng: random.Random, blocks: int = 6) -> str:
+    """
+    Returns random markdown of up to ``blocks`` blocks, mostly well formed
+    but with stray and mismatched markers mixed in.
+    """
+    parts = []
+    for _ in range(rng.randint(1, blocks)):
+        parts.append(_block(rng))
+        parts.append(rng.choice(("\n\n", "\n\n", "\n", "\n\n\n", "\n  \n")))
+    return "".join(parts)
+
+
+def _differs(engine, text: str):
+    """
+    Returns (expected, actual) if ``engine`` differs from the reference on
+    ``text``, otherwise None.
+    """
+    expected = reference_format(text)
+    try:
+        actual = engine(text)
+    except Exception as error:
+        return expected, f"{type(error).__name__}: {error}"
+    if actual != expected:
+        return expected, actual
+    return None
+
+
+def shrink(text: str, fails) -> str:
+    """
+    Returns a minimal part of ``text`` for which ``fails(text)`` still holds:
+    lines, then ever smaller runs of characters are removed while it does.
+    """
+    for separator in ("\n", ""):
+        units = text.split("\n") if separator else list(text)
+        size = max(len(units) // 2, 1)
+        while True:
+            start = 0
+            removed = False
+            while start < len(units):
+                candidate = units[:start] + units[start + size :]
+                if fails(separator.join(candidate)):
+                    units = candidate
+                    removed = True
+                else:
+                    start += size
+            if size == 1 and not removed:
+                break
+            if not removed:
+                size //= 2
+        text = separator.join(units)
+    return text
+
+
+def fuzz(engines=None, runs: int = 1000, seed: int = 0, blocks: int = 6) -> list:
+    """
+    Compares ``engines`` (names in `ENGINES`, all by default, or a dict of
+    name -> function) against the reference on ``runs`` generated inputs and
+    returns a `Mismatch` for the first input on which each engine differed,
+    shrunk.
+    """
+    if isinstance(engines, dict):
+        candidates = dict(engines)
+    else:
+        candidates = {name: ENGINES[name] for name in engines or ENGINES}
+    rng = random.Random(seed)
+    mismatches = []
+    for _ in range(runs):
+        if not candidates:
+            break
+        text = generate_markdown(rng, blocks)
+        for name, engine in list(candidates.items()):
+            if _differs(engine, text) is None:
+                continue
+            minimal = shrink(text, lambda t: _differs(engine, t) is not None)
+            expected, actual = _differs(engine, minimal)
+            mismatches.append(Mismatch(name, minimal, expected, actual, text))
+            del candidates[name]
+    return mismatches
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m chatgpt_md_converter.fuzz",
+        description=__doc__.strip().splitlines()[0],
+    )
+    parser.add_argument("--engine", action="append", choices=tuple(ENGINES))
+    parser.add_argument("--runs", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--blocks", type=int, default=6, help="per input, at most")
+    args = parser.parse_args(argv)
+
+    engines = args.engine or tuple(ENGINES)
+    mismatches = fuzz(engines, args.runs, args.seed, args.blocks)
+    failed = {mismatch.engine for mismatch in mismatches}
+    for name in engines:
+        if name not in failed:
+            print(f"{name}: no differences in {args.runs} inputs")
+    for mismatch in mismatches:
+        print(f"{mismatch.engine}: differs on {mismatch.text!r}")
+        print(f"  reference: {mismatch.expected!r}")
+        print(f"  {mismatch.engine}: {mismatch.actual!r}")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,27 +1,150 @@
-def remove_blockquote_escaping(output: str) -> str:
+import re
+from itertools import chain
+from types import MappingProxyType
+
+_HTML_TOKEN = re.compile(r'<a href="([^"]*)">|(</a>)|<[^>]*>|&(lt|gt|amp|quot);')
+_ENTITIES = MappingProxyType({"lt": "<", "gt": ">", "amp": "&", "quot": '"'})
+_HTML_ENTITY = re.compile(r"&(lt|gt|amp|quot);")
+_NEWLINES = re.compile(r"\n{3,}")
+# A tag (closing flag, name) or an entity (no groups)
+_MARKUP = re.compile(r"<(/?)([\w\-]+)[^>]*>|&#?\w+;")
+
+
+def utf16_length(text: str) -> int:
+    """
+    Returns the length of ``text`` in UTF-16 code units, as Telegram counts it.
+    """
+    if text.isascii():
+        return len(text)
+    return len(text.encode("utf-16-le")) // 2
+
+
+def utf16_prefix(text: str, units: int) -> int:
+    """
+    Returns the largest index such that ``text[:index]`` fits in ``units``.
+    """
+    if text.isascii() or len(text) == utf16_length(text):
+        return min(units, len(text))
+    for index, char in enumerate(text):
+        units -= 2 if ord(char) > 0xFFFF else 1
+        if units < 0:
+            return index
+    return len(text)
+
+
+def unescape_html(text: str) -> str:
+    """
+    Reverts the escaping of ``&``, ``<``, ``>`` (and ``"``) in HTML text.
+    """
+    return _HTML_ENTITY.sub(lambda match: _ENTITIES[match.group(1)], text)
+
+
+def link_suffix(label: str, url: str) -> str:
     """
-    Removes the escaping from blockquote tags, including expandable blockquotes.
+    Returns what follows a link's label in plain text: the URL in
+    parentheses, unless the label already is the URL.
     """
-    # Regular blockquotes
-    output = output.replace("&lt;blockquote&gt;", "<blockquote>").replace(
-        "&lt;/blockquote&gt;", "</blockquote>"
-    )
+    return "" if label == url else f" ({url})"
+
+
+def html_to_plain_text(html: str) -> str:
+    """
+    Turns Telegram HTML produced by this package into text that can be sent
+    without a parse mode: tags are dropped, entities unescaped and link URLs
+    appended to their labels. One linear pass over the HTML.
+    """
+    pieces = []
+    # (index in ``pieces`` where the label starts, url) of open links
+    links = []
+    position = 0
+    for match in _HTML_TOKEN.finditer(html):
+        pieces.append(html[position : match.start()])
+        position = match.end()
+        url, link_end, entity = match.groups()
+        if entity:
+            pieces.append(_ENTITIES[entity])
+        elif url is not None:
+            links.append((len(pieces), unescape_html(url)))
+        elif link_end and links:
+            start, url = links.pop()
+            pieces.append(link_suffix("".join(pieces[start:]), url))
+    pieces.append(html[position:])
+    return _NEWLINES.sub("\n\n", "".join(pieces)).strip()
+
 
-    # Expandable blockquotes
-    output = output.replace(
-        "&lt;blockquote expandable&gt;", "<blockquote expandable>"
-    ).replace("&lt;/blockquote&gt;", "</blockquote>")
+def truncate_html(html: str, max_length: int, ellipsis: str = "…") -> str:
+    """
+    Cuts Telegram HTML so that its text, measured like Telegram does (UTF-16
+    code units after entity parsing), is at most ``max_length`` including
+    ``ellipsis``. The cut never falls inside a tag or an entity; the tags
+    open at the cut are closed and the ellipsis appended after them. HTML
+    that fits is returned unchanged.
+    """
+    return truncate_fragments((html,), max_length, ellipsis)
+
+
+def truncate_fragments(fragments, max_length: int, ellipsis: str = "…") -> str:
+    """
+    Like `truncate_html` for HTML given as consecutive fragments that do not
+    split tags or entities, e.g. from `telegram_format_lines`. Fragments are
+    only consumed until the text is known not to fit.
+    """
+    budget = max_length - utf16_length(ellipsis)
+    if budget < 0:
+        raise ValueError("max_length is shorter than the ellipsis")
+    consumed = []
+    # Open tags as (name, opening tag)
+    stack = []
+    length = 0
+    # (fragments consumed, index in the last one, open tags) of the last
+    # point where the text and the ellipsis still fit
+    cut = None
+    for html in fragments:
+        consumed.append(html)
+        position = 0
+        for match in chain(_MARKUP.finditer(html), (None,)):
+            end = len(html) if match is None else match.start()
+            units = utf16_length(html[position:end])
+            if cut is None and length + units > budget:
+                index = position + utf16_prefix(html[position:end], budget - length)
+                cut = (len(consumed), index, tuple(stack))
+            length += units
+            if match is None or length > max_length:
+                break
+            position = match.end()
+            closing, name = match.groups()
+            if name is None:
+                # An entity is one character
+                if cut is None and length >= budget:
+                    cut = (len(consumed), match.start(), tuple(stack))
+                length += 1
+            elif not closing:
+                stack.append((name, match.group(0)))
+            elif name in (open_name for open_name, _ in stack):
+                while stack.pop()[0] != name:
+                    pass
+        if length > max_length:
+            break
+    else:
+        return "".join(consumed)
 
-    return output
+    count, index, open_tags = cut
+    head = ("".join(consumed[: count - 1]) + consumed[count - 1][:index]).rstrip()
+    tags = list(open_tags)
+    # Tags opened right before the cut would be left empty
+    while tags and head.endswith(tags[-1][1]):
+        head = head[: -len(tags.pop()[1])].rstrip()
+    return head + "".join(f"</{name}>" for name, _ in reversed(tags)) + ellipsis
 
 
-def remove_spoiler_escaping(output: str) -> str:
+def truncate_text(text: str, max_length: int, ellipsis: str = "…") -> str:
     """
-    Ensures spoiler tags are correctly formatted (rather than being escaped).
+    Cuts plain text to at most ``max_length`` UTF-16 code units including
+    ``ellipsis``, or returns it unchanged if it fits.
     """
-    # Fix any incorrectly escaped spoiler tags
-    output = output.replace(
-        '&lt;span class="tg-spoiler"&gt;', '<span class="tg-spoiler">'
-    )
-    output = output.replace("&lt;/span&gt;", "</span>")
-    return output
+    if utf16_length(text) <= max_length:
+        return text
+    budget = max_length - utf16_length(ellipsis)
+    if budget < 0:
+        raise ValueError("max_length is shorter than the ellipsis")
+    return text[: utf16_prefix(text, budget)].rstrip() + ellipsis
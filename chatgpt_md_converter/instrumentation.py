@@ -0,0 +1,118 @@
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+StageTiming = namedtuple(
+    "StageTiming", ["name", "seconds", "input_size", "output_size", "matches"]
+)
+StageTiming.__doc__ = """
+Timing of one conversion stage. ``matches`` is the number of substitutions,
+placeholders or tokens the stage produced, or None where it is not counted.
+"""
+
+# Receives a StageTiming for every stage run in the current context, or None
+# when instrumentation is disabled.
+stage_hook = ContextVar("stage_hook", default=None)
+
+# Conversions run with a time budget, and how many of them ran out of it
+_deadline_counts = {"timed": 0, "degraded": 0}
+_deadline_lock = threading.Lock()
+
+
+# Loops over the text check the deadline once per this many steps, so that
+# a check costs nothing measurable but no stretch of work goes unchecked
+DEADLINE_CHECK_INTERVAL = 4096
+
+
+class DeadlineExceeded(Exception):
+    """
+    Raised inside a conversion that ran past its deadline.
+    """
+
+
+def check_deadline(deadline) -> None:
+    """
+    Raises `DeadlineExceeded` once ``time.perf_counter()`` passes ``deadline``.
+    """
+    if deadline is not None and time.perf_counter() > deadline:
+        raise DeadlineExceeded
+
+
+def run_stages(stages, output: str, state, deadline=None) -> str:
+    """
+    Applies ``stages`` (pairs of name and ``stage(output, state) -> (output,
+    matches)``) in order, reporting each one to the active hook if there is one.
+    With a ``deadline`` (a `time.perf_counter` value) no further stage starts
+    once it has passed; `DeadlineExceeded` is raised instead.
+    """
+    hook = stage_hook.get()
+    if hook is None:
+        for _, stage in stages:
+            check_deadline(deadline)
+            output = stage(output, state)[0]
+        return output
+
+    for name, stage in stages:
+        check_deadline(deadline)
+        input_size = len(output)
+        start = time.perf_counter()
+        output, matches = stage(output, state)
+        seconds = time.perf_counter() - start
+        hook(StageTiming(name, seconds, input_size, len(output), matches))
+    return output
+
+
+@contextmanager
+def profile_stages(callback=None):
+    """
+    Records the stages of every conversion run inside the ``with`` block.
+
+        with profile_stages() as stages:
+            telegram_format(text)
+        slowest = max(stages, key=lambda stage: stage.seconds)
+
+    ``callback`` is additionally called with each `StageTiming`, e.g. to
+    forward it to a tracer. Outside the block conversions are not timed.
+    """
+    stages = []
+
+    def hook(timing):
+        stages.append(timing)
+        if callback is not None:
+            callback(timing)
+
+    token = stage_hook.set(hook)
+    try:
+        yield stages
+    finally:
+        stage_hook.reset(token)
+
+
+def record_deadline(degraded: bool) -> None:
+    """
+    Counts a conversion that ran with a time budget.
+    """
+    with _deadline_lock:
+        _deadline_counts["timed"] += 1
+        if degraded:
+            _deadline_counts["degraded"] += 1
+
+
+def deadline_stats(reset: bool = False) -> dict:
+    """
+    Returns how many conversions in this process ran with a ``timeout``, how
+    many of them degraded to escaped plain text and the degradation rate, e.g.
+    for a metrics exporter. ``reset`` starts a new counting period.
+    """
+    with _deadline_lock:
+        timed = _deadline_counts["timed"]
+        degraded = _deadline_counts["degraded"]
+        if reset:
+            _deadline_counts["timed"] = _deadline_counts["degraded"] = 0
+    return {
+        "timed": timed,
+        "degraded": degraded,
+        "degradation_rate": degraded / timed if timed else 0.0,
+    }
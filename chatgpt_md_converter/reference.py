@@ -0,0 +1,264 @@
+"""
+Frozen reference implementation of the regex pipeline of `telegram_format`.
+
+Other engines and optimizations of the pipeline are checked against this
+module (see `chatgpt_md_converter.fuzz`), so it must not change with them:
+it imports nothing from the package and spells every pass out as the plain,
+possibly backtracking, regular expression that defines it. It is slow on
+large or hostile input and only meant for testing.
+"""
+
+import re
+
+# Placeholder and blockquote mark characters (private use code points)
+_INLINE_CODE_MARK = "\ue000"
+_CODE_BLOCK_MARK = "\ue001"
+_PLACEHOLDER_END = "\ue002"
+_BLOCKQUOTE_MARK = "\ue003"
+_EXPANDABLE_BLOCKQUOTE_MARK = "\ue004"
+_BLOCKQUOTE_END = "\ue005"
+_MARK_CHARS = re.compile("[\ue000-\ue005]")
+_BLOCKQUOTE_MARK_CHARS = re.compile("[\ue003-\ue005]")
+_PLACEHOLDER = re.compile("([\ue000\ue001])(\\d+)\ue002")
+
+_CODE_BLOCK = re.compile(r"```(\w*)?(\n)?(.*?)```", re.DOTALL)
+_INLINE_CODE = re.compile(r"`([^`]+)`")
+_HEADING = re.compile(r"^(#{1,6})\s+(.+)$", re.MULTILINE)
+_LIST_ITEM = re.compile(r"^(\s*)[\-\*]\s+(.+)$", re.MULTILINE)
+_BOLD_ITALIC = re.compile(r"\*\*\*(.*?)\*\*\*")
+_UNDERLINE_ITALIC = re.compile(r"\_\_\_(.*?)\_\_\_")
+_ITALIC = re.compile(
+    r"(?<![A-Za-z0-9])\*(?=[^\s])(.*?)(?<!\s)\*(?![A-Za-z0-9])", re.DOTALL
+)
+_CITATION = re.compile(r"【[^】]+】")
+_LINK = re.compile(r"(?:!?)\[((?:[^\[\]]|\[.*?\])*)\]\(([^)]+)\)")
+_NEWLINES = re.compile(r"\n{3,}")
+
+# Telegram's tags, for the final repair pass
+_TAG = re.compile(
+    r"<(/?)([a-zA-Z][\w\-]*)([^<>]*)>|[<>]|&(?!#\d+;|#x[0-9a-fA-F]+;|(?:lt|gt|amp|quot);)"
+)
+_SIMPLE_TAGS = ("b", "strong", "i", "em", "u", "ins", "s", "strike", "del")
+_SIMPLE_TAGS += ("tg-spoiler", "pre")
+_NOT_NESTED = ("a", "blockquote", "pre", "code")
+_MAX_REOPEN = 8
+
+
+def _escape(text: str) -> str:
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def _escape_text(text: str) -> str:
+    """
+    Escapes the text and turns the blockquote marks into their tags.
+    """
+    text = _escape(text).replace(_BLOCKQUOTE_MARK, "<blockquote>")
+    text = text.replace(_EXPANDABLE_BLOCKQUOTE_MARK, "<blockquote expandable>")
+    return text.replace(_BLOCKQUOTE_END, "</blockquote>")
+
+
+def _escape_code(text: str) -> str:
+    """
+    Escapes code, dropping the blockquote marks that ended up in it.
+    """
+    return _escape(_BLOCKQUOTE_MARK_CHARS.sub("", text))
+
+
+def _combine_blockquotes(text: str) -> str:
+    lines = []
+    quote = None
+    expandable = False
+    start = 0
+    for line in text.split("\n"):
+        # A line that starts after an odd number of "```" is in a code block,
+        # and only quoted when the block opened inside the quote
+        in_code = text.count("```", 0, start) % 2 == 1
+        start += len(line) + 1
+        if in_code and quote is None:
+            pass
+        elif line.startswith("**>"):
+            quote = quote or []
+            expandable = True
+            quote.append(line[3:].strip())
+            continue
+        elif line.startswith(">"):
+            if quote is None:
+                quote = []
+                expandable = False
+            quote.append(line[1:].strip())
+            continue
+        if quote is not None:
+            mark = _EXPANDABLE_BLOCKQUOTE_MARK if expandable else _BLOCKQUOTE_MARK
+            lines.append(mark + "\n".join(quote) + _BLOCKQUOTE_END)
+            quote = None
+        lines.append(line)
+    if quote is not None:
+        mark = _EXPANDABLE_BLOCKQUOTE_MARK if expandable else _BLOCKQUOTE_MARK
+        lines.append(mark + "\n".join(quote) + _BLOCKQUOTE_END)
+    return "\n".join(lines)
+
+
+def _split_by_tag(text: str, md_tag: str, opening: str, closing: str) -> str:
+    pattern = r"(?<!\w){0}(.*?){0}(?!\w)".format(re.escape(md_tag))
+    return re.sub(
+        pattern, lambda m: opening + m.group(1) + closing, text, flags=re.DOTALL
+    )
+
+
+def _opening_tag(name: str, attributes: str):
+    if not attributes.strip():
+        if name in _SIMPLE_TAGS or name in ("code", "blockquote"):
+            return f"<{name}>"
+        return None
+    if name == "span" and re.fullmatch(r'\s+class="tg-spoiler"\s*', attributes):
+        return '<span class="tg-spoiler">'
+    language = re.fullmatch(r'\s+class="language-[\w\-+#.]*"\s*', attributes)
+    if name == "code" and language:
+        return f"<code {attributes.strip()}>"
+    if name == "blockquote" and re.fullmatch(r"\s+expandable\s*", attributes):
+        return "<blockquote expandable>"
+    href = re.fullmatch(r'\s+href="(.*)"\s*', attributes, re.DOTALL)
+    if name == "a" and href:
+        return '<a href="{}">'.format(href.group(1).replace('"', "&quot;"))
+    return None
+
+
+def _repair(html: str) -> str:
+    """
+    Makes the HTML acceptable to Telegram the way `sanitize_html` does.
+    """
+    pieces = []
+    # Open tags as (name, opening tag, reopened after an overlap)
+    stack = []
+    position = 0
+    changed = False
+
+    def pop():
+        name, tag, reopened = stack.pop()
+        if reopened and pieces[-1] is tag:
+            pieces.pop()
+        else:
+            pieces.append(f"</{name}>")
+
+    for match in _TAG.finditer(html):
+        if match.start() > position:
+            pieces.append(html[position : match.start()])
+        position = match.end()
+        closing, name, attributes = match.groups()
+        if name is None:
+            changed = True
+            pieces.append(_escape(match.group(0)))
+            continue
+        name = name.lower()
+        names = [entry[0] for entry in stack]
+        if closing:
+            if attributes.strip() or name not in names:
+                changed = True
+                continue
+            reopen = []
+            while stack[-1][0] != name:
+                changed = True
+                if len(reopen) < _MAX_REOPEN:
+                    reopen.append(stack[-1])
+                pop()
+            pop()
+            for inner, tag, _ in reversed(reopen):
+                stack.append((inner, tag, True))
+                pieces.append(tag)
+            continue
+        tag = _opening_tag(name, attributes)
+        if tag is None:
+            changed = True
+            pieces.append(_escape(match.group(0)))
+            continue
+        verbatim = names and names[-1] in ("pre", "code")
+        if (name in _NOT_NESTED and name in names) or (
+            verbatim and not (name == "code" and names[-1] == "pre")
+        ):
+            # Dropped, the closing tag then has no opener
+            changed = True
+            continue
+        changed = changed or tag != match.group(0)
+        stack.append((name, tag, False))
+        pieces.append(tag)
+
+    if position < len(html):
+        pieces.append(html[position:])
+    while stack:
+        changed = True
+        pop()
+    return "".join(pieces) if changed else html
+
+
+def reference_format(text: str) -> str:
+    """
+    Converts markdown to Telegram HTML exactly like ``telegram_format(text)``
+    did when this reference was frozen.
+    """
+    # Step 0: Drop placeholder characters typed by the user, combine blockquotes
+    output = _combine_blockquotes(_MARK_CHARS.sub("", text))
+
+    # Step 1: Extract and convert triple-backtick code blocks
+    if output.count("```") % 2:
+        output += "```"
+    if output.count("`") % 2:
+        output += "`"
+    code_blocks = []
+
+    def code_block(match):
+        language, content = match.group(1), _escape_code(match.group(3))
+        if language:
+            code_blocks.append(
+                f'<pre><code class="language-{language}">{content}</code></pre>'
+            )
+        else:
+            code_blocks.append(f"<pre><code>{content}</code></pre>")
+        return f"{_CODE_BLOCK_MARK}{len(code_blocks) - 1}{_PLACEHOLDER_END}"
+
+    output = _CODE_BLOCK.sub(code_block, output)
+
+    # Step 2: Extract inline code
+    snippets = []
+
+    def inline_code(match):
+        snippets.append(match.group(1))
+        return f"{_INLINE_CODE_MARK}{len(snippets) - 1}{_PLACEHOLDER_END}"
+
+    output = _INLINE_CODE.sub(inline_code, output)
+
+    # Step 3: Escape the text and turn the blockquote marks into tags
+    output = _escape_text(output)
+
+    # Headings, then list bullets (before italic, so a leading "*" is a bullet)
+    output = _HEADING.sub(r"<b>\2</b>", output)
+    output = _LIST_ITEM.sub(r"\1• \2", output)
+
+    # Emphasis, in this order
+    output = _BOLD_ITALIC.sub(r"<b><i>\1</i></b>", output)
+    output = _UNDERLINE_ITALIC.sub(r"<u><i>\1</i></u>", output)
+    output = _split_by_tag(output, "**", "<b>", "</b>")
+    output = _split_by_tag(output, "__", "<u>", "</u>")
+    output = _split_by_tag(output, "~~", "<s>", "</s>")
+    output = _split_by_tag(output, "||", '<span class="tg-spoiler">', "</span>")
+    output = _ITALIC.sub(r"<i>\1</i>", output)
+    output = _split_by_tag(output, "_", "<i>", "</i>")
+
+    # Citations like 【4:0†source】 are removed, links and images converted
+    output = _CITATION.sub("", output)
+    output = _LINK.sub(r'<a href="\2">\1</a>', output)
+
+    # Step 4: Reinsert inline code (escaped) and code blocks
+    def placeholder(match):
+        index = int(match.group(2))
+        if match.group(1) == _CODE_BLOCK_MARK:
+            return code_blocks[index]
+        # Inline code may have swallowed a code block placeholder
+        return "<code>{}</code>".format(
+            _PLACEHOLDER.sub(placeholder, _escape_code(snippets[index]))
+        )
+
+    output = _PLACEHOLDER.sub(placeholder, output)
+
+    # Step 5: Repair markup Telegram would reject, then collapse blank lines
+    output = _repair(output)
+    return _NEWLINES.sub("\n\n", output).strip()
@@ -0,0 +1,502 @@
+"""
+Local formatting service for bots that are not written in Python.
+
+    python -m chatgpt_md_converter.server --port 8080 --unix /tmp/formatter.sock
+
+Speaks a small subset of HTTP/1.1 with keep-alive, over TCP and a Unix domain
+socket alike. Every endpoint takes and returns JSON:
+
+    POST /format    {"text": ..., "engine": "regex", "timeout": null,
+                     "plain_text": false}
+                    -> {"html": ..., "degraded": false, "plain_text": ...}
+    POST /chunks    {"text": ..., "limit": 4096} -> {"chunks": [...]}
+    POST /entities  {"text": ...} -> {"text": ..., "entities": [...]}
+    GET  /health    -> {"status": "ok", ...counters}
+
+Concurrent requests are queued and converted in batches on a worker pool, so
+the pool overhead is paid per batch rather than per request. The queue is
+bounded: once it is full, requests are answered with 503 right away.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+from .entities import telegram_format_entities
+from .splitter import TELEGRAM_MESSAGE_LIMIT, telegram_format_chunks
+from .telegram_formatter import telegram_format
+
+EXECUTORS = ("thread", "process")
+
+_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    411: "Length Required",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+
+class HTTPError(Exception):
+    """
+    A request that is answered with an error ``status``.
+    """
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def _text(request: dict) -> str:
+    text = request.get("text")
+    if not isinstance(text, str):
+        raise TypeError("text must be a string")
+    return text
+
+
+def _format(request: dict) -> dict:
+    html = telegram_format(
+        _text(request),
+        engine=request.get("engine", "regex"),
+        timeout=request.get("timeout"),
+        plain_text=bool(request.get("plain_text")),
+    )
+    response = {"html": html, "degraded": getattr(html, "degraded", False)}
+    if request.get("plain_text"):
+        response["plain_text"] = html.plain_text
+    return response
+
+
+def _chunks(request: dict) -> dict:
+    limit = request.get("limit", TELEGRAM_MESSAGE_LIMIT)
+    engine = request.get("engine", "regex")
+    return {"chunks": list(telegram_format_chunks(_text(request), limit, engine=engine))}
+
+
+def _entities(request: dict) -> dict:
+    text, entities = telegram_format_entities(_text(request))
+    return {"text": text, "entities": entities}
+
+
+ENDPOINTS = {"/format": _format, "/chunks": _chunks, "/entities": _entities}
+
+
+def _run_batch(jobs: list) -> list:
+    """
+    Runs one batch of (path, request) jobs, returning (status, response)
+    pairs. A job that fails gets its own error response, 400 for invalid
+    requests and 500 otherwise, and the rest of the batch still runs.
+    Module level so process pools can pickle it.
+    """
+    results = []
+    for path, request in jobs:
+        try:
+            results.append((200, ENDPOINTS[path](request)))
+        except (TypeError, ValueError) as error:
+            results.append((400, {"error": str(error)}))
+        except Exception as error:
+            results.append((500, {"error": f"{type(error).__name__}: {error}"}))
+    return results
+
+
+async def read_request(reader, max_body: int):
+    """
+    Reads one HTTP request, returning (method, target, version, headers,
+    body), or None when the peer closed the connection between requests.
+    """
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError as error:
+        if not error.partial.strip():
+            return None
+        raise HTTPError(400, "Incomplete request")
+    except asyncio.LimitOverrunError:
+        raise HTTPError(413, "Request head too large")
+
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, version = lines[0].split(" ")
+    except ValueError:
+        raise HTTPError(400, "Malformed request line")
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+    body = b""
+    if "content-length" in headers:
+        try:
+            length = int(headers["content-length"])
+        except ValueError:
+            raise HTTPError(400, "Invalid Content-Length")
+        if length > max_body:
+            raise HTTPError(413, f"Body larger than {max_body} bytes")
+        body = await reader.readexactly(length)
+    elif method == "POST":
+        raise HTTPError(411, "Content-Length required")
+    return method, target, version, headers, body
+
+
+def encode_response(status: int, payload: dict, keep_alive: bool) -> bytes:
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    head = (
+        f"HTTP/1.1 {status} {_REASONS[status]}\r\n"
+        "Content-Type: application/json; charset=utf-8\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+    )
+    if status == 503:
+        head += "Retry-After: 1\r\n"
+    return (head + "\r\n").encode("latin-1") + body
+
+
+class FormatServer:
+    """
+    Serves the conversions over HTTP on TCP and/or Unix domain sockets.
+
+    Requests wait in a queue of at most ``max_queue`` entries. A collector
+    takes up to ``max_batch`` of them at once, waiting ``batch_delay``
+    seconds for more to arrive when the queue runs short, and converts them
+    on ``executor`` (``"thread"``, ``"process"`` or a
+    `concurrent.futures.Executor`) with at most ``workers`` batches in flight.
+    """
+
+    def __init__(
+        self,
+        executor="process",
+        workers=None,
+        max_batch: int = 64,
+        batch_delay: float = 0.001,
+        max_queue: int = 1024,
+        max_body: int = 1 << 20,
+    ):
+        if max_batch < 1 or max_queue < 1:
+            raise ValueError("max_batch and max_queue must be at least 1")
+        self.workers = workers or os.cpu_count() or 1
+        self.max_batch = max_batch
+        self.batch_delay = batch_delay
+        self.max_queue = max_queue
+        self.max_body = max_body
+
+        self._owns_executor = not isinstance(executor, Executor)
+        if executor == "thread":
+            executor = ThreadPoolExecutor(max_workers=self.workers)
+        elif executor == "process":
+            executor = ProcessPoolExecutor(max_workers=self.workers)
+        elif self._owns_executor:
+            raise ValueError(
+                f"Unknown executor {executor!r}, expected one of {EXECUTORS} "
+                "or a concurrent.futures.Executor"
+            )
+        self.executor = executor
+
+        self.servers = []
+        self._queue = None
+        self._collector = None
+        # Running batches and the writers of open connections, for close()
+        self._batches = set()
+        self._connections = {}
+        self._started = time.monotonic()
+        self._counts = dict.fromkeys(
+            ("requests", "rejected", "errors", "batches", "batched", "connections"), 0
+        )
+        self._in_flight = 0
+
+    async def start(self, host="127.0.0.1", port=None, path=None):
+        """
+        Starts listening on ``host``:``port`` and/or the Unix socket ``path``.
+        Port 0 picks a free port; see `addresses`.
+        """
+        if port is None and path is None:
+            raise ValueError("Give a port, a Unix socket path or both")
+        if self._queue is None:
+            self._queue = asyncio.Queue(self.max_queue)
+            self._collector = asyncio.ensure_future(self._collect())
+        if port is not None:
+            self.servers.append(await asyncio.start_server(self._handle, host, port))
+        if path is not None:
+            self.servers.append(await asyncio.start_unix_server(self._handle, path))
+        return self
+
+    @property
+    def addresses(self) -> list:
+        return [sock.getsockname() for server in self.servers for sock in server.sockets]
+
+    async def serve_forever(self):
+        await asyncio.gather(*(server.serve_forever() for server in self.servers))
+
+    async def close(self):
+        """
+        Stops listening, answers queued requests with 503, waits for the
+        running batches, closes the connections and shuts the pool down.
+        """
+        for server in self.servers:
+            server.close()
+        self.servers = []
+        if self._collector is not None:
+            self._collector.cancel()
+            self._collector = None
+        if self._queue is not None:
+            while not self._queue.empty():
+                future = self._queue.get_nowait()[2]
+                if not future.done():
+                    future.set_result((503, {"error": "Server is shutting down"}))
+        await asyncio.gather(*self._batches, return_exceptions=True)
+        for writer in self._connections.values():
+            writer.close()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+        if self._owns_executor:
+            self.executor.shutdown(wait=False)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def stats(self) -> dict:
+        counts = dict(self._counts)
+        batched = counts.pop("batched")
+        return {
+            "status": "ok",
+            "uptime_seconds": round(time.monotonic() - self._started, 3),
+            **counts,
+            "mean_batch_size": batched / counts["batches"] if counts["batches"] else 0.0,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "in_flight": self._in_flight,
+            "workers": self.workers,
+        }
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        slots = asyncio.Semaphore(self.workers)
+        while True:
+            await slots.acquire()
+            batch = [await self._queue.get()]
+            self._drain(batch)
+            if len(batch) < self.max_batch and self.batch_delay > 0:
+                await asyncio.sleep(self.batch_delay)
+                self._drain(batch)
+            task = loop.create_task(self._dispatch(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+            task.add_done_callback(lambda _: slots.release())
+
+    def _drain(self, batch: list):
+        while len(batch) < self.max_batch and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+
+    async def _dispatch(self, batch: list):
+        batch = [job for job in batch if not job[2].done()]
+        if not batch:
+            return
+        self._counts["batches"] += 1
+        self._counts["batched"] += len(batch)
+        self._in_flight += len(batch)
+        loop = asyncio.get_running_loop()
+        try:
+            jobs = [(path, request) for path, request, _ in batch]
+            results = await loop.run_in_executor(self.executor, _run_batch, jobs)
+        except Exception as error:
+            results = [(500, {"error": f"{type(error).__name__}: {error}"})] * len(batch)
+        finally:
+            self._in_flight -= len(batch)
+        for (_, _, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def _respond(self, method: str, target: str, body: bytes):
+        path = target.split("?", 1)[0]
+        if path == "/health":
+            if method != "GET":
+                raise HTTPError(405, "Use GET")
+            return 200, self.stats()
+        if path not in ENDPOINTS:
+            raise HTTPError(404, f"No endpoint {path}")
+        if method != "POST":
+            raise HTTPError(405, "Use POST")
+        try:
+            request = json.loads(body)
+        except ValueError as error:
+            raise HTTPError(400, f"Invalid JSON: {error}")
+        if not isinstance(request, dict):
+            raise HTTPError(400, "Expected a JSON object")
+
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((path, request, future))
+        except asyncio.QueueFull:
+            self._counts["rejected"] += 1
+            raise HTTPError(503, "Queue full, retry later")
+        return await future
+
+    async def _handle(self, reader, writer):
+        self._counts["connections"] += 1
+        self._connections[asyncio.current_task()] = writer
+        try:
+            while True:
+                keep_alive = False
+                try:
+                    request = await read_request(reader, self.max_body)
+                    if request is None:
+                        break
+                    method, target, version, headers, body = request
+                    connection = headers.get("connection", "").lower()
+                    keep_alive = connection == "keep-alive" or (
+                        version == "HTTP/1.1" and connection != "close"
+                    )
+                    self._counts["requests"] += 1
+                    status, payload = await self._respond(method, target, body)
+                except HTTPError as error:
+                    status, payload = error.status, {"error": str(error)}
+                    # The rest of a rejected body may still be unread
+                    keep_alive = keep_alive and status not in (400, 411, 413)
+                if status != 200:
+                    self._counts["errors"] += 1
+                writer.write(encode_response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._counts["connections"] -= 1
+            del self._connections[asyncio.current_task()]
+            writer.close()
+
+
+class FormatClient:
+    """
+    Minimal asyncio client for `FormatServer` keeping one keep-alive
+    connection, for tests and load generation. Requests on one client are
+    sent one at a time; open several clients for concurrency.
+    """
+
+    def __init__(self, host="127.0.0.1", port=None, path=None):
+        self.host = host
+        self.port = port
+        self.path = path
+        self._reader = self._writer = None
+        # Created on first use, inside the event loop
+        self._lock = None
+
+    async def _connect(self):
+        if self.path is not None:
+            connection = await asyncio.open_unix_connection(self.path)
+        else:
+            connection = await asyncio.open_connection(self.host, self.port)
+        self._reader, self._writer = connection
+
+    async def request(self, method: str, target: str, payload=None):
+        """
+        Sends one request and returns (status, decoded JSON response).
+        """
+        body = b"" if payload is None else json.dumps(payload).encode("utf-8")
+        head = (
+            f"{method} {target} HTTP/1.1\r\nHost: localhost\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n"
+        )
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._writer is None:
+                await self._connect()
+            try:
+                self._writer.write(head.encode("latin-1") + body)
+                await self._writer.drain()
+                head = await self._reader.readuntil(b"\r\n\r\n")
+            except (ConnectionError, asyncio.IncompleteReadError):
+                await self.close()
+                raise
+            lines = head.decode("latin-1").split("\r\n")
+            status = int(lines[0].split(" ")[1])
+            headers = dict(
+                (name.strip().lower(), value.strip())
+                for name, _, value in (line.partition(":") for line in lines[1:] if line)
+            )
+            response = await self._reader.readexactly(int(headers["content-length"]))
+            if headers.get("connection") == "close":
+                await self.close()
+        return status, json.loads(response)
+
+    async def format(self, text: str, **options) -> str:
+        status, response = await self.request("POST", "/format", {"text": text, **options})
+        if status != 200:
+            raise HTTPError(status, response.get("error", ""))
+        return response["html"]
+
+    async def chunks(self, text: str, **options) -> list:
+        status, response = await self.request("POST", "/chunks", {"text": text, **options})
+        if status != 200:
+            raise HTTPError(status, response.get("error", ""))
+        return response["chunks"]
+
+    async def entities(self, text: str):
+        status, response = await self.request("POST", "/entities", {"text": text})
+        if status != 200:
+            raise HTTPError(status, response.get("error", ""))
+        return response["text"], response["entities"]
+
+    async def health(self) -> dict:
+        return (await self.request("GET", "/health"))[1]
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._reader = self._writer = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m chatgpt_md_converter.server",
+        description=__doc__.strip().splitlines()[0],
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int)
+    parser.add_argument("--unix", help="Unix domain socket path")
+    parser.add_argument("--executor", choices=EXECUTORS, default="process")
+    parser.add_argument("-j", "--workers", type=int)
+    parser.add_argument("--max-batch", type=int, default=64)
+    parser.add_argument("--batch-delay", type=float, default=0.001)
+    parser.add_argument("--max-queue", type=int, default=1024)
+    args = parser.parse_args(argv)
+    if args.port is None and args.unix is None:
+        args.port = 8080
+
+    async def run():
+        server = FormatServer(
+            executor=args.executor,
+            workers=args.workers,
+            max_batch=args.max_batch,
+            batch_delay=args.batch_delay,
+            max_queue=args.max_queue,
+        )
+        async with server:
+            await server.start(args.host, args.port, args.unix)
+            for address in server.addresses:
+                print(f"Listening on {address}", flush=True)
+            await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
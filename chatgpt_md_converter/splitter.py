@@ -0,0 +1,128 @@
+import re
+
+from .helpers import utf16_length, utf16_prefix
+from .telegram_formatter import telegram_format
+
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+_TOKEN = re.compile(r"(<[^>]*>)|(&#?\w+;)|([^<&]+|[<&])")
+_TAG_NAME = re.compile(r"</?([\w\-]+)")
+_EMPTY_ELEMENT = re.compile(r"<([\w\-]+)[^>]*></\1>")
+_BREAKS = re.compile(r"\n{2,}|\n| ")
+
+# Cut point preference: paragraph or block boundary, line break, space.
+_PARAGRAPH, _LINE, _SPACE = range(3)
+
+
+def _close_tags(stack) -> str:
+    return "".join(f"</{name}>" for name, _ in reversed(stack))
+
+
+def _open_tags(stack) -> str:
+    return "".join(tag for _, tag in stack)
+
+
+def split_html(html: str, limit: int = TELEGRAM_MESSAGE_LIMIT):
+    """
+    Splits Telegram HTML into chunks whose text is at most ``limit`` UTF-16
+    code units long after entity parsing. Tags open at a cut are closed at the
+    end of the chunk and reopened at the start of the next one. Cuts prefer
+    paragraph and code block boundaries, then line breaks, then spaces.
+    """
+    if limit < 1:
+        raise ValueError("limit must be at least 1")
+
+    start = 0
+    stack = []
+    end = len(html)
+    while start < end:
+        prefix = _open_tags(stack)
+        cuts = {}
+        hard_cut = None
+        length = 0
+        for match in _TOKEN.finditer(html, start):
+            tag, entity, text = match.groups()
+            if tag:
+                name = _TAG_NAME.match(tag)
+                if name is None:
+                    continue
+                if tag.startswith("</"):
+                    for index in range(len(stack) - 1, -1, -1):
+                        if stack[index][0] == name.group(1):
+                            del stack[index]
+                            break
+                    if not stack:
+                        cuts[_PARAGRAPH] = (match.end(), match.end(), (), length)
+                else:
+                    stack.append((name.group(1), tag))
+                continue
+
+            if entity:
+                if length + 1 > limit:
+                    hard_cut = (match.start(), match.start(), tuple(stack), length)
+                    break
+                length += 1
+                continue
+
+            units = utf16_length(text)
+            fits = length + units <= limit
+            if not fits:
+                text = text[: utf16_prefix(text, limit - length)]
+            snapshot = tuple(stack)
+            cut_length, counted_to = length, 0
+            for brk in _BREAKS.finditer(text):
+                if brk.group(0) == " ":
+                    kind = _SPACE
+                elif len(brk.group(0)) > 1 and not snapshot:
+                    kind = _PARAGRAPH
+                else:
+                    kind = _LINE
+                cut_length += utf16_length(text[counted_to : brk.start()])
+                counted_to = brk.start()
+                cuts[kind] = (
+                    match.start() + brk.start(),
+                    match.start() + brk.end(),
+                    snapshot,
+                    cut_length,
+                )
+            if not fits:
+                position = match.start() + len(text)
+                hard_cut = (position, position, snapshot, limit)
+                break
+            length += units
+        else:
+            yield _EMPTY_ELEMENT.sub("", prefix + html[start:])
+            return
+
+        cut = hard_cut
+        for kind in (_PARAGRAPH, _LINE, _SPACE):
+            if kind in cuts and cuts[kind][3] >= limit // 2:
+                cut = cuts[kind]
+                break
+        else:
+            candidates = [c for c in cuts.values() if c[0] > start]
+            if candidates:
+                cut = max(candidates, key=lambda candidate: candidate[0])
+
+        cut_at, resume_at, snapshot, _ = cut
+        if resume_at <= start:
+            # Not even one character fits behind the reopened tags
+            raise ValueError("limit is too small to make progress")
+        if not snapshot:
+            while resume_at < end and html[resume_at] == "\n":
+                resume_at += 1
+        stack = list(snapshot)
+        chunk = prefix + html[start:cut_at] + _close_tags(stack)
+        chunk = _EMPTY_ELEMENT.sub("", chunk)
+        if chunk.strip():
+            yield chunk
+        start = resume_at
+
+
+def telegram_format_chunks(text: str, limit: int = TELEGRAM_MESSAGE_LIMIT, **kwargs):
+    """
+    Converts markdown like `telegram_format` and yields the HTML split into
+    messages that fit Telegram's length limit, with balanced tags in each.
+    Keyword arguments are passed on to `telegram_format`.
+    """
+    yield from split_html(telegram_format(text, **kwargs), limit)
@@ -0,0 +1,560 @@
+import hashlib
+import re
+from types import MappingProxyType
+
+from .extractors import escape_html, remove_placeholder_chars
+from .telegram_formatter import convert_markup, restore_code
+
+# Paragraph breaks are the only places where the text may be cut.
+_PARAGRAPH_BREAK = re.compile(r"\n{2,}")
+
+# Markup left unconverted in a paragraph that a later paragraph could still close.
+_OPEN_MARKUP = re.compile(
+    r"`|\*\*|(?<![A-Za-z0-9])\*(?=\S)|(?<!\w)_|~~|\|\||\[|【"
+)
+_CLOSED_BRACKETS = re.compile(r"\[([^\[\]]*)\](?!\()")
+# First character of open markup -> what later text needs to possibly close it
+_CLOSERS = MappingProxyType(
+    {
+        "`": re.compile("`"),
+        "*": re.compile(r"\*"),
+        "_": re.compile(r"_(?!\w)"),
+        "~": re.compile("~~"),
+        "|": re.compile(r"\|\|"),
+        "[": re.compile(r"\]"),
+        "【": re.compile("】"),
+    }
+)
+# Stands in for the closer of markup that only the probe found open
+_NO_CLOSER = re.compile(r"(?!)")
+
+# A last line the heading or list patterns could join with the next paragraph.
+_DANGLING_MARKER = re.compile(r"\s*(?:#{1,6}|[\-\*])")
+
+# One closer of every kind and no openers. Markup left open in a paragraph
+# (possibly consumed by a later, different pass) pairs with one of these.
+_PROBE = "x** x__ x~~ x|| x* x_ ](u) 】"
+_PROBE_HTML = restore_code(*convert_markup(_PROBE))
+
+
+# The language and line break after an opening code fence, as the code block
+# pattern reads them
+_FENCE_INFO = re.compile(r"(\w*)(\n)?")
+_NEWLINE_RUN = re.compile(r"\n{3,}")
+# Stands in for the code of an open code block while the HTML around it is
+# converted; only HTML escaping is applied to code, which leaves it alone
+_CODE_SENTINEL = "\ue006"
+
+
+def _convert(text: str, strict: bool = False) -> str:
+    """
+    Converts a part of the text like `telegram_format`, without stripping it.
+    """
+    return restore_code(*convert_markup(text), strict)
+
+
+def _join(head: str, gap: int, tail: str) -> str:
+    """
+    Joins two converted parts separated by ``gap`` newlines, collapsing the
+    newlines around the junction the same way the full conversion does.
+    """
+    left = head.rstrip("\n")
+    right = tail.lstrip("\n")
+    newlines = len(head) - len(left) + gap + len(tail) - len(right)
+    return left + "\n" * (2 if newlines >= 3 else newlines) + right
+
+
+def _common_prefix(first: str, second: str, start: int) -> int:
+    """
+    Returns the length of the common prefix of two strings known to agree
+    up to ``start``, halving the compared slice instead of comparing
+    character by character.
+    """
+    low, high = start, min(len(first), len(second))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if first[low:middle] == second[low:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+class RenderedText(str):
+    """
+    Result of `StreamingFormatter.render`. ``changed`` tells whether the HTML
+    differs from the previous render, ``unchanged_prefix`` is the number of
+    leading characters it shares with it, and ``fingerprint`` is a hex digest
+    of the HTML that is stable across processes, for comparing with renders
+    sent earlier.
+    """
+
+    def __new__(cls, html: str, fingerprint: str, changed: bool, unchanged_prefix: int):
+        text = super().__new__(cls, html)
+        text.fingerprint = fingerprint
+        text.changed = changed
+        text.unchanged_prefix = unchanged_prefix
+        return text
+
+
+def _encode(html: str) -> bytes:
+    return html.encode("utf-8", "surrogatepass")
+
+
+class _OpenFence:
+    """
+    An unclosed code block at the end of the streamed tail: everything after
+    its opening fence is code, so only the code fed since the previous render
+    needs converting. The HTML around the code only depends on whether the
+    number of backticks in the code is odd, and is converted once per parity.
+    """
+
+    __slots__ = ("start", "code_start", "probe", "around", "backticks", "checked")
+
+    def __init__(self, tail: str, start: int, code_start: int):
+        self.start = start
+        self.code_start = code_start
+        # The tail up to the code, and (HTML before, HTML after the code) by
+        # parity of backticks, or None where the shortcut does not apply
+        self.probe = tail[:code_start]
+        self.around = {}
+        self.backticks = tail.count("`", code_start)
+        # Up to where the code was searched for backticks
+        self.checked = len(tail)
+
+
+class _Blocker:
+    """
+    Markup left open in paragraphs that could not be closed: the closers
+    still to arrive, one pattern per kind of markup, searched for after the
+    paragraphs' end. Closing is tried again once a closer of every kind has
+    arrived and the pending text grew by ``growth`` times the paragraphs'
+    length, or once it doubled, so that text which never closes is converted
+    a logarithmic number of times.
+    """
+
+    __slots__ = ("closers", "searched", "sooner", "later")
+
+    def __init__(self, closers, start: int, end: int, growth: float):
+        self.closers = closers
+        self.searched = end
+        self.sooner = end + int((end - start) * growth)
+        self.later = end + (end - start)
+
+    def ready(self, tail: str, end: int) -> bool:
+        """
+        Returns True if the paragraphs up to ``end`` are worth converting.
+        """
+        if end >= self.later:
+            return True
+        searched = self.searched
+        self.closers = [c for c in self.closers if not c.search(tail, searched, end)]
+        self.searched = end
+        return not self.closers and end >= self.sooner
+
+    def shift(self, offset: int):
+        self.searched -= offset
+        self.sooner -= offset
+        self.later -= offset
+
+
+class StreamingFormatter:
+    """
+    Formats a growing markdown text, e.g. an LLM reply that arrives in deltas.
+
+    Paragraphs whose markup can no longer be affected by later text are
+    converted once and kept; `render` only converts the still open tail.
+    The result always equals `telegram_format` of the whole text so far.
+    """
+
+    # Growth of the pending text, relative to paragraphs that markup kept
+    # open, after which a possible closer of that markup is worth a retry
+    _RETRY_GROWTH = 0.5
+
+    def __init__(self):
+        # Converted (unstripped) HTML of the closed prefix
+        self._head = ""
+        # Newlines between the closed prefix and the tail
+        self._gap = 0
+        # Markdown that is not part of the closed prefix yet
+        self._tail = ""
+        # Offset in the tail from which to look for paragraph breaks
+        self._scan = 0
+        # Markup that kept the start of the tail open, see `_Blocker`
+        self._blocker = None
+        # Raise InvalidHTMLError instead of repairing the HTML
+        self._strict = False
+        # The previous render, and the length of its start that was closed
+        # HTML: later renders begin with the same characters
+        self._rendered = ""
+        self._stable = 0
+        # Digest of the first ``_hashed`` characters of the closed HTML
+        self._digest = hashlib.blake2b(digest_size=8)
+        self._hashed = 0
+        # Open code block at the end of the tail, with its converted code:
+        # the end in the tail of the code converted, and its HTML
+        self._fence = None
+        self._code_end = 0
+        self._code_html = ""
+
+    def feed(self, delta: str) -> None:
+        """
+        Appends a chunk of markdown to the text.
+        """
+        self._tail += delta
+
+    def render(self) -> RenderedText:
+        """
+        Returns the Telegram HTML for all text fed so far, as a `RenderedText`
+        that tells whether it changed since the previous render. Only the
+        HTML after the closed paragraphs is compared and hashed again, so a
+        bot can skip edits that would not change the message cheaply.
+        """
+        self._close_paragraphs()
+        tail = self._convert_tail()
+        if not self._head:
+            html = tail.strip()
+        elif not tail.strip():
+            html = self._head.strip()
+        else:
+            html = _join(self._head, self._gap, tail).rstrip()
+
+        previous = self._rendered
+        unchanged_prefix = _common_prefix(previous, html, self._stable)
+        changed = unchanged_prefix != len(html) or len(previous) != len(html)
+        self._rendered = html
+        self._stable = len(self._head.rstrip())
+
+        if self._hashed < self._stable:
+            self._digest.update(_encode(html[self._hashed : self._stable]))
+            self._hashed = self._stable
+        digest = self._digest.copy()
+        digest.update(_encode(html[self._hashed :]))
+        return RenderedText(html, digest.hexdigest(), changed, unchanged_prefix)
+
+    def _close_paragraphs(self):
+        tail = self._tail
+        start = 0
+        for match in _PARAGRAPH_BREAK.finditer(tail, self._scan):
+            if match.end() == len(tail):
+                # The break may still grow or be followed by whitespace
+                break
+            self._scan = match.end()
+            cut = match.start()
+            if cut == start or tail[cut - 1].isspace() or tail[match.end()].isspace():
+                continue
+            html = self._convert_closed(tail, start, cut)
+            if html is None:
+                continue
+            self._append(html)
+            self._gap = match.end() - cut
+            start = match.end()
+
+        if start:
+            self._tail = tail[start:]
+            self._scan -= start
+            self._fence = None
+            if self._blocker is not None:
+                self._blocker.shift(start)
+
+    def _convert_tail(self) -> str:
+        """
+        Converts the open tail. Inside an unclosed code block only the code
+        fed since the previous render is escaped; the code converted before
+        is kept up to its last non-newline character, so runs of newlines are
+        always collapsed as a whole.
+        """
+        tail = self._tail
+        fence = self._open_fence(tail)
+        if fence is None:
+            return _convert(tail, self._strict)
+        parity = fence.backticks % 2
+        around = fence.around.get(parity)
+        fresh = around is None
+        if fresh:
+            around = fence.around[parity] = self._around(fence, parity)
+        # A trailing backtick would be read as part of the closing fence
+        if not around or tail.endswith("`"):
+            return _convert(tail, self._strict)
+
+        if self._code_end < fence.code_start:
+            self._code_end = fence.code_start
+            self._code_html = ""
+        new = remove_placeholder_chars(tail[self._code_end :])
+        stable = len(new.rstrip("\n"))
+        if stable:
+            self._code_html += _NEWLINE_RUN.sub("\n\n", escape_html(new[:stable]))
+            self._code_end = len(tail) - len(new) + stable
+            new = new[stable:]
+        code = self._code_html + _NEWLINE_RUN.sub("\n\n", new)
+        html = around[0] + code + around[1]
+        if fresh:
+            # Checked once per block and parity, e.g. against fences in runs
+            # of more than three backticks
+            full = _convert(tail, self._strict)
+            if html != full:
+                fence.around[parity] = ()
+                return full
+        return html
+
+    def _open_fence(self, tail: str):
+        """
+        Returns the `_OpenFence` at the end of ``tail``, or None if the tail
+        does not end inside a code block whose language is known.
+        """
+        fence = self._fence
+        if fence is not None:
+            resume = max(fence.checked - 2, fence.code_start)
+            if tail.find("```", resume) != -1:
+                fence = self._fence = None
+            else:
+                fence.backticks += tail.count("`", fence.checked)
+                fence.checked = len(tail)
+                return fence
+        if tail.count("```") % 2 == 0:
+            return None
+        start = tail.rfind("```")
+        info = _FENCE_INFO.match(tail, start + 3)
+        if info.group(2) is None and info.end() == len(tail):
+            # The language may still grow
+            return None
+        fence = self._fence = _OpenFence(tail, start, info.end())
+        line = tail.rfind("\n", 0, start) + 1
+        if (
+            tail.startswith((">", "**>"), line)
+            # In a longer run of backticks the block opens earlier
+            or (start and tail[start - 1] == "`")
+            or _CODE_SENTINEL in tail
+        ):
+            fence.around = {0: (), 1: ()}
+        self._code_end = 0
+        return fence
+
+    def _around(self, fence: _OpenFence, parity: int):
+        """
+        Converts the tail with a sentinel for the code of the open block and
+        returns the HTML before and after the code, or () if the sentinel did
+        not come through in one piece or next to a newline.
+        """
+        # The backtick keeps the parity of the code, and comes first so that
+        # it cannot join the closing fence
+        stub = "`" * parity
+        html = _convert(fence.probe + stub + _CODE_SENTINEL, self._strict)
+        index = html.find(_CODE_SENTINEL)
+        if index == -1 or html.count(_CODE_SENTINEL) != 1:
+            return ()
+        if not html.startswith(stub, index - len(stub)):
+            return ()
+        before, after = html[: index - len(stub)], html[index + 1 :]
+        # Newlines around the code would have to be collapsed with its own,
+        # e.g. where the tags of a block inside inline code were dropped
+        if before.endswith("\n") or after.startswith("\n"):
+            return ()
+        return before, after
+
+    def _append(self, html: str):
+        """
+        Adds the converted HTML of newly closed paragraphs to the prefix.
+        """
+        if self._head:
+            self._head = _join(self._head, self._gap, html)
+        else:
+            self._head = html.lstrip()
+
+    def _block(self, closers, start: int, end: int):
+        self._blocker = _Blocker(closers, start, end, self._RETRY_GROWTH)
+
+    def _convert_closed(self, tail: str, start: int, end: int):
+        """
+        Converts the paragraphs ``tail[start:end]`` if no markup in them can
+        pair with later text, otherwise returns None. The markup left open is
+        remembered, and the paragraphs only converted again once later text
+        may close it.
+        """
+        blocker = self._blocker
+        if blocker is not None and not blocker.ready(tail, end):
+            return None
+        self._blocker = None
+        paragraphs = tail[start:end]
+        if paragraphs.count("```") % 2 or paragraphs.count("`") % 2:
+            self._block([_CLOSERS["`"]], start, end)
+            return None
+        if _DANGLING_MARKER.fullmatch(paragraphs.rsplit("\n", 1)[-1]):
+            return None
+        output, inline_code_snippets, triple_code_blocks = convert_markup(paragraphs)
+        kinds = {
+            match.group(0)[0]
+            for match in _OPEN_MARKUP.finditer(_CLOSED_BRACKETS.sub(r"\1", output))
+        }
+        if kinds:
+            self._block([_CLOSERS[kind] for kind in kinds], start, end)
+            return None
+        html = restore_code(output, inline_code_snippets, triple_code_blocks)
+        probed = restore_code(*convert_markup(paragraphs + "\n\n" + _PROBE))
+        if probed != _join(html, 2, _PROBE_HTML):
+            self._block([_NO_CLOSER], start, end)
+            return None
+        if self._strict:
+            # Raises InvalidHTMLError if the HTML above needed repairs
+            restore_code(output, inline_code_snippets, triple_code_blocks, True)
+        return html
+
+
+class _DocumentFormatter(StreamingFormatter):
+    """
+    `StreamingFormatter` for documents read in batches of paragraphs: it only
+    tries to close the pending text at its last paragraph break, hands closed
+    paragraphs out instead of keeping them, and stops waiting for markup to
+    close once too much text is pending.
+    """
+
+    # Batches are large, so waiting for the pending text to double only
+    # takes a few of them
+    _RETRY_GROWTH = 1
+
+    def __init__(self, max_pending: int, strict: bool):
+        super().__init__()
+        self.max_pending = max_pending
+        self._strict = strict
+        # (newlines before, HTML) of paragraphs closed since the last drain
+        self.closed = []
+
+    def _append(self, html: str):
+        self.closed.append((self._gap, html))
+
+    def _cut(self, html: str, match):
+        self._append(html)
+        self._gap = match.end() - match.start()
+        self._tail = self._tail[match.end() :]
+        self._scan = 0
+        self._blocker = None
+
+    def close_paragraphs(self):
+        """
+        Closes the pending text up to its last paragraph break if no markup
+        before the break can pair with later text, or unconditionally once
+        more than ``max_pending`` characters are pending. Pending text kept
+        open by markup is only converted again once it may have been closed
+        or has grown enough (see `_Blocker`), not for every batch.
+        """
+        tail = self._tail
+        last = fenced = None
+        fences = counted = 0
+        for match in _PARAGRAPH_BREAK.finditer(tail):
+            start, end = match.span()
+            fences += tail.count("```", counted, start)
+            counted = start
+            if end == len(tail) or tail[start - 1].isspace() or tail[end].isspace():
+                continue
+            if start:
+                last = match
+                if fences % 2 == 0:
+                    fenced = match
+        if len(tail) > self.max_pending and fenced is not None:
+            # Markup left open before the break no longer pairs with later
+            # text. A break inside a code block cannot be closed, so this is
+            # also where closing the paragraphs would have cut them.
+            self._cut(_convert(tail[: fenced.start()], self._strict), fenced)
+            return
+        if last is not None and last.end() > self._scan:
+            self._scan = last.end()
+            html = self._convert_closed(tail, 0, last.start())
+            if html is not None:
+                self._cut(html, last)
+
+    def finish(self) -> str:
+        """
+        Converts the text that is still pending at the end of the document.
+        """
+        return _convert(self._tail, self._strict)
+
+
+# Text read before the pending paragraphs are converted, so that the checks
+# for markup left open are amortized over many paragraphs.
+_BATCH_SIZE = 16 * 1024
+
+
+def telegram_format_lines(lines, max_pending: int = 256 * 1024, strict: bool = False):
+    """
+    Converts a large markdown document given as an iterable of lines that keep
+    their line endings, e.g. a text file object, and yields HTML fragments as
+    soon as their paragraphs are complete. Joined, the fragments equal
+    `telegram_format` of the whole document.
+
+    Only paragraphs that are still open (an unclosed code fence, or emphasis
+    that a later paragraph could close) and the current batch of lines are
+    kept in memory. Once more than ``max_pending`` characters are pending,
+    the paragraphs before the last break outside a code block are converted
+    on their own, so markup left open in them no longer pairs with later text.
+    With ``strict=True`` `InvalidHTMLError` is raised instead of repairing
+    the HTML, see `telegram_format`.
+    """
+    formatter = _DocumentFormatter(max_pending, strict)
+    # Trailing whitespace of the output so far, None before the first fragment
+    held = None
+    batch = []
+    buffered = 0
+
+    def drain():
+        nonlocal held
+        for gap, html in formatter.closed:
+            html = html.lstrip() if held is None else _join(held, gap, html)
+            fragment = html.rstrip()
+            if held is not None or fragment:
+                held = html[len(fragment) :]
+            if fragment:
+                yield fragment
+        formatter.closed.clear()
+
+    for line in lines:
+        batch.append(line)
+        buffered += len(line)
+        # Only a blank line can complete a paragraph
+        if buffered >= _BATCH_SIZE and (
+            line.strip(" \t") in ("\n", "")
+            or line.startswith("\n")
+            or "\n\n" in line
+        ):
+            formatter.feed("".join(batch))
+            batch.clear()
+            buffered = 0
+            formatter.close_paragraphs()
+            yield from drain()
+
+    formatter.feed("".join(batch))
+    formatter.close_paragraphs()
+    yield from drain()
+    tail = formatter.finish()
+    if held is None:
+        tail = tail.strip()
+    elif tail.strip():
+        tail = _join(held, formatter._gap, tail).rstrip()
+    else:
+        tail = ""
+    if tail:
+        yield tail
+
+
+def split_lines(text: str):
+    """
+    Yields the lines of ``text`` with their line endings, without building a
+    list of them.
+    """
+    start = 0
+    find = text.find
+    while True:
+        end = find("\n", start) + 1
+        if not end:
+            if start < len(text):
+                yield text[start:]
+            return
+        yield text[start:end]
+        start = end
+
+
+def format_low_memory(text: str, strict: bool = False) -> str:
+    """
+    Converts ``text`` with `telegram_format_lines`, see
+    ``telegram_format(..., low_memory=True)``.
+    """
+    return "".join(telegram_format_lines(split_lines(text), strict=strict))
@@ -1,99 +1,429 @@
 import re
+import time
 
-from .converters import convert_html_chars, split_by_tag
-from .extractors import extract_and_convert_code_blocks, reinsert_code_blocks
+from .cache import content_key
+from .converters import (
+    HEADING_PATTERN,
+    LIST_PATTERN,
+    convert_html_chars,
+    convert_italic,
+    convert_line_tag,
+    convert_links,
+    convert_tag,
+    remove_citations,
+)
+from .extractors import (
+    BLOCKQUOTE_END,
+    BLOCKQUOTE_MARK,
+    EXPANDABLE_BLOCKQUOTE_MARK,
+    escape_html,
+    extract_and_convert_code_blocks,
+    extract_inline_code_snippets,
+    reinsert_code_blocks,
+    reinsert_placeholders,
+    remove_placeholder_chars,
+)
 from .formatters import combine_blockquotes
-from .helpers import remove_blockquote_escaping, remove_spoiler_escaping
+from .helpers import (
+    html_to_plain_text,
+    truncate_fragments,
+    truncate_html,
+    truncate_text,
+)
+from .instrumentation import DeadlineExceeded, record_deadline, run_stages
+from .tokenizer import tokenize_format, tokenize_with_plain_text
+from .validator import sanitize_html
 
+ENGINES = ("regex", "tokenizer")
 
-def extract_inline_code_snippets(text: str):
+_NEWLINES_PATTERN = re.compile(r"\n{3,}")
+# Longer texts are converted only as far as ``max_length`` needs
+_EARLY_STOP_SIZE = 64 * 1024
+
+
+class FormattedText(str):
     """
-    Extracts inline code (single-backtick content) from the text,
-    replacing it with placeholders, returning modified text and a dict of placeholders -> code text.
-    This ensures characters like '*' or '_' inside inline code won't be interpreted as Markdown.
+    Result of `telegram_format` called with a ``timeout`` or ``plain_text``.
+    ``degraded`` is True when the conversion ran out of time and the text is
+    the escaped plain-text fallback instead. ``plain_text`` is the version to
+    send without a parse mode when it was requested, otherwise None.
     """
-    placeholders = []
-    code_snippets = {}
-    inline_code_pattern = re.compile(r"`([^`]+)`")
-
-    def replacer(match):
-        snippet = match.group(1)
-        placeholder = f"INLINECODEPLACEHOLDER{len(placeholders)}"
-        placeholders.append(placeholder)
-        code_snippets[placeholder] = snippet
-        return placeholder
 
-    new_text = inline_code_pattern.sub(replacer, text)
-    return new_text, code_snippets
+    def __new__(cls, html: str, degraded: bool = False, plain_text=None):
+        text = super().__new__(cls, html)
+        text.degraded = degraded
+        text.plain_text = plain_text
+        return text
 
 
-def telegram_format(text: str) -> str:
+def telegram_format(
+    text: str,
+    engine: str = "regex",
+    cache=None,
+    timeout=None,
+    plain_text=False,
+    strict=False,
+    low_memory=False,
+    max_length=None,
+) -> str:
     """
     Converts markdown in the provided text to HTML supported by Telegram.
+
+    ``engine`` selects the implementation: ``"regex"`` runs the sequential
+    substitution pipeline below, ``"tokenizer"`` records where the passes
+    would insert tags and emits the same HTML in one walk; it is slower, but
+    can also produce the plain text from the same scan.
+    Results are memoized in ``cache`` (a `FormatCache`) when one is given.
+    Conversions may run on many threads at once, sharing a cache or not: the
+    rule tables are read-only and the only shared counters are locked.
+
+    With a ``timeout`` in seconds the conversion stops once it is over budget
+    and returns the text HTML-escaped, with code blocks still converted. The
+    result is then a `FormattedText` whose ``degraded`` flag tells the two
+    apart; degraded results are not cached.
+
+    With ``plain_text=True`` the result is a `FormattedText` that also carries
+    a ready-to-send ``plain_text`` version for when Telegram rejects the HTML:
+    markup removed, code text kept, link URLs appended to their labels. The
+    tokenizer engine produces it in the same scan as the HTML; otherwise it
+    is taken from the HTML in one linear pass.
+
+    The last stage checks the HTML against the tags Telegram accepts and
+    repairs it (see `sanitize_html`); with ``strict=True`` it raises
+    `InvalidHTMLError` instead. Results are cached per ``strict`` value, so a
+    repaired result cached without ``strict`` is never returned with it.
+
+    With ``low_memory=True`` (regex engine, no ``timeout``) the text is
+    converted a batch of paragraphs at a time by `telegram_format_lines`, so
+    the intermediate strings and match tables of the stages only exist for
+    one batch. It takes longer, and like `telegram_format_lines` it leaves
+    markup that stays open for more than 256 KiB of text unconverted.
+
+    With a ``max_length`` the result is cut to that many UTF-16 code units of
+    text (as Telegram counts them), never inside a tag or an entity, with the
+    open tags closed and "…" appended (see `truncate_html`). Long texts
+    without a ``cache`` or ``timeout`` are converted a batch of paragraphs at
+    a time like with ``low_memory``, and only until the budget is spent.
     """
+    if max_length is not None:
+        return _format_truncated(
+            text, max_length, engine, cache, timeout, plain_text, strict, low_memory
+        )
+    if plain_text:
+        return _format_with_plain_text(
+            text, engine, cache, timeout, strict, low_memory
+        )
+    if low_memory and (engine != "regex" or timeout is not None):
+        raise ValueError("low_memory needs the regex engine and no timeout")
+    if timeout is not None:
+        return _format_with_timeout(text, engine, cache, timeout, strict)
 
-    # Step 0: Combine blockquotes
-    text = combine_blockquotes(text)
+    if cache is not None:
+        key = _cache_key(text, engine, strict, low_memory)
+        output = cache.get(key)
+        if output is None:
+            output = telegram_format(
+                text, engine=engine, strict=strict, low_memory=low_memory
+            )
+            cache.put(key, output)
+        return output
 
-    # Step 1: Extract and convert triple-backtick code blocks first
-    output, triple_code_blocks = extract_and_convert_code_blocks(text)
+    if low_memory:
+        # Imported here: the streaming module builds on this one
+        from .streaming import format_low_memory
 
-    # Step 2: Extract inline code snippets
-    output, inline_code_snippets = extract_inline_code_snippets(output)
+        return format_low_memory(text, strict)
 
-    # Step 3: Convert HTML reserved symbols in the text (not in code blocks)
-    output = convert_html_chars(output)
+    state = _Conversion()
+    state.strict = strict
+    if engine == "tokenizer":
+        return run_stages(_TOKENIZER_STAGES, text, state).strip()
+    if engine != "regex":
+        raise ValueError(f"Unknown engine {engine!r}, expected one of {ENGINES}")
+    # One run, so that each intermediate string is released after its stage
+    return run_stages(_REGEX_STAGES, text, state).strip()
 
-    # Convert headings (H1-H6)
-    output = re.sub(r"^(#{1,6})\s+(.+)$", r"<b>\2</b>", output, flags=re.MULTILINE)
 
-    # Convert unordered lists (do this before italic detection so that leading '*' is recognized as bullet)
-    output = re.sub(r"^(\s*)[\-\*]\s+(.+)$", r"\1• \2", output, flags=re.MULTILINE)
+def _cache_key(text: str, engine: str, strict, low_memory=False) -> bytes:
+    variant = engine
+    if low_memory:
+        variant += "/low_memory"
+    if strict:
+        variant += "/strict"
+    return content_key(text, variant)
 
-    # Nested Bold and Italic
-    output = re.sub(r"\*\*\*(.*?)\*\*\*", r"<b><i>\1</i></b>", output)
-    output = re.sub(r"\_\_\_(.*?)\_\_\_", r"<u><i>\1</i></u>", output)
 
-    # Process markdown for bold (**), underline (__), strikethrough (~~), and spoiler (||)
-    output = split_by_tag(output, "**", "b")
-    output = split_by_tag(output, "__", "u")
-    output = split_by_tag(output, "~~", "s")
-    output = split_by_tag(output, "||", 'span class="tg-spoiler"')
+def _format_truncated(
+    text: str, max_length, engine, cache, timeout, plain_text, strict, low_memory
+):
+    degraded = False
+    if (
+        engine == "regex"
+        and cache is None
+        and timeout is None
+        and (low_memory or len(text) > _EARLY_STOP_SIZE)
+    ):
+        # Imported here: the streaming module builds on this one
+        from .streaming import split_lines, telegram_format_lines
 
-    # Custom approach for single-asterisk italic
-    italic_pattern = re.compile(
-        r"(?<![A-Za-z0-9])\*(?=[^\s])(.*?)(?<!\s)\*(?![A-Za-z0-9])", re.DOTALL
+        fragments = telegram_format_lines(split_lines(text), strict=strict)
+        html = truncate_fragments(fragments, max_length)
+    else:
+        output = telegram_format(
+            text,
+            engine=engine,
+            cache=cache,
+            timeout=timeout,
+            strict=strict,
+            low_memory=low_memory,
+        )
+        degraded = getattr(output, "degraded", False)
+        html = truncate_html(output, max_length)
+    if plain_text:
+        plain = truncate_text(html_to_plain_text(html), max_length)
+        return FormattedText(html, degraded, plain)
+    if timeout is not None:
+        return FormattedText(html, degraded)
+    return html
+
+
+def _format_with_plain_text(
+    text: str, engine: str, cache, timeout, strict, low_memory
+):
+    if engine == "tokenizer" and cache is None and timeout is None:
+        state = _Conversion()
+        state.strict = strict
+        html = run_stages(_PLAIN_TEXT_STAGES, text, state).strip()
+        return FormattedText(html, plain_text=state.plain_text)
+    html = telegram_format(
+        text,
+        engine=engine,
+        cache=cache,
+        timeout=timeout,
+        strict=strict,
+        low_memory=low_memory,
     )
-    output = italic_pattern.sub(r"<i>\1</i>", output)
+    degraded = getattr(html, "degraded", False)
+    return FormattedText(html, degraded, html_to_plain_text(html))
 
-    # Process single underscore-based italic
-    output = split_by_tag(output, "_", "i")
 
-    # Remove storage links (Vector storage placeholders like 【4:0†source】)
-    output = re.sub(r"【[^】]+】", "", output)
+def _format_with_timeout(text: str, engine: str, cache, timeout: float, strict):
+    deadline = time.perf_counter() + timeout
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine {engine!r}, expected one of {ENGINES}")
+    if cache is not None:
+        key = _cache_key(text, engine, strict)
+        output = cache.get(key)
+        if output is not None:
+            record_deadline(False)
+            return FormattedText(output)
 
-    # Convert Markdown links/images to <a href="">…</a>
-    link_pattern = r"(?:!?)\[((?:[^\[\]]|\[.*?\])*)\]\(([^)]+)\)"
-    output = re.sub(link_pattern, r'<a href="\2">\1</a>', output)
-
-    # Step 4: Reinsert inline code snippets, applying HTML escaping to the content
-    for placeholder, snippet in inline_code_snippets.items():
-        # Apply HTML escaping to the content of inline code
-        escaped_snippet = (
-            snippet.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
-        )
-        output = output.replace(placeholder, f"<code>{escaped_snippet}</code>")
+    state = _Conversion()
+    state.strict = strict
+    try:
+        state.deadline = deadline
+        if engine == "tokenizer":
+            output = run_stages(_TOKENIZER_STAGES, text, state, deadline).strip()
+        else:
+            output = run_stages(_REGEX_STAGES, text, state, deadline).strip()
+    except DeadlineExceeded:
+        record_deadline(True)
+        return FormattedText(run_stages(_FALLBACK_STAGES, text, None), degraded=True)
+
+    record_deadline(False)
+    if cache is not None:
+        cache.put(key, output)
+    return FormattedText(output)
+
+
+class _Conversion:
+    """
+    Code extracted from the text while the regex pipeline runs, and other
+    results of a conversion besides the HTML.
+    """
+
+    __slots__ = (
+        "code_blocks",
+        "inline_code_snippets",
+        "deadline",
+        "plain_text",
+        "strict",
+    )
+
+    def __init__(self):
+        self.code_blocks = []
+        self.inline_code_snippets = []
+        self.deadline = None
+        self.plain_text = None
+        self.strict = False
+
+
+def _combine_blockquotes(output, state):
+    output = combine_blockquotes(
+        remove_placeholder_chars(output),
+        BLOCKQUOTE_MARK,
+        EXPANDABLE_BLOCKQUOTE_MARK,
+        BLOCKQUOTE_END,
+        _deadline(state),
+    )
+    return output, None
+
+
+def _extract_code_blocks(output, state):
+    output, state.code_blocks = extract_and_convert_code_blocks(output)
+    return output, len(state.code_blocks)
+
+
+def _extract_inline_code(output, state):
+    output, state.inline_code_snippets = extract_inline_code_snippets(output)
+    return output, len(state.inline_code_snippets)
+
+
+def _escape_html(output, state):
+    return escape_html(output), None
+
+
+def _substitution(pattern, replacement):
+    def stage(output, state):
+        return pattern.subn(replacement, output)
 
-    # Step 5: Reinsert the converted triple-backtick code blocks
-    output = reinsert_code_blocks(output, triple_code_blocks)
+    return stage
 
-    # Step 6: Remove blockquote escaping
-    output = remove_blockquote_escaping(output)
 
-    # Step 7: Remove spoiler tag escaping
-    output = remove_spoiler_escaping(output)
+def _deadline(state):
+    return state.deadline if state is not None else None
 
+
+def _split_by_tag(md_tag, html_tag):
+    def stage(output, state):
+        return convert_tag(output, md_tag, html_tag, _deadline(state))
+
+    return stage
+
+
+def _line_tag(md_tag, opening, closing):
+    def stage(output, state):
+        return convert_line_tag(output, md_tag, opening, closing, _deadline(state))
+
+    return stage
+
+
+def _convert(function):
+    def stage(output, state):
+        return function(output, _deadline(state))
+
+    return stage
+
+
+def _reinsert_code(output, state):
+    output = reinsert_placeholders(
+        output, state.inline_code_snippets, state.code_blocks
+    )
+    return output, len(state.inline_code_snippets) + len(state.code_blocks)
+
+
+def _tokenize(output, state):
+    return tokenize_format(output, _deadline(state)), None
+
+
+def _sanitize(output, state):
+    strict = state is not None and state.strict
+    output, repairs = sanitize_html(output, strict, _deadline(state))
+    return output, len(repairs)
+
+
+def _tokenize_with_plain_text(output, state):
+    output, state.plain_text = tokenize_with_plain_text(output)
+    return output, None
+
+
+def _escape_fallback(output, state):
+    output, code_blocks = extract_and_convert_code_blocks(
+        remove_placeholder_chars(output)
+    )
+    output = reinsert_code_blocks(convert_html_chars(output), code_blocks)
+    return output.strip(), len(code_blocks)
+
+
+# The regex pipeline, in order. Each stage maps (output, state) -> (output, matches).
+MARKUP_STAGES = (
+    # Step 0: Combine blockquotes
+    ("combine_blockquotes", _combine_blockquotes),
+    # Step 1: Extract and convert triple-backtick code blocks first
+    ("code_blocks", _extract_code_blocks),
+    # Step 2: Extract inline code snippets
+    ("inline_code", _extract_inline_code),
+    # Step 3: Convert HTML reserved symbols in the text (not in code blocks)
+    # and turn the blockquote marks into tags
+    ("escape_html", _escape_html),
+    # Convert headings (H1-H6)
+    ("headings", _substitution(HEADING_PATTERN, r"<b>\2</b>")),
+    # Convert unordered lists (before italic detection so that leading '*' is a bullet)
+    ("lists", _substitution(LIST_PATTERN, r"\1• \2")),
+    # Nested Bold and Italic
+    ("bold_italic", _line_tag("***", "<b><i>", "</i></b>")),
+    ("underline_italic", _line_tag("___", "<u><i>", "</i></u>")),
+    # Bold (**), underline (__), strikethrough (~~), and spoiler (||)
+    ("bold", _split_by_tag("**", "b")),
+    ("underline", _split_by_tag("__", "u")),
+    ("strikethrough", _split_by_tag("~~", "s")),
+    ("spoiler", _split_by_tag("||", 'span class="tg-spoiler"')),
+    # Custom approach for single-asterisk italic
+    ("italic_asterisk", _convert(convert_italic)),
+    # Single underscore-based italic
+    ("italic_underscore", _split_by_tag("_", "i")),
+    # Remove storage links (Vector storage placeholders like 【4:0†source】)
+    ("citations", _convert(remove_citations)),
+    # Convert Markdown links/images to <a href="">…</a>
+    ("links", _convert(convert_links)),
+)
+
+RESTORE_STAGES = (
+    # Step 4-5: Reinsert inline code snippets (HTML-escaped) and the converted
+    # triple-backtick code blocks in one pass
+    ("reinsert_code", _reinsert_code),
+    # Repair markup Telegram would reject (matches: number of repairs). A tag
+    # it drops may leave newlines to collapse, so this comes first.
+    ("sanitize", _sanitize),
     # Clean up multiple consecutive newlines, but preserve intentional spacing
-    output = re.sub(r"\n{3,}", "\n\n", output)
+    ("collapse_newlines", _substitution(_NEWLINES_PATTERN, "\n\n")),
+)
+
+_REGEX_STAGES = MARKUP_STAGES + RESTORE_STAGES
 
-    return output.strip()
+_TOKENIZER_STAGES = (("tokenize", _tokenize),) + RESTORE_STAGES[1:]
+
+# Leaves the plain text in ``state.plain_text``
+_PLAIN_TEXT_STAGES = (
+    ("tokenize_with_plain_text", _tokenize_with_plain_text),
+) + RESTORE_STAGES[1:]
+
+# Output of a conversion that ran out of time: the text HTML-escaped, with
+# code blocks still converted
+_FALLBACK_STAGES = (("escape_fallback", _escape_fallback),)
+
+
+def convert_markup(text: str):
+    """
+    Runs the markdown conversion passes of the regex pipeline, returning the
+    converted text with code still replaced by placeholders, together with the
+    inline code snippets and code blocks that belong to those placeholders.
+    """
+    state = _Conversion()
+    output = run_stages(MARKUP_STAGES, text, state)
+    return output, state.inline_code_snippets, state.code_blocks
+
+
+def restore_code(
+    output: str, inline_code_snippets: list, triple_code_blocks: list, strict: bool = False
+):
+    """
+    Reinserts the code extracted by `convert_markup` and finalizes the HTML.
+    The result is not stripped. With ``strict=True`` `InvalidHTMLError` is
+    raised instead of repairing the HTML.
+    """
+    state = _Conversion()
+    state.strict = strict
+    state.inline_code_snippets = inline_code_snippets
+    state.code_blocks = triple_code_blocks
+    return run_stages(RESTORE_STAGES, output, state)
@@ -0,0 +1,554 @@
+import re
+from bisect import bisect_left, bisect_right
+from operator import itemgetter
+from types import MappingProxyType
+
+from .converters import (
+    HEADING_PATTERN,
+    LIST_PATTERN,
+    MARKER_RULES,
+    CharPositions,
+    LinkMatcher,
+    citation_end,
+)
+from .extractors import (
+    BLOCKQUOTE_END,
+    BLOCKQUOTE_MARK,
+    CODE_BLOCK_MARK,
+    EXPANDABLE_BLOCKQUOTE_MARK,
+    INLINE_CODE_MARK,
+    PLACEHOLDER_END,
+    code_block_html,
+    escape_code,
+    extract_code_blocks,
+    extract_inline_code_snippets,
+    remove_placeholder_chars,
+)
+from .formatters import combine_blockquotes
+from .helpers import link_suffix
+from .instrumentation import DEADLINE_CHECK_INTERVAL, check_deadline
+
+_NEWLINES = re.compile(r"\n{3,}")
+_MARKER_RUN = re.compile(r"\*+|_+|~+|\|+")
+_PLACEHOLDER = re.compile("([\ue000\ue001])(\\d+)\ue002")
+
+# Stand-ins for the tags of headings and list items in the scanned text.
+# Placeholders always have an index, so these sequences never occur otherwise.
+_HEADING_OPEN = INLINE_CODE_MARK + PLACEHOLDER_END
+_HEADING_CLOSE = CODE_BLOCK_MARK + PLACEHOLDER_END
+_LIST_ITEM = BLOCKQUOTE_MARK + PLACEHOLDER_END
+# Placeholders, heading marks, list item marks and blockquote marks
+_MARK = re.compile("([\ue000\ue001])(\\d*)\ue002|\ue003\ue002|[\ue003-\ue005]")
+
+# The emphasis passes of the regex pipeline, in order
+_MARKERS = ("***", "___", "**", "__", "~~", "||", "*", "_")
+
+_ESCAPED = frozenset("&<>")
+_EVENT_ORDER = itemgetter(0, 1)
+
+
+class Tag(str):
+    """
+    HTML tag emitted by the scanner. Besides being the tag text itself it
+    carries the Telegram entity types it opens or closes, so the parts can be
+    rendered either as HTML or as plain text with entities.
+
+    ``extra`` holds the entity fields (url, language). Tags of block
+    structure that has no entity of its own (headings, list items) name the
+    document tree node in ``kind`` and its fields in ``attrs``; a list item
+    tag without entities is text (the bullet) rather than markup.
+    """
+
+    def __new__(
+        cls,
+        html: str,
+        *entities,
+        closing: bool = False,
+        kind=None,
+        attrs=None,
+        **extra,
+    ):
+        tag = super().__new__(cls, html)
+        tag.entities = entities
+        tag.closing = closing
+        tag.kind = kind
+        tag.attrs = attrs
+        tag.extra = extra
+        return tag
+
+
+class Verbatim(str):
+    """
+    Unescaped text of a code span or block. ``html`` is the escaped text
+    exactly as the regex pipeline inserts it.
+    """
+
+    def __new__(cls, text: str, html: str):
+        verbatim = super().__new__(cls, text)
+        verbatim.html = html
+        return verbatim
+
+
+def _pair(opening: str, closing: str, *entities, kind=None, attrs=None):
+    return (
+        Tag(opening, *entities, kind=kind, attrs=attrs),
+        Tag(closing, *entities, closing=True, kind=kind),
+    )
+
+
+# marker -> (opening tag, closing tag). The tag tables are shared by all
+# conversions, so they are read-only.
+_TAGS = MappingProxyType(
+    {
+        "***": _pair("<b><i>", "</i></b>", "bold", "italic"),
+        "___": _pair("<u><i>", "</i></u>", "underline", "italic"),
+        "**": _pair("<b>", "</b>", "bold"),
+        "__": _pair("<u>", "</u>", "underline"),
+        "~~": _pair("<s>", "</s>", "strikethrough"),
+        "||": _pair('<span class="tg-spoiler">', "</span>", "spoiler"),
+        "*": _pair("<i>", "</i>", "italic"),
+        "_": _pair("<i>", "</i>", "italic"),
+    }
+)
+_HEADING_TAGS = MappingProxyType(
+    {
+        level: _pair(
+            "<b>",
+            "</b>",
+            "bold",
+            kind="heading",
+            attrs=MappingProxyType({"level": level}),
+        )
+        for level in range(1, 7)
+    }
+)
+_LIST_ITEM_CLOSE = Tag("", closing=True, kind="list_item")
+_BLOCKQUOTE_TAGS = _pair("<blockquote>", "</blockquote>", "blockquote")
+_EXPANDABLE_BLOCKQUOTE_TAGS = _pair(
+    "<blockquote expandable>", "</blockquote>", "expandable_blockquote"
+)
+_CODE_TAGS = _pair("<code>", "</code>", "code")
+_PRE_TAGS = _pair("<pre><code>", "</code></pre>", "pre")
+_LINK_CLOSE = Tag("</a>", "text_link", closing=True)
+
+
+def _escape(text: str) -> str:
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+class _Scanner:
+    """
+    Converts the text the way the regex pipeline does, but without building
+    the intermediate HTML strings. The text is prepared like the pipeline's
+    first stages (blockquotes combined, code cut out, headings and list items
+    marked), then every pass that would insert tags only records where they
+    go: the emphasis passes pair up the runs of marker characters, citations
+    and links are found around them. One walk over the text then emits the
+    text and `Tag` parts in order.
+    """
+
+    def __init__(self, text: str, escape: bool = True, deadline=None):
+        self.text = text
+        self.escaping = escape
+        self.escape = _escape if escape else str
+        self.deadline = deadline
+        # (start, end, part or list of parts) replacing ``text[start:end]``
+        self.events = []
+
+    def scan(self) -> list:
+        """
+        Converts the text and returns the list of HTML-escaped text parts and
+        `Tag` parts.
+        """
+        self._prepare()
+        self._marks()
+        self._emphasis()
+        events = self.events
+        events.sort(key=_EVENT_ORDER)
+        if "【" in self.text:
+            self._citations()
+        if "[" in self.text:
+            self._links()
+        return self._emit(0, len(self.text))
+
+    def _prepare(self):
+        """
+        Runs the stages of the regex pipeline that come before the emphasis,
+        with marks in place of the tags of blockquotes, headings and lists.
+        """
+        text = combine_blockquotes(
+            remove_placeholder_chars(self.text),
+            BLOCKQUOTE_MARK,
+            EXPANDABLE_BLOCKQUOTE_MARK,
+            BLOCKQUOTE_END,
+            self.deadline,
+        )
+        text, self.code_blocks = extract_code_blocks(text)
+        text, self.snippets = extract_inline_code_snippets(text)
+        check_deadline(self.deadline)
+        self.levels = []
+        self.indents = []
+
+        def heading(match):
+            self.levels.append(len(match.group(1)))
+            return _HEADING_OPEN + match.group(2) + _HEADING_CLOSE
+
+        def list_item(match):
+            self.indents.append(match.group(1))
+            return _LIST_ITEM + match.group(1) + "• " + match.group(2)
+
+        if "#" in text:
+            text = HEADING_PATTERN.sub(heading, text)
+        text = LIST_PATTERN.sub(list_item, text)
+        self.text = text
+        check_deadline(self.deadline)
+
+    def _marks(self):
+        """
+        Records the parts of code placeholders and the tags of headings, list
+        items and blockquotes. The marks of tags are flagged in ``replaced``.
+        """
+        text = self.text
+        events = self.events
+        self.replaced = replaced = bytearray(len(text))
+        levels = iter(self.levels)
+        indents = iter(self.indents)
+        level = quote = None
+        # indent -> list item tag
+        bullets = {}
+        for count, match in enumerate(_MARK.finditer(text), 1):
+            if not count % DEADLINE_CHECK_INTERVAL:
+                check_deadline(self.deadline)
+            start, end = match.span()
+            mark, index = match.groups()
+            if mark is not None and index:
+                part = self._code(mark, int(index))
+            elif mark == INLINE_CODE_MARK:
+                level = next(levels)
+                part = _HEADING_TAGS[level][0]
+            elif mark == CODE_BLOCK_MARK:
+                part = _HEADING_TAGS[level][1]
+            elif end - start == 2:
+                indent = next(indents)
+                replaced[start:end] = b"\x01\x01"
+                end += len(indent) + 2
+                part = bullets.get(indent)
+                if part is None:
+                    part = Tag(indent + "• ", kind="list_item", attrs={"indent": indent})
+                    bullets[indent] = part
+                # The item ends with its line, inside a blockquote ending there
+                line_end = text.find("\n", end)
+                if line_end == -1:
+                    line_end = len(text)
+                if text[line_end - 1] == BLOCKQUOTE_END:
+                    line_end -= 1
+                events.append((line_end, line_end, _LIST_ITEM_CLOSE))
+                events.append((start, end, part))
+                continue
+            elif text[start] == BLOCKQUOTE_END:
+                # The opening mark may have gone into a code span
+                part = (quote or _BLOCKQUOTE_TAGS)[1]
+            else:
+                if text[start] == BLOCKQUOTE_MARK:
+                    quote = _BLOCKQUOTE_TAGS
+                else:
+                    quote = _EXPANDABLE_BLOCKQUOTE_TAGS
+                part = quote[0]
+            if part.__class__ is Tag:
+                replaced[start:end] = b"\x01" * (end - start)
+            events.append((start, end, part))
+
+    def _code(self, mark: str, index: int) -> list:
+        """
+        Returns the parts of a code span or block placeholder.
+        """
+        if mark == CODE_BLOCK_MARK:
+            language, code = self.code_blocks[index]
+            html = escape_code(code)
+            if language:
+                opening = '<pre><code class="language-{}">'.format(language)
+                opening = Tag(opening, "pre", language=language)
+            else:
+                opening = _PRE_TAGS[0]
+            return [opening, self._verbatim(code, html), _PRE_TAGS[1]]
+        code = self.snippets[index]
+        html = escape_code(code)
+        if CODE_BLOCK_MARK in code:
+            # Inline code that swallowed a code block placeholder
+            def block(match):
+                return code_block_html(*self.code_blocks[int(match.group(2))])
+
+            html = _PLACEHOLDER.sub(block, html)
+            code = _PLACEHOLDER.sub(
+                lambda match: self.code_blocks[int(match.group(2))][1], code
+            )
+        return [_CODE_TAGS[0], self._verbatim(code, html), _CODE_TAGS[1]]
+
+    def _verbatim(self, code: str, html: str):
+        if self.escaping:
+            return html
+        return Verbatim(remove_placeholder_chars(code), html)
+
+    def _emphasis(self):
+        """
+        Pairs the emphasis markers pass by pass like `pair_delimiters` does on
+        the text of the regex pipeline. Marks and markers an earlier pass
+        turned into tags are flagged in ``replaced``; next to a later marker
+        they count as the ">" or "<" of the tag, and escaped characters as
+        the ";" or "&" of their entity.
+        """
+        text = self.text
+        length = len(text)
+        runs = {}
+        for match in _MARKER_RUN.finditer(text):
+            runs.setdefault(match.group(0)[0], []).append(match.span())
+        if not runs:
+            return
+        replaced = self.replaced
+        events = self.events
+        deadline = self.deadline
+        for marker in _MARKERS:
+            char_runs = runs.get(marker[0])
+            if not char_runs:
+                continue
+            size = len(marker)
+            can_open, can_close, single_line = MARKER_RULES[marker]
+            openers = []
+            closers = []
+            for start, end in char_runs:
+                for position in range(start, end - size + 1):
+                    if not position % DEADLINE_CHECK_INTERVAL:
+                        check_deadline(deadline)
+                    after = position + size
+                    if replaced.find(1, position, after) != -1:
+                        continue
+                    if not position:
+                        before = ""
+                    elif replaced[position - 1]:
+                        before = ">"
+                    else:
+                        before = text[position - 1]
+                        if before in _ESCAPED:
+                            before = ";"
+                    if after == length:
+                        following = ""
+                    elif replaced[after]:
+                        following = "<"
+                    else:
+                        following = text[after]
+                        if following in _ESCAPED:
+                            following = "&"
+                    if can_open(before, following):
+                        openers.append(position)
+                    if can_close(before, following):
+                        closers.append(position)
+            if not openers or not closers:
+                continue
+
+            opening, closing = _TAGS[marker]
+            fill = b"\x01" * size
+            resume = 0
+            closer = 0
+            line_end = -1
+            check_deadline(deadline)
+            for opener in openers:
+                if opener < resume:
+                    continue
+                while closer < len(closers) and closers[closer] < opener + size:
+                    closer += 1
+                if closer == len(closers):
+                    break
+                end = closers[closer]
+                if single_line:
+                    if line_end < opener:
+                        line_end = text.find("\n", opener)
+                        if line_end == -1:
+                            line_end = length
+                    if end + size > line_end:
+                        continue
+                replaced[opener : opener + size] = fill
+                replaced[end : end + size] = fill
+                events.append((opener, opener + size, opening))
+                events.append((end, end + size, closing))
+                resume = end + size
+
+    def _citations(self):
+        """
+        Finds citations like 【4:0†source】 the way `remove_citations` does;
+        they are dropped together with any tags inside them.
+        """
+        text = self.text
+        closing = CharPositions(text, "】")
+        self.citations = citations = []
+        start = text.find("【")
+        while start != -1:
+            end = citation_end(text, start, closing)
+            if end == -1:
+                start = text.find("【", start + 1)
+                continue
+            citations.append((start, end))
+            start = text.find("【", end)
+        events = self.events
+        for start, end in citations:
+            events.append((start, end, None))
+        events.sort(key=_EVENT_ORDER)
+
+    def _links(self):
+        """
+        Finds links like `convert_links` does in the text left once citations
+        are removed, and adds the tags around their labels.
+        """
+        text = self.text
+        citations = getattr(self, "citations", None)
+        # Positions in ``text`` where a citation was cut out of ``linked``, and
+        # the number of characters removed up to there
+        cuts = [0]
+        shifts = [0]
+        if citations:
+            pieces = []
+            position = 0
+            for start, end in citations:
+                pieces.append(text[position:start])
+                cuts.append(start - shifts[-1])
+                shifts.append(shifts[-1] + end - start)
+                position = end
+            pieces.append(text[position:])
+            linked = "".join(pieces)
+        else:
+            linked = text
+
+        def original(position):
+            return position + shifts[bisect_right(cuts, position) - 1]
+
+        start = linked.find("[")
+        if start == -1:
+            return
+        matcher = LinkMatcher(linked)
+        links = []
+        position = 0
+        while start != -1:
+            link = matcher.match(start)
+            if link is None:
+                start = linked.find("[", start + 1)
+                continue
+            label_end, url_start, url_end = link
+            # An image's "!" is dropped along with the brackets
+            begin = start
+            if start > position and linked[start - 1] == "!":
+                begin = start - 1
+            opening = self._link(original(url_start), original(url_end))
+            links.append((original(begin), original(start) + 1, opening))
+            links.append((original(label_end), original(url_end) + 1, _LINK_CLOSE))
+            position = url_end + 1
+            start = linked.find("[", position)
+            if not len(links) % DEADLINE_CHECK_INTERVAL:
+                check_deadline(self.deadline)
+        self.events.extend(links)
+        self.events.sort(key=_EVENT_ORDER)
+
+    def _link(self, url_start: int, url_end: int) -> Tag:
+        """
+        Returns the opening tag of a link whose URL is ``text[url_start:url_end]``.
+        Tags the earlier passes put into the URL stay in the href, as in the
+        regex pipeline.
+        """
+        events = self.events
+        index = bisect_left(events, (url_start,))
+        if index == len(events) or events[index][0] >= url_end:
+            url = self.text[url_start:url_end]
+            return Tag('<a href="{}">'.format(_escape(url)), "text_link", url=url)
+        parts = self._emit(url_start, url_end)
+        pieces = []
+        url = []
+        for part in parts:
+            if isinstance(part, Tag):
+                pieces.append(part)
+                continue
+            url.append(part)
+            if isinstance(part, Verbatim):
+                pieces.append(part.html)
+            else:
+                pieces.append(part if self.escaping else _escape(part))
+        html = '<a href="{}">'.format("".join(pieces))
+        return Tag(html, "text_link", url="".join(url))
+
+    def _emit(self, start: int, end: int) -> list:
+        """
+        Returns the parts of ``text[start:end]``: the text between the events
+        and the parts of the events. Events inside a replaced span are skipped.
+        """
+        text = self.text
+        escape = self.escape
+        events = self.events
+        parts = []
+        append = parts.append
+        position = start
+        index = bisect_left(events, (start,)) if start else 0
+        checked = index
+        for index in range(index, len(events)):
+            event_start, event_end, part = events[index]
+            if event_start >= end:
+                break
+            if event_start < position:
+                continue
+            if event_start > position:
+                append(escape(text[position:event_start]))
+            if part.__class__ is list:
+                parts.extend(part)
+            elif part is not None:
+                append(part)
+            position = event_end
+            if index - checked > DEADLINE_CHECK_INTERVAL:
+                check_deadline(self.deadline)
+                checked = index
+        if position < end:
+            append(escape(text[position:end]))
+        return parts
+
+
+def tokenize_format(text: str, deadline=None) -> str:
+    """
+    Converts markdown to Telegram HTML by recording where the regex passes
+    would insert tags and emitting text and tags in one walk, and returns it
+    before the markup is checked and blank lines are collapsed. Equals the regex pipeline's HTML at that point. Raises
+    `DeadlineExceeded` when ``time.perf_counter()`` passes ``deadline``
+    before the scan is done.
+    """
+    return "".join(scan_parts(text, deadline=deadline))
+
+
+def scan_parts(text: str, escape: bool = True, deadline=None) -> list:
+    """
+    Scans markdown into a list of text parts and `Tag` parts. With
+    ``escape=False`` the text parts are left unescaped, and code text is a
+    `Verbatim` that also carries its HTML.
+    """
+    return _Scanner(text, escape, deadline).scan()
+
+
+def tokenize_with_plain_text(text: str, deadline=None):
+    """
+    Like `tokenize_format`, but also returns the text as it can be sent
+    without a parse mode: markup removed, code text kept and link URLs
+    appended to their labels. Both come from the same scan.
+    """
+    html = []
+    plain = []
+    # (index in ``plain`` where the label starts, url) of open links
+    links = []
+    for part in scan_parts(text, escape=False, deadline=deadline):
+        if not isinstance(part, Tag) or not part.entities:
+            if isinstance(part, Verbatim):
+                html.append(part.html)
+            else:
+                html.append(_escape(part))
+            plain.append(part)
+            continue
+        html.append(part)
+        if "text_link" in part.entities:
+            if part.closing:
+                start, url = links.pop()
+                plain.append(link_suffix("".join(plain[start:]), url))
+            else:
+                links.append((len(plain), part.extra["url"]))
+    return "".join(html), _NEWLINES.sub("\n\n", "".join(plain)).strip()
@@ -0,0 +1,262 @@
+import re
+from collections import namedtuple
+from itertools import islice
+from types import MappingProxyType
+
+from .instrumentation import DEADLINE_CHECK_INTERVAL, check_deadline
+
+# Tags Telegram accepts without attributes (besides <code> and <blockquote>,
+# which may also have one)
+_SIMPLE_TAGS = frozenset(
+    ("b", "strong", "i", "em", "u", "ins", "s", "strike", "del", "tg-spoiler", "pre")
+)
+# A tag, or a "<", ">" or "&" that is not part of a tag or supported entity
+_TOKEN = re.compile(
+    r"<(/?)([a-zA-Z][\w\-]*)([^<>]*)>|[<>]|&(?!#\d+;|#x[0-9a-fA-F]+;|(?:lt|gt|amp|quot);)"
+)
+_SPOILER_CLASS = re.compile(r'\s+class="tg-spoiler"\s*')
+_CODE_CLASS = re.compile(r'\s+class="language-[\w\-+#.]*"\s*')
+_BLOCKQUOTE_ATTRIBUTE = re.compile(r"\s+expandable\s*")
+_HREF = re.compile(r'\s+href="(.*)"\s*', re.DOTALL)
+
+# Tags that may not contain themselves, and tags whose content is plain text
+# except for a <code> directly inside <pre>
+_NOT_NESTED = frozenset(("a", "blockquote", "pre", "code"))
+_VERBATIM = frozenset(("pre", "code"))
+
+# Tags as this package writes them, without their "<" -> tag name. The
+# quick check of HTML that is most likely valid only knows these.
+_OPENING = MappingProxyType(
+    {
+        **{f"{name}>": name for name in _SIMPLE_TAGS | {"code", "blockquote"}},
+        'span class="tg-spoiler">': "span",
+        "blockquote expandable>": "blockquote",
+    }
+)
+_CLOSING = MappingProxyType(
+    {f"/{name}>": name for name in set(_OPENING.values()) | {"a"}}
+)
+_VALID_LINK = re.compile(r'a href="[^"]*">')
+_VALID_CODE = re.compile(r'code class="language-[\w\-+#.]*">')
+_NUMERIC_ENTITY = re.compile(r"&#(?:\d+|x[0-9a-fA-F]+);")
+
+# Tags closed and opened again around a mismatched closing tag at most; any
+# further ones are just closed, so that a repair never costs more than this
+_MAX_REOPEN = 8
+
+Repair = namedtuple("Repair", ["kind", "position", "markup"])
+Repair.__doc__ = """
+One change made by `sanitize_html`. ``kind`` is one of ``"unsupported_tag"``,
+``"attribute"``, ``"nesting"``, ``"overlap"``, ``"unmatched_closing_tag"``,
+``"unclosed_tag"`` or ``"unescaped_character"``; ``position`` is the offset
+in the input HTML and ``markup`` the offending text.
+"""
+
+
+class InvalidHTMLError(ValueError):
+    """
+    Raised by `sanitize_html` and ``telegram_format(..., strict=True)`` when
+    the HTML needs repairs. ``repairs`` lists all of them.
+    """
+
+    def __init__(self, repairs: list):
+        first = repairs[0]
+        super().__init__(
+            f"{len(repairs)} problem(s) in Telegram HTML, first: {first.kind} "
+            f"{first.markup!r} at {first.position}"
+        )
+        self.repairs = repairs
+
+
+def _escape(text: str) -> str:
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def _opening_tag(name: str, attributes: str):
+    """
+    Returns the tag as Telegram accepts it, or None when it has no valid form.
+    ``attributes`` may be changed (an ``href`` with quotes is escaped).
+    """
+    if not attributes.strip():
+        if name in _SIMPLE_TAGS or name in ("code", "blockquote"):
+            return f"<{name}>"
+        return None
+    if name == "span" and _SPOILER_CLASS.fullmatch(attributes):
+        return '<span class="tg-spoiler">'
+    if name == "code" and _CODE_CLASS.fullmatch(attributes):
+        return f"<code {attributes.strip()}>"
+    if name == "blockquote" and _BLOCKQUOTE_ATTRIBUTE.fullmatch(attributes):
+        return "<blockquote expandable>"
+    if name == "a":
+        href = _HREF.fullmatch(attributes)
+        if href:
+            return '<a href="{}">'.format(href.group(1).replace('"', "&quot;"))
+    return None
+
+
+def _is_valid(html: str, deadline=None) -> bool:
+    """
+    Returns True if Telegram accepts ``html`` as it is. Uses only substring
+    counts and one split, and recognizes tags only in the form this package
+    writes them; anything else is left to the full scan of `sanitize_html`.
+    """
+    ampersands = html.count("&")
+    if ampersands:
+        entities = (
+            html.count("&lt;")
+            + html.count("&gt;")
+            + html.count("&amp;")
+            + html.count("&quot;")
+        )
+        if entities != ampersands and "&#" in html:
+            entities += len(_NUMERIC_ENTITY.findall(html))
+        if entities != ampersands:
+            return False
+
+    tags = html.split("<")
+    # Every ">" must end one of the tags
+    if html.count(">") != len(tags) - 1:
+        return False
+    opening = _OPENING.get
+    closing = _CLOSING.get
+    stack = []
+    top = None
+    # Open tags of the kinds that may not be nested
+    exclusive = set()
+    for count, part in enumerate(islice(tags, 1, None), 1):
+        if not count % DEADLINE_CHECK_INTERVAL:
+            check_deadline(deadline)
+        tag = part[: part.find(">") + 1]
+        name = opening(tag)
+        if name is None:
+            name = closing(tag)
+            if name is not None:
+                if top != name:
+                    return False
+                stack.pop()
+                top = stack[-1] if stack else None
+                exclusive.discard(name)
+                continue
+            if _VALID_LINK.fullmatch(tag):
+                name = "a"
+            elif _VALID_CODE.fullmatch(tag):
+                name = "code"
+            else:
+                # Also a "<" without a ">" (empty tag)
+                return False
+        if top in _VERBATIM and not (name == "code" and top == "pre"):
+            return False
+        if name in _NOT_NESTED:
+            if name in exclusive:
+                return False
+            exclusive.add(name)
+        stack.append(name)
+        top = name
+    return not stack
+
+
+def sanitize_html(html: str, strict: bool = False, deadline=None):
+    """
+    Checks Telegram HTML against the tags and attributes Telegram accepts and
+    returns ``(html, repairs)``: the HTML made acceptable and the list of
+    `Repair` entries describing what was changed (empty when it was valid).
+
+    Unsupported tags, stray ``<``, ``>`` and ``&``, entities Telegram does
+    not know and quotes inside an ``href`` are escaped. Tags that may not be
+    nested where they are and closing tags without an opener are dropped,
+    tags left open are closed, and overlapping tags are closed and reopened
+    so they nest. Valid HTML is only checked, in one
+    scan; otherwise a second scan repairs it. The work per tag is bounded, so
+    both are linear in the length of the HTML. With ``strict=True``
+    `InvalidHTMLError` is raised instead of repairing, and `DeadlineExceeded`
+    once ``deadline`` (a `time.perf_counter` value) has passed.
+    """
+    if _is_valid(html, deadline):
+        return html, []
+    check_deadline(deadline)
+    repairs = []
+    pieces = []
+    # Open tags as (name, opening tag, reopened after an overlap)
+    stack = []
+    # Number of open tags per name
+    open_counts = {}
+    position = 0
+
+    def repair(kind, match):
+        repairs.append(Repair(kind, match.start(), match.group(0)))
+
+    def push(name, tag, reopened=False):
+        stack.append((name, tag, reopened))
+        open_counts[name] = open_counts.get(name, 0) + 1
+        pieces.append(tag)
+
+    def pop():
+        name, tag, reopened = stack.pop()
+        open_counts[name] -= 1
+        if reopened and pieces[-1] is tag:
+            # Drop a reopened tag that ends up empty
+            pieces.pop()
+        else:
+            pieces.append(f"</{name}>")
+
+    for count, match in enumerate(_TOKEN.finditer(html), 1):
+        if not count % DEADLINE_CHECK_INTERVAL:
+            check_deadline(deadline)
+        if match.start() > position:
+            pieces.append(html[position : match.start()])
+        position = match.end()
+        closing, name, attributes = match.groups()
+
+        if name is None:
+            repair("unescaped_character", match)
+            pieces.append(_escape(match.group(0)))
+            continue
+        name = name.lower()
+        verbatim = stack and stack[-1][0] in _VERBATIM
+
+        if closing:
+            if attributes.strip() or not open_counts.get(name):
+                repair("unmatched_closing_tag", match)
+                continue
+            if stack[-1][0] != name:
+                repair("overlap", match)
+                reopen = []
+                while stack[-1][0] != name:
+                    if len(reopen) < _MAX_REOPEN:
+                        reopen.append(stack[-1])
+                    pop()
+                pop()
+                for inner, tag, _ in reversed(reopen):
+                    push(inner, tag, True)
+                continue
+            pop()
+            continue
+
+        tag = _opening_tag(name, attributes)
+        if tag is None:
+            repair("unsupported_tag", match)
+            pieces.append(_escape(match.group(0)))
+            continue
+        if (
+            open_counts.get(name) and name in _NOT_NESTED
+        ) or (verbatim and not (name == "code" and stack[-1][0] == "pre")):
+            # Text typed by the user is escaped before tags are generated, so
+            # this is markup, not text; its closing tag is dropped as unmatched
+            repair("nesting", match)
+            continue
+        if tag != match.group(0):
+            repair("attribute", match)
+        push(name, tag)
+
+    if position < len(html):
+        pieces.append(html[position:])
+    if stack:
+        repairs.append(Repair("unclosed_tag", len(html), stack[-1][1]))
+        while stack:
+            pop()
+
+    if not repairs:
+        return html, repairs
+    if strict:
+        raise InvalidHTMLError(repairs)
+    return "".join(pieces), repairs
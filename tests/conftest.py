@@ -0,0 +1,22 @@
+import pytest
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--run-timing",
+        action="store_true",
+        help="run the wall-clock scaling tests, which are noisy on shared machines",
+    )
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "timing: wall-clock test, skipped unless --run-timing")
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--run-timing"):
+        return
+    skip = pytest.mark.skip(reason="needs --run-timing")
+    for item in items:
+        if "timing" in item.keywords:
+            item.add_marker(skip)
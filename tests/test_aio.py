@@ -0,0 +1,112 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from chatgpt_md_converter import (
+    AsyncFormatter,
+    async_telegram_format,
+    async_telegram_format_many,
+    telegram_format,
+)
+
+SMALL = "Some **bold** and `code`"
+LARGE = "```python\nprint('<hi>')\n```\n" * 50
+
+
+def test_async_format_matches_sync():
+    assert asyncio.run(async_telegram_format(SMALL)) == telegram_format(SMALL)
+    assert asyncio.run(async_telegram_format(LARGE)) == telegram_format(LARGE)
+
+
+def test_async_format_offloads_large_texts():
+    formatter = AsyncFormatter(inline_threshold=100)
+
+    async def main():
+        await formatter.format(SMALL)
+        assert formatter._executor is None
+        return await formatter.format(LARGE)
+
+    assert asyncio.run(main()) == telegram_format(LARGE)
+    assert formatter._executor is not None
+    formatter.close()
+
+
+def test_async_format_limits_concurrency():
+    formatter = AsyncFormatter(inline_threshold=0, max_concurrency=2)
+    active = []
+    peak = []
+
+    def tracked(text, engine):
+        active.append(text)
+        peak.append(len(active))
+        threading.Event().wait(0.01)
+        active.remove(text)
+        return telegram_format(text, engine=engine)
+
+    async def main():
+        jobs = [formatter._offload(tracked, f"text {i}", "regex") for i in range(8)]
+        return await asyncio.gather(*jobs)
+
+    assert asyncio.run(main()) == [f"text {i}" for i in range(8)]
+    assert max(peak) <= 2
+    formatter.close()
+
+
+def test_async_format_many_keeps_order():
+    texts = [SMALL, LARGE] * 20
+    expected = [telegram_format(text) for text in texts]
+    assert asyncio.run(async_telegram_format_many(texts)) == expected
+
+
+def test_async_format_many_reads_texts_only_as_far_as_needed(monkeypatch):
+    from chatgpt_md_converter import aio
+
+    formatter = AsyncFormatter(inline_threshold=0, max_concurrency=2)
+    read = []
+    # Texts read by the time each chunk is converted
+    seen = {}
+
+    def texts():
+        for i in range(20):
+            read.append(i)
+            yield f"text {i}"
+
+    def tracked(chunk, engine):
+        seen[chunk[0]] = len(read)
+        return [telegram_format(text, engine=engine) for text in chunk]
+
+    monkeypatch.setattr(aio, "_format_chunk", tracked)
+    results = asyncio.run(formatter.format_many(texts(), chunk_size=1))
+    assert results == [f"text {i}" for i in range(20)]
+    # The text itself and at most max_concurrency texts after it
+    assert all(seen[f"text {i}"] <= i + 3 for i in range(20))
+    formatter.close()
+
+
+def test_async_format_many_cancels_outstanding_chunks(monkeypatch):
+    from chatgpt_md_converter import aio
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    formatter = AsyncFormatter(inline_threshold=0, max_concurrency=3, executor=executor)
+    converted = []
+
+    def failing(chunk, engine):
+        threading.Event().wait(0.02)
+        if chunk == ["bad"]:
+            raise ValueError("bad chunk")
+        converted.append(chunk)
+        return chunk
+
+    async def main():
+        # The next chunks are queued in the executor when the first one fails
+        with pytest.raises(ValueError):
+            await formatter.format_many(["bad"] + ["ok"] * 10, chunk_size=1)
+        await asyncio.sleep(0.1)
+
+    monkeypatch.setattr(aio, "_format_chunk", failing)
+    asyncio.run(main())
+    # The worker may take the next chunk before the failure is seen
+    assert len(converted) <= 1
+    executor.shutdown()
@@ -0,0 +1,50 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from chatgpt_md_converter import telegram_format, telegram_format_many
+
+TEXTS = [f"Item {i}: **bold** and `code {i}`\n> quote {i}" for i in range(200)]
+EXPECTED = [telegram_format(text) for text in TEXTS]
+
+
+def test_format_many_inline():
+    assert list(telegram_format_many(TEXTS)) == EXPECTED
+
+
+def test_format_many_thread_pool_keeps_order():
+    results = telegram_format_many(TEXTS, executor="thread", workers=4, chunk_size=7)
+    assert list(results) == EXPECTED
+
+
+def test_format_many_process_pool():
+    results = telegram_format_many(iter(TEXTS), executor="process", workers=2)
+    assert list(results) == EXPECTED
+
+
+def test_format_many_external_executor_is_not_shut_down():
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        results = telegram_format_many(TEXTS, executor=executor, max_pending=1)
+        assert list(results) == EXPECTED
+        assert executor.submit(len, "abc").result() == 3
+
+
+def test_format_many_bounds_pending_chunks():
+    consumed = []
+
+    def texts():
+        for text in TEXTS:
+            consumed.append(text)
+            yield text
+
+    results = telegram_format_many(
+        texts(), executor="thread", workers=1, chunk_size=10, max_pending=2
+    )
+    next(results)
+    assert len(consumed) <= 30
+    results.close()
+
+
+def test_format_many_unknown_executor():
+    with pytest.raises(ValueError):
+        list(telegram_format_many(TEXTS, executor="gpu"))
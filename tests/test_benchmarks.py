@@ -0,0 +1,36 @@
+from benchmarks.memory import run_memory_benchmarks
+from benchmarks.run import compare, load_corpus, run_benchmarks, scale
+
+
+def test_corpus_covers_reply_kinds():
+    assert {
+        "short_reply",
+        "code_heavy",
+        "blockquote_thread",
+        "citations",
+        "pathological",
+    } <= set(load_corpus())
+
+
+def test_scale():
+    assert scale("abc", 10) == "abc\n\nabc\n\n"
+    assert len(scale("x" * 50, 20)) == 20
+
+
+def test_run_and_compare():
+    results = run_benchmarks(sizes=(256,), min_time=0, max_runs=3)
+    assert {r["key"] for r in results} >= {"regex/short_reply/256"}
+    assert all(r["runs"] == 3 and r["ns_per_byte"] > 0 for r in results)
+    assert all(r["relative_cost"] > 0 for r in results)
+
+    baseline = {r["key"]: r["relative_cost"] for r in results}
+    assert compare(results, baseline, 0.25) == []
+    baseline = {key: value / 2 for key, value in baseline.items()}
+    assert len(compare(results, baseline, 0.25)) == len(results)
+
+
+def test_memory_benchmarks():
+    results = run_memory_benchmarks(sizes=(64 * 1024,))
+    peaks = {r["key"]: r["peak_per_byte"] for r in results}
+    assert all(peak > 0 for peak in peaks.values())
+    assert peaks["low_memory/short_reply/65536"] < peaks["regex/short_reply/65536"]
@@ -0,0 +1,59 @@
+import sys
+
+import pytest
+
+from chatgpt_md_converter import FormatCache, InvalidHTMLError, telegram_format
+
+
+def test_cache_returns_same_result_and_counts_hits():
+    cache = FormatCache()
+    text = "Some **bold** text"
+    first = telegram_format(text, cache=cache)
+    second = telegram_format(text, cache=cache)
+    assert first == second == telegram_format(text)
+    assert cache.stats() == {
+        "hits": 1,
+        "misses": 1,
+        "evictions": 0,
+        "entries": 1,
+        "bytes": sys.getsizeof(first),
+    }
+
+
+def test_cache_keys_include_engine():
+    cache = FormatCache()
+    telegram_format("*x*", cache=cache)
+    telegram_format("*x*", engine="tokenizer", cache=cache)
+    assert len(cache) == 2
+
+
+@pytest.mark.parametrize("timeout", [None, 10])
+def test_strict_is_checked_on_cache_hits(timeout):
+    cache = FormatCache()
+    text = "**a _b** c_"
+    assert telegram_format(text, cache=cache, timeout=timeout)
+    with pytest.raises(InvalidHTMLError):
+        telegram_format(text, cache=cache, timeout=timeout, strict=True)
+
+
+def test_cache_evicts_least_recently_used_entry():
+    cache = FormatCache(max_entries=2)
+    telegram_format("a", cache=cache)
+    telegram_format("b", cache=cache)
+    telegram_format("a", cache=cache)
+    telegram_format("c", cache=cache)
+    assert cache.evictions == 1
+    telegram_format("a", cache=cache)
+    assert cache.hits == 2
+    telegram_format("b", cache=cache)
+    assert cache.misses == 4
+
+
+def test_cache_respects_byte_limit():
+    cache = FormatCache(max_bytes=sys.getsizeof("x" * 150))
+    telegram_format("x" * 100, cache=cache)
+    telegram_format("y" * 100, cache=cache)
+    assert len(cache) == 1
+    assert cache.stats()["bytes"] <= cache.max_bytes
+    telegram_format("z" * 1000, cache=cache)
+    assert cache.stats()["entries"] == 1
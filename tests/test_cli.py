@@ -0,0 +1,99 @@
+import io
+import json
+
+from chatgpt_md_converter import telegram_format
+from chatgpt_md_converter.cli import main
+
+RECORDS = [{"id": i, "reply": {"parts": [f"**{i}** <b> _x_"]}} for i in range(50)]
+
+
+def write_jsonl(path, records):
+    path.write_text("".join(json.dumps(record) + "\n" for record in records))
+
+
+def test_jsonl_field_path(tmp_path, capsys):
+    source = tmp_path / "in.jsonl"
+    target = tmp_path / "out.jsonl"
+    write_jsonl(source, RECORDS)
+    args = ["-o", str(target), "--field", "reply.parts.0", "-j", "2", "--chunk-size", "7"]
+    status = main([str(source)] + args)
+    assert status == 0
+    lines = target.read_text().splitlines()
+    assert [json.loads(line)["id"] for line in lines] == list(range(50))
+    assert json.loads(lines[3])["reply"]["parts"] == [telegram_format("**3** <b> _x_")]
+    assert "50 records, 0 errors" in capsys.readouterr().err
+
+
+def test_jsonl_errors_are_passed_through(tmp_path, capsys):
+    source = tmp_path / "in.jsonl"
+    source.write_text('{"text": "*a*"}\nnot json\n\n{"text": 1}\n{"other": ""}\n')
+    status = main([str(source), "--output-field", "html", "-j", "1"])
+    out, err = capsys.readouterr()
+    assert status == 1
+    assert out.splitlines() == [
+        '{"text": "*a*", "html": "<i>a</i>"}',
+        "not json",
+        "",
+        '{"text": 1}',
+        '{"other": ""}',
+    ]
+    assert "error in record 2: JSONDecodeError" in err
+    assert "error in record 3: TypeError: text is int, not a string" in err
+    assert "4 records, 3 errors" in err
+
+
+def test_text_documents_in_order(tmp_path, capsys, monkeypatch):
+    first = tmp_path / "first.md"
+    first.write_text("# One\n\n**a**\n")
+    second = tmp_path / "second.md"
+    second.write_text("_two_")
+    monkeypatch.setattr("sys.stdin", io.StringIO("~~stdin~~\n"))
+    args = ["--format", "text", "--separator", "\n---\n", "-j", "2", "-q"]
+    status = main(args + [str(first), "-", str(second)])
+    out, err = capsys.readouterr()
+    assert status == 0 and err == ""
+    assert out == "<b>One</b>\n\n<b>a</b>\n---\n<s>stdin</s>\n---\n<i>two</i>\n---\n"
+
+
+def test_text_documents_use_engine_options(tmp_path, capsys, monkeypatch):
+    source = tmp_path / "doc.md"
+    source.write_text("**a**")
+    calls = []
+
+    def record(text, **options):
+        calls.append(options)
+        return telegram_format(text, **options)
+
+    monkeypatch.setattr("chatgpt_md_converter.cli.telegram_format", record)
+    monkeypatch.setattr("sys.stdin", io.StringIO("_b_"))
+    args = ["--format", "text", "--engine", "tokenizer", "--timeout", "5", "-j", "1"]
+    assert main(args + ["-q", str(source), "-"]) == 0
+    assert capsys.readouterr().out == "<b>a</b>\n<i>b</i>\n"
+    assert calls == [{"engine": "tokenizer", "timeout": 5.0}] * 2
+
+    calls.clear()
+    monkeypatch.setattr("sys.stdin", io.StringIO("_b_"))
+    args = ["--format", "text", "--low-memory", "-j", "1", "-q"]
+    assert main(args + [str(source), "-"]) == 0
+    assert capsys.readouterr().out == "<b>a</b>\n<i>b</i>\n"
+    assert calls == []
+
+
+def test_invalid_utf8_is_an_error(tmp_path, capsys):
+    source = tmp_path / "in.jsonl"
+    target = tmp_path / "out.jsonl"
+    source.write_bytes(b'{"text": "*a*"}\n{"text": "\xff*b*"}\n{"text": "_c_"}\n')
+    assert main([str(source), "-o", str(target), "-j", "1"]) == 1
+    assert target.read_bytes() == (
+        b'{"text": "<i>a</i>"}\n{"text": "\xff*b*"}\n{"text": "<i>c</i>"}\n'
+    )
+    err = capsys.readouterr().err
+    assert "error in record 2: UnicodeDecodeError" in err
+    assert "3 records, 1 errors" in err
+
+    document = tmp_path / "doc.md"
+    document.write_bytes(b"**a** \xff")
+    for option in ([], ["--low-memory"]):
+        assert main(["--format", "text", "-j", "1", str(document)] + option) == 1
+        out, err = capsys.readouterr()
+        assert out == "" and "error in record 1" in err and "can't decode" in err
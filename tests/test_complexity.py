@@ -0,0 +1,20 @@
+import pytest
+
+from benchmarks.complexity import ADVERSARIAL, measure_scaling
+from chatgpt_md_converter import telegram_format
+from chatgpt_md_converter.telegram_formatter import ENGINES
+
+
+@pytest.mark.timing
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("name", sorted(ADVERSARIAL))
+def test_adversarial_input_scales_linearly(name, engine):
+    result = measure_scaling(name, engine)
+    assert result["linear"], result
+
+
+def test_link_label_with_brackets():
+    assert telegram_format("[x [y] z] w](u)") == '<a href="u">x [y] z] w</a>'
+    assert telegram_format("[a [b](u)") == '[a <a href="u">b</a>'
+    assert telegram_format("[a\n[b] c](u)") == '<a href="u">a\n[b] c</a>'
+    assert telegram_format("[a [b\nc]](u)") == '[a [b\nc]](u)'
@@ -0,0 +1,123 @@
+import time
+
+import pytest
+
+from chatgpt_md_converter import (
+    FormatCache,
+    FormattedText,
+    deadline_stats,
+    profile_stages,
+    telegram_format,
+    telegram_format_many,
+)
+from chatgpt_md_converter.converters import convert_italic, convert_links
+from chatgpt_md_converter.formatters import combine_blockquotes
+from chatgpt_md_converter.instrumentation import DeadlineExceeded
+from chatgpt_md_converter.tokenizer import tokenize_format
+from chatgpt_md_converter.validator import sanitize_html
+
+TEXT = "**bold** <b> & `x`\n```python\nif a < b:\n    pass\n```\n_done_"
+FALLBACK = (
+    "**bold** &lt;b&gt; &amp; `x`\n"
+    '<pre><code class="language-python">if a &lt; b:\n    pass\n</code></pre>\n'
+    "_done_"
+)
+
+
+@pytest.mark.parametrize("engine", ["regex", "tokenizer"])
+def test_within_budget_is_not_degraded(engine):
+    output = telegram_format(TEXT, engine=engine, timeout=10)
+    assert isinstance(output, FormattedText)
+    assert not output.degraded
+    assert output == telegram_format(TEXT, engine=engine)
+
+
+@pytest.mark.parametrize("engine", ["regex", "tokenizer"])
+def test_over_budget_degrades_to_escaped_text(engine):
+    output = telegram_format(TEXT, engine=engine, timeout=0)
+    assert output.degraded
+    assert output == FALLBACK
+
+
+def test_huge_input_returns_close_to_budget():
+    text = "**a** [b](c) _d_\n" * 200000
+    start = time.perf_counter()
+    output = telegram_format(text, engine="tokenizer", timeout=0.01)
+    assert time.perf_counter() - start < 1
+    assert output.degraded
+    assert output.startswith("**a** [b](c) _d_\n")
+
+
+@pytest.mark.timing
+@pytest.mark.parametrize("engine", ["regex", "tokenizer"])
+def test_quote_heavy_input_returns_close_to_budget(engine):
+    # Overruns by the time of one linear pass: splitting a window of lines,
+    # then escaping the fallback
+    text = "> q\n" * 400000
+    start = time.perf_counter()
+    output = telegram_format(text, engine=engine, timeout=0.01)
+    assert time.perf_counter() - start < 0.1
+    assert output.degraded
+
+
+@pytest.mark.parametrize(
+    "convert, text",
+    [
+        (convert_italic, "*a* " * 5000),
+        (convert_links, "[a](b) " * 5000),
+        (lambda text, deadline: sanitize_html(text, False, deadline), "<x>" * 5000),
+        (tokenize_format, "*a* [b](c) " * 5000),
+        (
+            lambda text, deadline: combine_blockquotes(text, deadline=deadline),
+            "> q\n" * 5000,
+        ),
+    ],
+    ids=[
+        "pair_delimiters",
+        "convert_links",
+        "sanitize_html",
+        "tokenizer",
+        "combine_blockquotes",
+    ],
+)
+def test_long_passes_check_the_deadline(convert, text):
+    # The deadline has long passed, so the first check inside the pass raises
+    with pytest.raises(DeadlineExceeded):
+        convert(text, deadline=0)
+
+
+def test_degradation_is_counted():
+    deadline_stats(reset=True)
+    telegram_format(TEXT, timeout=10)
+    telegram_format(TEXT, timeout=0)
+    telegram_format(TEXT, timeout=0)
+    telegram_format(TEXT)
+    assert deadline_stats(reset=True) == {
+        "timed": 3,
+        "degraded": 2,
+        "degradation_rate": 2 / 3,
+    }
+    assert deadline_stats()["timed"] == 0
+
+
+def test_degraded_result_is_not_cached():
+    cache = FormatCache()
+    assert telegram_format(TEXT, cache=cache, timeout=0).degraded
+    assert len(cache) == 0
+    output = telegram_format(TEXT, cache=cache, timeout=10)
+    assert not output.degraded and len(cache) == 1
+    cached = telegram_format(TEXT, cache=cache, timeout=0)
+    assert not cached.degraded and cached == output
+
+
+def test_fallback_is_reported_as_a_stage():
+    with profile_stages() as stages:
+        telegram_format(TEXT, timeout=0)
+    assert [stage.name for stage in stages] == ["escape_fallback"]
+    assert stages[0].matches == 1
+
+
+def test_format_many_passes_the_budget_per_text():
+    results = list(telegram_format_many([TEXT] * 3, executor="process", timeout=0))
+    assert results == [FALLBACK] * 3
+    assert all(result.degraded for result in results)
@@ -0,0 +1,78 @@
+from chatgpt_md_converter import (
+    parse_document,
+    render_html,
+    render_text,
+    telegram_format,
+    telegram_format_entities,
+)
+
+TEXT = """## Steps
+
+- Open **the [docs](http://example.com)**
+- Run `make <all>`
+
+```python
+print("a")
+
+print("b")
+```
+
+> quoted ~~text~~
+**> hidden ||spoiler||"""
+
+
+def test_tree_structure():
+    document = parse_document(TEXT)
+    assert document.kind == "document"
+    assert [paragraph.kind for paragraph in document.children] == ["paragraph"] * 4
+
+    heading, items, code, quotes = (p.children for p in document.children)
+    assert heading[0].kind == "heading"
+    assert heading[0].attrs == {"level": 2} and heading[0].children == ["Steps"]
+
+    first, newline, second = items
+    assert (first.kind, first.attrs, newline) == ("list_item", {"indent": ""}, "\n")
+    bold = first.children[1]
+    assert bold.kind == "bold" and bold.children[1].kind == "text_link"
+    assert bold.children[1].attrs == {"url": "http://example.com"}
+    assert second.children[1].kind == "code"
+    assert second.children[1].children == ["make <all>"]
+
+    assert code[0].kind == "pre" and code[0].attrs == {"language": "python"}
+    assert code[0].text == 'print("a")\n\nprint("b")\n'
+
+    assert [node.kind for node in quotes] == ["expandable_blockquote"]
+    assert quotes[0].text == "quoted text\nhidden spoiler"
+
+
+def test_renderers_match_the_direct_conversions():
+    document = parse_document(TEXT)
+    assert render_html(document) == telegram_format(TEXT, engine="tokenizer")
+    assert render_html(document) == telegram_format(TEXT)
+    assert render_text(document) == telegram_format_entities(TEXT)[0]
+
+
+def test_link_inside_link_label_stays_text():
+    text = "[![badge](https://img/x.svg)](https://github.com/x)"
+    document = parse_document(text)
+    (link,) = document.children[0].children
+    assert link.kind == "text_link" and link.attrs == {"url": "https://github.com/x"}
+    assert link.children == ["![badge](https://img/x.svg)"]
+    assert render_html(document) == telegram_format(text, engine="tokenizer")
+    assert render_html(document) == (
+        '<a href="https://github.com/x">![badge](https://img/x.svg)</a>'
+    )
+
+
+def test_overlapping_markup_is_nested():
+    document = parse_document("**bold _both** italic_")
+    bold, italic = document.children[0].children
+    assert bold.kind == "bold" and bold.children[1].kind == "italic"
+    assert italic.kind == "italic" and italic.children == [" italic"]
+    assert render_html(document) == "<b>bold <i>both</i></b><i> italic</i>"
+
+
+def test_nodes_have_no_instance_dict():
+    node = parse_document("text")
+    assert not hasattr(node, "__dict__")
+    assert render_html(parse_document("")) == ""
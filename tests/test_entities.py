@@ -0,0 +1,150 @@
+import random
+from html.parser import HTMLParser
+
+from chatgpt_md_converter import telegram_format, telegram_format_entities
+from chatgpt_md_converter.helpers import utf16_length
+
+from .test_tokenizer import SAMPLES
+
+_TYPES = {"b": "bold", "i": "italic", "u": "underline", "s": "strikethrough"}
+
+
+class _EntityParser(HTMLParser):
+    """Reference HTML -> entities conversion used to check the direct output."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.text = ""
+        self.stack = []
+        self.entities = []
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        extra = {}
+        if tag == "blockquote":
+            kind = "expandable_blockquote" if "expandable" in attrs else "blockquote"
+        elif tag == "span":
+            kind = "spoiler"
+        elif tag == "a":
+            kind, extra = "text_link", {"url": attrs["href"]}
+        elif tag == "code" and self.stack and self.stack[-1][0] == "pre":
+            if "class" in attrs:
+                self.stack[-1][2]["language"] = attrs["class"][len("language-") :]
+            self.stack.append(("", 0, {}))
+            return
+        else:
+            kind = _TYPES.get(tag, tag)
+        self.stack.append((kind, utf16_length(self.text), extra))
+
+    def handle_endtag(self, tag):
+        kind, offset, extra = self.stack.pop()
+        length = utf16_length(self.text) - offset
+        if kind and length:
+            self.entities.append(
+                {"type": kind, "offset": offset, "length": length, **extra}
+            )
+
+    def handle_data(self, data):
+        self.text += data
+
+
+def reference(text):
+    parser = _EntityParser()
+    parser.feed(telegram_format(text, engine="tokenizer"))
+    key = lambda entity: (entity["offset"], entity["type"])  # noqa: E731
+    return parser.text, sorted(parser.entities, key=key)
+
+
+def test_entities_match_html_output():
+    for text in SAMPLES:
+        plain_text, entities = telegram_format_entities(text)
+        key = lambda entity: (entity["offset"], entity["type"])  # noqa: E731
+        assert (plain_text, sorted(entities, key=key)) == reference(text), text
+
+
+def assert_nested(entities):
+    ends = []
+    for entity in sorted(entities, key=lambda e: (e["offset"], -e["length"])):
+        while ends and ends[-1] <= entity["offset"]:
+            ends.pop()
+        end = entity["offset"] + entity["length"]
+        assert not ends or end <= ends[-1], entities
+        ends.append(end)
+
+
+def test_overlapping_markup_gives_nested_entities():
+    assert telegram_format_entities("**a __b** c__") == (
+        "a b c",
+        [
+            {"type": "bold", "offset": 0, "length": 3},
+            {"type": "underline", "offset": 2, "length": 1},
+            {"type": "underline", "offset": 3, "length": 2},
+        ],
+    )
+    pieces = ["**", "*", "_", "__", "~~", "||", "[", "](u)", "> ", "\n", "a", " "]
+    generator = random.Random(9)
+    for text in SAMPLES + [
+        "".join(generator.choice(pieces) for _ in range(generator.randint(1, 30)))
+        for _ in range(300)
+    ]:
+        plain_text, entities = telegram_format_entities(text)
+        assert_nested(entities)
+        expected = reference(text)
+        # Unlike the HTML, the plain text is stripped inside entities too
+        if expected[0] == expected[0].strip():
+            key = lambda entity: sorted(entity.items())  # noqa: E731
+            assert plain_text == expected[0], text
+            assert sorted(entities, key=key) == sorted(expected[1], key=key), text
+
+
+def test_blockquote_ending_inside_code():
+    assert telegram_format_entities("> a `b\nc` d") == (
+        "a b\nc d",
+        [
+            {"type": "blockquote", "offset": 0, "length": 7},
+            {"type": "code", "offset": 2, "length": 3},
+        ],
+    )
+
+
+def test_entities_basic():
+    text = "**Bold** and [link](http://a.b?x=1&y=2) 🎉 `co<de>`"
+    plain_text, entities = telegram_format_entities(text)
+    assert plain_text == "Bold and link 🎉 co<de>"
+    assert entities == [
+        {"type": "bold", "offset": 0, "length": 4},
+        {"type": "text_link", "offset": 9, "length": 4, "url": "http://a.b?x=1&y=2"},
+        {"type": "code", "offset": 17, "length": 6},
+    ]
+
+
+def test_entities_pre_with_language_and_blockquotes():
+    text = "```python\nprint(1)\n```\n\n**>hidden\n>more"
+    plain_text, entities = telegram_format_entities(text)
+    assert plain_text == "print(1)\n\n\nhidden\nmore"
+    assert entities == [
+        {"type": "pre", "offset": 0, "length": 9, "language": "python"},
+        {"type": "expandable_blockquote", "offset": 11, "length": 11},
+    ]
+
+
+def test_quote_markers_inside_code_block():
+    text = "```python\n>>> print(1)\n1\n```"
+    plain_text, entities = telegram_format_entities(text)
+    assert plain_text == ">>> print(1)\n1"
+    assert entities == [
+        {"type": "pre", "offset": 0, "length": 14, "language": "python"},
+    ]
+
+
+def test_link_inside_link_label_is_not_an_entity():
+    text = "[![badge](https://img/x.svg)](https://github.com/x)"
+    plain_text, entities = telegram_format_entities(text)
+    assert plain_text == "![badge](https://img/x.svg)"
+    assert entities == [
+        {"type": "text_link", "offset": 0, "length": 27, "url": "https://github.com/x"},
+    ]
+
+
+def test_entities_empty():
+    assert telegram_format_entities("   ") == ("", [])
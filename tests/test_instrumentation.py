@@ -0,0 +1,44 @@
+from chatgpt_md_converter import profile_stages, telegram_format
+from chatgpt_md_converter.instrumentation import stage_hook
+from chatgpt_md_converter.telegram_formatter import MARKUP_STAGES, RESTORE_STAGES
+
+TEXT = "# Title\n\n**bold** `a` `b` [link](http://x.y)\n```\ncode\n```"
+
+
+def test_profile_reports_every_stage():
+    with profile_stages() as stages:
+        output = telegram_format(TEXT)
+    assert output == telegram_format(TEXT)
+    names = [name for name, _ in MARKUP_STAGES + RESTORE_STAGES]
+    assert [stage.name for stage in stages] == names
+    assert all(stage.seconds >= 0 for stage in stages)
+
+    by_name = {stage.name: stage for stage in stages}
+    assert by_name["code_blocks"].matches == 1
+    assert by_name["inline_code"].matches == 2
+    assert by_name["headings"].matches == 1
+    assert by_name["links"].matches == 1
+    assert by_name["escape_html"].matches is None
+    assert by_name["combine_blockquotes"].input_size == len(TEXT)
+    for before, after in zip(stages, stages[1:]):
+        assert before.output_size == after.input_size
+
+
+def test_profile_callback_and_tokenizer_engine():
+    seen = []
+    with profile_stages(callback=seen.append) as stages:
+        telegram_format(TEXT, engine="tokenizer")
+    assert seen == stages
+    assert [stage.name for stage in stages] == [
+        "tokenize",
+        "sanitize",
+        "collapse_newlines",
+    ]
+
+
+def test_profiling_is_disabled_outside_block():
+    with profile_stages() as stages:
+        pass
+    telegram_format(TEXT)
+    assert stages == []
+    assert stage_hook.get() is None
@@ -730,3 +730,98 @@ def test_ukrainian_text_with_inline_code():
     expected_output = """звісно, майстре тестування. ой та зрозуміло <code>&lt;LAUGH&gt;</code> що ти тут тестуєш."""
     output = telegram_format(input_text)
     assert output == expected_output, f"Output was: {output}"
+
+
+def test_repeated_code_blocks():
+    input_text = "```\nsame\n```\nbetween\n```\nsame\n```"
+    expected_output = (
+        "<pre><code>same\n</code></pre>\nbetween\n<pre><code>same\n</code></pre>"
+    )
+    output = telegram_format(input_text)
+    assert output == expected_output, f"Output was: {output}"
+
+
+def test_many_code_blocks():
+    input_text = "\n".join(f"```\nblock {i}\n```" for i in range(25))
+    expected_output = "\n".join(
+        f"<pre><code>block {i}\n</code></pre>" for i in range(25)
+    )
+    output = telegram_format(input_text)
+    assert output == expected_output, f"Output was: {output}"
+
+
+def test_more_than_ten_inline_code_snippets():
+    input_text = " ".join(f"`snippet {i}`" for i in range(12))
+    expected_output = " ".join(f"<code>snippet {i}</code>" for i in range(12))
+    output = telegram_format(input_text)
+    assert output == expected_output, f"Output was: {output}"
+
+
+def test_underscore_italic_after_inline_code():
+    input_text = "`code` _italic_ and `x`_y_"
+    expected_output = "<code>code</code> <i>italic</i> and <code>x</code><i>y</i>"
+    output = telegram_format(input_text)
+    assert output == expected_output, f"Output was: {output}"
+
+
+def test_placeholder_characters_in_input():
+    input_text = "`a` 0 0"
+    expected_output = "<code>a</code> 0 0"
+    output = telegram_format(input_text)
+    assert output == expected_output, f"Output was: {output}"
+
+
+def test_literal_html_tags_stay_escaped():
+    input_text = 'a </span> <span class="tg-spoiler">b</span> <blockquote>c</blockquote>'
+    expected_output = (
+        "a &lt;/span&gt; &lt;span class=\"tg-spoiler\"&gt;b&lt;/span&gt; "
+        "&lt;blockquote&gt;c&lt;/blockquote&gt;"
+    )
+    output = telegram_format(input_text)
+    assert output == expected_output, f"Output was: {output}"
+
+
+def test_literal_html_tags_in_code_stay_escaped():
+    input_text = "`</blockquote>`\n```\n</span>\n```"
+    expected_output = (
+        "<code>&lt;/blockquote&gt;</code>\n<pre><code>&lt;/span&gt;\n</code></pre>"
+    )
+    output = telegram_format(input_text)
+    assert output == expected_output, f"Output was: {output}"
+
+
+def test_blockquote_marks_in_input():
+    input_text = "\ue005> quote \ue003"
+    expected_output = "<blockquote>quote</blockquote>"
+    output = telegram_format(input_text)
+    assert output == expected_output, f"Output was: {output}"
+
+
+def test_blockquote_ending_inside_code():
+    input_text = "> a `b\nc` d"
+    expected_output = "<blockquote>a <code>b\nc</code> d</blockquote>"
+    output = telegram_format(input_text)
+    assert output == expected_output, f"Output was: {output}"
+    input_text = "> ```\ncode\n```"
+    expected_output = "<blockquote><pre><code>\ncode\n</code></pre></blockquote>"
+    output = telegram_format(input_text)
+    assert output == expected_output, f"Output was: {output}"
+
+
+def test_quote_markers_inside_code_block():
+    input_text = "```python\n>>> print(1)\n1\n```\n> quote\n```\n> not a quote\n```"
+    expected_output = (
+        '<pre><code class="language-python">&gt;&gt;&gt; print(1)\n1\n</code></pre>\n'
+        "<blockquote>quote</blockquote>\n<pre><code>&gt; not a quote\n</code></pre>"
+    )
+    output = telegram_format(input_text)
+    assert output == expected_output, f"Output was: {output}"
+
+
+def test_code_block_inside_blockquote():
+    input_text = "> ```\n> >>> x\n> ```\nafter"
+    expected_output = (
+        "<blockquote><pre><code>&gt;&gt;&gt; x\n</code></pre></blockquote>\nafter"
+    )
+    output = telegram_format(input_text)
+    assert output == expected_output, f"Output was: {output}"
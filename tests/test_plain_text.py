@@ -0,0 +1,53 @@
+import pytest
+
+from chatgpt_md_converter import FormatCache, telegram_format
+from chatgpt_md_converter.helpers import html_to_plain_text
+
+TEXT = """# Setup
+
+Read **the [guide](http://example.com/?a=1&b=2)** or http://x.io: [http://x.io](http://x.io)
+
+- Run `pip install <pkg>` && ~~wait~~ ||done||
+
+```bash
+echo "*not italic*"
+```
+> _quoted_"""
+
+PLAIN = """Setup
+
+Read the guide (http://example.com/?a=1&b=2) or http://x.io: http://x.io
+
+• Run pip install <pkg> && wait done
+
+echo "*not italic*"
+
+quoted"""
+
+
+@pytest.mark.parametrize("engine", ["regex", "tokenizer"])
+def test_plain_text_alongside_html(engine):
+    output = telegram_format(TEXT, engine=engine, plain_text=True)
+    assert output == telegram_format(TEXT, engine=engine)
+    assert output.plain_text == PLAIN
+    assert not output.degraded
+
+
+def test_scan_matches_html_pass():
+    output = telegram_format(TEXT, engine="tokenizer", plain_text=True)
+    assert output.plain_text == html_to_plain_text(output)
+
+
+def test_plain_text_with_cache_and_timeout():
+    cache = FormatCache()
+    telegram_format(TEXT, cache=cache)
+    assert telegram_format(TEXT, cache=cache, plain_text=True).plain_text == PLAIN
+
+    degraded = telegram_format("**a** <b> [x](u)", timeout=0, plain_text=True)
+    assert degraded.degraded
+    assert degraded.plain_text == "**a** <b> [x](u)"
+
+
+def test_plain_text_is_not_computed_by_default():
+    assert not hasattr(telegram_format(TEXT), "plain_text")
+    assert telegram_format(TEXT, timeout=10).plain_text is None
@@ -0,0 +1,62 @@
+from benchmarks.run import load_corpus
+from chatgpt_md_converter.fuzz import fuzz, generate_markdown, main, shrink
+from chatgpt_md_converter.reference import reference_format
+from chatgpt_md_converter.telegram_formatter import telegram_format
+from tests.test_tokenizer import SAMPLES
+
+
+def test_reference_matches_pipeline():
+    for text in SAMPLES + list(load_corpus().values()):
+        assert reference_format(text) == telegram_format(text), text
+
+
+def test_engines_match_reference():
+    engines = ["regex", "tokenizer", "low_memory", "streaming", "lines"]
+    assert fuzz(engines, runs=300, seed=1) == []
+
+
+def test_tokenizer_matches_reference_on_malformed_input():
+    # Shapes the earlier single-scan tokenizer got wrong
+    for text in [
+        "__",
+        "**",
+        "[![badge](https://img/x.svg)](https://github.com/x)",
+        "[label\nmore](http://x)",
+        "***a\nb***",
+        "**a __b** c__",
+        "[a](http://x/_y_)",
+        "[`](u)`",
+        "`\n**>`",
+        "【e】[](a)[](b)",
+    ]:
+        assert telegram_format(text, engine="tokenizer") == reference_format(text), text
+
+
+def test_mismatch_is_shrunk():
+    def broken(text):
+        # Drops strikethrough
+        return reference_format(text.replace("~~", ""))
+
+    [mismatch] = fuzz({"broken": broken}, runs=500, seed=2)
+    assert mismatch.engine == "broken"
+    assert mismatch.text == "~~"
+    assert mismatch.expected == reference_format(mismatch.text) != mismatch.actual
+    assert len(mismatch.original) >= len(mismatch.text)
+
+
+def test_shrink():
+    text = "keep\nnoise line\nmore noise BUG here"
+    assert shrink(text, lambda t: "BUG" in t) == "BUG"
+
+
+def test_generated_markdown_is_deterministic():
+    import random
+
+    first = generate_markdown(random.Random(3))
+    assert first == generate_markdown(random.Random(3))
+    assert first.strip()
+
+
+def test_command_line(capsys):
+    assert main(["--engine", "regex", "--runs", "20"]) == 0
+    assert "regex: no differences in 20 inputs" in capsys.readouterr().out
@@ -0,0 +1,136 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.load import run_load
+from chatgpt_md_converter import telegram_format, telegram_format_entities
+from chatgpt_md_converter.server import ENDPOINTS, FormatClient, FormatServer
+from chatgpt_md_converter.splitter import split_html
+
+TEXT = "# Title\n\n**bold** <tag> and `code`\n\n" * 20
+
+
+def serve(test, **options):
+    async def main():
+        async with FormatServer(executor="thread", workers=2, **options) as server:
+            await server.start(port=0)
+            host, port = server.addresses[0][:2]
+            return await test(server, {"host": host, "port": port})
+
+    return asyncio.run(main())
+
+
+def test_endpoints_over_one_connection():
+    async def test(server, address):
+        async with FormatClient(**address) as client:
+            assert await client.format(TEXT) == telegram_format(TEXT)
+            assert await client.chunks(TEXT, limit=100) == list(
+                split_html(telegram_format(TEXT), 100)
+            )
+            text, entities = await client.entities(TEXT)
+            assert (text, entities) == telegram_format_entities(TEXT)
+            health = await client.health()
+        assert health["status"] == "ok" and health["requests"] == 4
+        assert health["connections"] == 1
+
+    serve(test)
+
+
+def test_unix_socket(tmp_path):
+    path = str(tmp_path / "formatter.sock")
+
+    async def main():
+        async with FormatServer(executor="thread", workers=1) as server:
+            await server.start(path=path)
+            async with FormatClient(path=path) as client:
+                return await client.format("_hi_")
+
+    assert asyncio.run(main()) == "<i>hi</i>"
+
+
+def test_concurrent_requests_are_batched():
+    async def test(server, address):
+        clients = [FormatClient(**address) for _ in range(20)]
+        texts = [f"**{i}**" for i in range(20)]
+        results = await asyncio.gather(
+            *(client.format(text) for client, text in zip(clients, texts))
+        )
+        for client in clients:
+            await client.close()
+        assert results == [telegram_format(text) for text in texts]
+        assert server.stats()["batches"] < 20
+
+    serve(test, batch_delay=0.01)
+
+
+def test_errors():
+    async def test(server, address):
+        async with FormatClient(**address) as client:
+            assert (await client.request("POST", "/format", {"text": 1}))[0] == 400
+            assert (await client.request("POST", "/format", ["x"]))[0] == 400
+            assert (await client.request("POST", "/missing", {}))[0] == 404
+            assert (await client.request("GET", "/format"))[0] == 405
+            status, response = await client.request(
+                "POST", "/format", {"text": "x", "engine": "other"}
+            )
+            assert status == 400 and "Unknown engine" in response["error"]
+            assert await client.format("still *open*") == "still <i>open</i>"
+
+    serve(test)
+
+
+def test_failing_request_does_not_fail_its_batch(monkeypatch):
+    def broken(request):
+        raise RuntimeError("boom")
+
+    monkeypatch.setitem(ENDPOINTS, "/entities", broken)
+
+    async def test(server, address):
+        clients = [FormatClient(**address) for _ in range(3)]
+        results = await asyncio.gather(
+            clients[0].request("POST", "/format", {"text": "*a*"}),
+            clients[1].request("POST", "/entities", {"text": "a"}),
+            clients[2].request("POST", "/format", {"text": "_b_"}),
+        )
+        for client in clients:
+            await client.close()
+        return results, server.stats()["batches"]
+
+    results, batches = serve(test, batch_delay=0.05)
+    assert batches == 1
+    assert results == [
+        (200, {"html": "<i>a</i>", "degraded": False}),
+        (500, {"error": "RuntimeError: boom"}),
+        (200, {"html": "<i>b</i>", "degraded": False}),
+    ]
+
+
+def test_full_queue_is_rejected():
+    release = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=1)
+    executor.submit(release.wait)
+
+    async def main():
+        async with FormatServer(executor, workers=1, max_queue=1) as server:
+            await server.start(port=0)
+            host, port = server.addresses[0][:2]
+            clients = [FormatClient(host, port) for _ in range(3)]
+            first = asyncio.ensure_future(clients[0].format("a"))
+            await asyncio.sleep(0.05)
+            second = asyncio.ensure_future(clients[1].format("b"))
+            await asyncio.sleep(0.05)
+            status, _ = await clients[2].request("POST", "/format", {"text": "c"})
+            release.set()
+            results = await first, await second
+            for client in clients:
+                await client.close()
+            return status, results, server.stats()["rejected"]
+
+    assert asyncio.run(main()) == (503, ("a", "b"), 1)
+    executor.shutdown()
+
+
+def test_load_generator():
+    result = asyncio.run(run_load(requests=50, connections=5, workers=1))
+    assert result["requests"] == 50 and result["rejected"] == 0
+    assert result["mean_batch_size"] >= 1
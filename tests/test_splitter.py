@@ -0,0 +1,111 @@
+import html
+import re
+
+import pytest
+
+from chatgpt_md_converter import telegram_format, telegram_format_chunks
+from chatgpt_md_converter.helpers import truncate_html, utf16_length
+from chatgpt_md_converter.splitter import split_html
+
+PARAGRAPH = "Some **bold text that goes on** and on, with `code` & more. " * 4
+CODE = "```python\n" + 'print("<x>")\n' * 20 + "```"
+QUOTE = "> quote line ||spoiler 🎉 & more||\n> next line"
+TEXT = "\n\n".join([PARAGRAPH, CODE, QUOTE] * 6)
+
+
+def visible_text(chunk):
+    return html.unescape(re.sub(r"<[^>]+>", "", chunk))
+
+
+def assert_balanced(chunk):
+    stack = []
+    for closing, name in re.findall(r"<(/?)([\w\-]+)[^>]*>", chunk):
+        if closing:
+            assert stack and stack.pop() == name, chunk
+        else:
+            stack.append(name)
+    assert not stack, chunk
+
+
+def test_chunks_respect_limit_and_balance_tags():
+    for limit in (60, 200, 1000):
+        chunks = list(telegram_format_chunks(TEXT, limit=limit))
+        assert len(chunks) > 1
+        for chunk in chunks:
+            assert utf16_length(visible_text(chunk)) <= limit
+            assert_balanced(chunk)
+
+
+def test_chunks_keep_all_text():
+    full = visible_text(telegram_format(TEXT))
+    joined = "".join(visible_text(c) for c in telegram_format_chunks(TEXT, 300))
+    assert re.sub(r"\s", "", joined) == re.sub(r"\s", "", full)
+
+
+def test_chunks_prefer_paragraph_boundaries():
+    text = "\n\n".join(["a" * 30, "b" * 30, "c" * 30])
+    assert list(telegram_format_chunks(text, limit=70)) == [
+        "a" * 30 + "\n\n" + "b" * 30,
+        "c" * 30,
+    ]
+
+
+def test_code_block_is_reopened_in_next_chunk():
+    text = "```python\n" + "x = 1\n" * 30 + "```"
+    chunks = list(telegram_format_chunks(text, limit=50))
+    assert all(c.startswith('<pre><code class="language-python">') for c in chunks)
+    assert all(c.endswith("</code></pre>") for c in chunks)
+
+
+def test_length_is_counted_in_utf16_units():
+    chunks = list(split_html("🎉" * 10, limit=4))
+    assert chunks == ["🎉🎉"] * 5
+
+
+def test_entities_are_not_cut():
+    chunks = list(split_html("&amp;" * 5, limit=2))
+    assert chunks == ["&amp;&amp;", "&amp;&amp;", "&amp;"]
+
+
+def test_short_text_is_one_chunk():
+    assert list(telegram_format_chunks("**hi**")) == ["<b>hi</b>"]
+
+
+def test_invalid_limit():
+    with pytest.raises(ValueError):
+        list(split_html("text", limit=0))
+
+
+@pytest.mark.parametrize("engine", ["regex", "tokenizer"])
+@pytest.mark.parametrize("max_length", [1, 10, 57, 200, 1000])
+def test_max_length_truncates_in_one_conversion(engine, max_length):
+    output = telegram_format(TEXT, engine=engine, max_length=max_length)
+    assert utf16_length(visible_text(output)) <= max_length
+    assert output.endswith("…")
+    assert_balanced(output)
+    full = visible_text(telegram_format(TEXT, engine=engine))
+    assert full.startswith(visible_text(output)[:-1].rstrip())
+
+
+def test_max_length_stops_early_on_long_text():
+    text = TEXT * 40
+    assert telegram_format(text, max_length=300) == truncate_html(
+        telegram_format(text), 300
+    )
+
+
+def test_truncation_never_cuts_entities_tags_or_emoji():
+    assert truncate_html("<b>a &amp; b</b> c", 4) == "<b>a &amp;</b>…"
+    assert truncate_html("<b>a &amp; b</b> c", 3) == "<b>a</b>…"
+    assert truncate_html("x 🤔🤔 y", 4) == "x…"
+    assert truncate_html("x 🤔🤔 y", 5) == "x 🤔…"
+    assert truncate_html('ab <a href="http://x"><b>cd</b></a>', 4) == "ab…"
+
+
+def test_text_that_fits_is_not_truncated():
+    assert telegram_format("**short**", max_length=7) == "<b>short</b>"
+    result = telegram_format("[a](http://x) & b", max_length=5, plain_text=True)
+    assert result == '<a href="http://x">a</a> &amp; b'
+    assert result.plain_text == "a (h…"
+    with pytest.raises(ValueError):
+        truncate_html("**long text**", 0)
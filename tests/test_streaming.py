@@ -0,0 +1,217 @@
+import hashlib
+import os
+import time
+
+import pytest
+
+from chatgpt_md_converter import InvalidHTMLError
+from chatgpt_md_converter.streaming import StreamingFormatter, telegram_format_lines
+from chatgpt_md_converter.telegram_formatter import telegram_format
+
+REPLY = """# Answer
+
+Here is **bold**, __underline__ and `inline code`. 2 * 3 = 6 and snake_case.
+
+```python
+def example():
+
+    return "<value>"
+```
+
+> Quoted line
+> with ||spoiler||
+
+**open bold
+
+that closes later** and [a link](http://example.com)【4:0†source】
+
+- Item one
+* Item two
+
+Trailing *italic* text"""
+
+
+def stream(text, step):
+    formatter = StreamingFormatter()
+    for i in range(0, len(text), step):
+        formatter.feed(text[i : i + step])
+        assert formatter.render() == telegram_format(text[: i + step])
+    return formatter
+
+
+def test_streaming_matches_full_format():
+    for step in (1, 2, 3, 7, 16, 64):
+        stream(REPLY, step)
+
+
+def test_streaming_keeps_closed_paragraphs():
+    formatter = stream(REPLY, 5)
+    assert formatter._head.startswith("<b>Answer</b>")
+    assert formatter._tail == "Trailing *italic* text"
+
+
+def test_streaming_does_not_close_open_code_block():
+    formatter = stream("Intro\n\n```\nline one\n\nline two", 4)
+    assert formatter._tail.startswith("```")
+    formatter.feed("\n```\n\nDone")
+    assert formatter.render() == telegram_format(
+        "Intro\n\n```\nline one\n\nline two\n```\n\nDone"
+    )
+
+
+def test_streaming_converts_only_new_code_of_open_block(monkeypatch):
+    from chatgpt_md_converter import streaming
+
+    text = "Intro **bold**\n\n```python\nx = a < b and `c`\n"
+    formatter = StreamingFormatter()
+    formatter.feed(text)
+    assert formatter.render() == telegram_format(text)
+
+    converted = []
+    convert = streaming._convert
+
+    def counting(text, *args):
+        converted.append(text)
+        return convert(text, *args)
+
+    monkeypatch.setattr(streaming, "_convert", counting)
+    for line in ["y = 1 & 2\n", "\n\n\n", "z = '<tag>'\n", "`odd\n", "end"]:
+        formatter.feed(line)
+        text += line
+        assert formatter.render() == telegram_format(text)
+    # Only the odd number of backticks changed the HTML around the code, which
+    # was converted with a stand-in for the code and checked once
+    assert len(converted) == 2
+
+
+def test_streaming_repairs_overlapping_markup():
+    text = "**a _b** c_\n\nx ~~a **b~~ c**\n\nend"
+    formatter = stream(text, 1)
+    assert formatter._head.startswith("<b>a <i>b</i></b><i> c</i>")
+    assert "".join(telegram_format_lines(text.splitlines(True))) == telegram_format(text)
+
+
+def test_streaming_waits_for_a_closer_of_open_markup():
+    # "_id" stays open until a possible closer of "_" arrives
+    text = "Use the _id field\n\n" + "Some **bold** text.\n\n" * 40 + "a_ end\n\nmore"
+    stream(text, 9)
+    formatter = stream(text.replace("a_ end", "a end"), 9)
+    assert formatter._tail.startswith("Use the _id")
+    assert formatter._blocker is not None
+
+
+@pytest.mark.timing
+def test_streaming_with_stray_marker_is_not_slower_than_rerendering():
+    paragraph = "Some **bold** text with `code` and a [link](http://x.io) here.\n\n"
+    text = "Use the _id field\n\n" + paragraph * 300
+    chunks = [text[i : i + 100] for i in range(0, len(text), 100)]
+
+    def streamed():
+        formatter = StreamingFormatter()
+        for chunk in chunks:
+            formatter.feed(chunk)
+            formatter.render()
+
+    def rerendered():
+        for i in range(len(chunks)):
+            telegram_format("".join(chunks[: i + 1]))
+
+    def best(function):
+        times = []
+        for _ in range(3):
+            start = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    assert best(streamed) < 1.3 * best(rerendered)
+
+
+def test_render_change_detection():
+    formatter = StreamingFormatter()
+    previous = ""
+    for i in range(0, len(REPLY), 3):
+        formatter.feed(REPLY[i : i + 3])
+        html = formatter.render()
+        assert html.changed == (html != previous)
+        assert html.unchanged_prefix == len(os.path.commonprefix([previous, html]))
+        digest = hashlib.blake2b(html.encode(), digest_size=8).hexdigest()
+        assert html.fingerprint == digest
+        previous = html
+
+    # Trailing whitespace does not change the message
+    for delta in ("\n", " ", "\n\n", "\t"):
+        formatter.feed(delta)
+        html = formatter.render()
+        assert not html.changed
+        assert html.unchanged_prefix == len(html)
+        assert html.fingerprint == previous.fingerprint
+
+
+def test_streaming_empty():
+    assert StreamingFormatter().render() == ""
+
+
+def test_lines_match_full_format():
+    document = "\n\n".join([REPLY] * 200)
+    fragments = list(telegram_format_lines(document.splitlines(keepends=True)))
+    assert len(fragments) > 1
+    assert "".join(fragments) == telegram_format(document)
+
+
+def test_lines_are_converted_while_reading():
+    read = []
+
+    def lines():
+        for i in range(5000):
+            read.append(i)
+            yield f"Paragraph **{i}**\n\n"
+
+    fragments = telegram_format_lines(lines())
+    assert next(fragments).startswith("Paragraph <b>0</b>")
+    assert len(read) < 5000
+    assert "".join(fragments)
+
+
+def test_lines_stop_waiting_for_open_markup():
+    document = "~~never closed\n\n" + "Paragraph *one*.\n\n" * 5000 + "end~~"
+    output = "".join(telegram_format_lines(document.splitlines(True), 1024))
+    assert output.startswith("~~never closed\n\nParagraph <i>one</i>.")
+    assert output.endswith("Paragraph <i>one</i>.\n\nend~~")
+
+
+def test_low_memory_mode():
+    document = "\n\n".join([REPLY, "**a _b** c_"] * 200)
+    assert telegram_format(document, low_memory=True) == telegram_format(document)
+    assert telegram_format("\n *x* \n", low_memory=True) == "<i>x</i>"
+    with pytest.raises(ValueError):
+        telegram_format(document, engine="tokenizer", low_memory=True)
+
+
+@pytest.mark.timing
+def test_low_memory_with_stray_markers_stays_close_to_regular_path():
+    paragraph = "Some **bold** text with `code` and a [link](http://x.io) here.\n\n"
+    document = ("*stray " + paragraph * 1500) * 10
+
+    def best(**options):
+        times = []
+        for _ in range(3):
+            start = time.perf_counter()
+            telegram_format(document, **options)
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    # Each pending text is converted a logarithmic number of times
+    assert best(low_memory=True) < 4 * best()
+
+
+def test_low_memory_strict_mode():
+    with pytest.raises(InvalidHTMLError):
+        telegram_format("**a _b** c_\n\n" * 3, low_memory=True, strict=True)
+    with pytest.raises(InvalidHTMLError):
+        telegram_format("x\n\n**a _b** c_", low_memory=True, strict=True)
+
+
+def test_lines_empty():
+    assert list(telegram_format_lines([])) == []
+    assert list(telegram_format_lines(["\n", "  \n"])) == []
@@ -0,0 +1,77 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from benchmarks.run import load_corpus, scale
+from benchmarks.threads import run_thread_benchmarks, thread_counts
+from chatgpt_md_converter import (
+    FormatCache,
+    parse_document,
+    profile_stages,
+    telegram_format,
+    telegram_format_entities,
+)
+
+TEXTS = [scale(text, 2048) for text in load_corpus().values()]
+THREADS = 8
+
+
+def run_together(function, arguments):
+    """
+    Calls ``function`` with each argument on its own thread, all at once.
+    """
+    barrier = threading.Barrier(len(arguments))
+
+    def call(argument):
+        barrier.wait()
+        return function(argument)
+
+    with ThreadPoolExecutor(len(arguments)) as executor:
+        return list(executor.map(call, arguments))
+
+
+@pytest.mark.parametrize("engine", ["regex", "tokenizer"])
+def test_concurrent_conversions_match_serial(engine):
+    expected = [telegram_format(text, engine=engine, plain_text=True) for text in TEXTS]
+    cache = FormatCache()
+    texts = TEXTS * (THREADS // len(TEXTS) + 1)
+
+    def convert(text):
+        html = telegram_format(text, engine=engine, plain_text=True)
+        cached = telegram_format(text, engine=engine, cache=cache)
+        return html, html.plain_text, cached, telegram_format_entities(text)
+
+    for text, (html, plain, cached, entities) in zip(texts, run_together(convert, texts)):
+        index = TEXTS.index(text)
+        assert html == cached == expected[index]
+        assert plain == expected[index].plain_text
+        assert entities == telegram_format_entities(text)
+
+
+def test_profiling_is_per_thread():
+    def convert(profiled):
+        if not profiled:
+            telegram_format(TEXTS[0])
+            return []
+        with profile_stages() as stages:
+            telegram_format(TEXTS[0])
+        return stages
+
+    results = run_together(convert, [True, False] * (THREADS // 2))
+    lengths = {len(stages) for stages in results[::2]}
+    assert len(lengths) == 1 and lengths.pop() > 0
+    assert all(stages == [] for stages in results[1::2])
+
+
+def test_shared_tables_are_read_only():
+    document = parse_document("# Title")
+    document.children[0].children[0].attrs["level"] = 3
+    assert parse_document("# Title").children[0].children[0].attrs == {"level": 1}
+
+
+def test_thread_benchmark():
+    assert thread_counts(6) == [1, 2, 4, 6]
+    results = run_thread_benchmarks([1, 2], engines=["regex"], size=256, duration=0.05)
+    assert [r["threads"] for r in results] == [1, 2]
+    assert results[0]["speedup"] == 1
@@ -0,0 +1,73 @@
+import pytest
+
+from chatgpt_md_converter.telegram_formatter import telegram_format
+
+SAMPLES = [
+    "",
+    "    ",
+    "This is **bold** text",
+    "This is _italic_ and *italic* text",
+    "This is *__bold within italic__* text.",
+    "This is **bold and _italic_ together**.",
+    "This is **bold and `inline code` together**.",
+    "Here is a code block: ```<script>alert('Hello')</script>```",
+    "```python\n**bold text** and __underline__ in code block```",
+    "```python\nfor i in range(3):\n    print(i)\n```\nAfter the block",
+    "This has an `unmatched code delimiter.",
+    "Here is some ```code without closing",
+    "- List item with `code`\n* Another `code` item【4:0†source】",
+    "# Heading\nSome text\n## Heading2\nMore text\n",
+    "Avoid using < or > & in your HTML.",
+    "[OtherText] [Title](https://example.com) and ![img](URL_to_image)",
+    "[Link [with brackets]](https://example.com)",
+    "Look at [this], but [not a link] something else.",
+    "2 * 2 = 4, x*y + z = 10, 5 * x + *emphasized* text",
+    "(2*3) is an equation, but *italic* text is separate.",
+    "This_variable should remain, but _italic_ should convert.",
+    "Here is `code_with_*_asterisk` outside of `code_with__underscore__`",
+    "***Bold and italic text*** or ___Underline and italic text___",
+    "This is ~~strikethrough~~ and ||*italic spoiler*|| text",
+    ">Regular blockquote with ||spoiler|| text\n>Continued\n\n**>Expandable\n>Hidden",
+    "*  **Парадокс кота:** Чи може кіт? 🤔\n*  **Ефект метелика:** 🦋",
+    "звісно, ой та зрозуміло `<LAUGH>` що ти тут тестуєш.",
+    "Some <div>stuff</div> here.\n```\n<html></html>\n```\nMore text with *italic*.",
+    "Para one\n\n\n\nPara two\n   - nested **item**\n      1. Subitem",
+    "[![badge](https://img/x.svg)](https://github.com/x)",
+    "[label\nmore](http://x)",
+    "***a\nb*** and **c\nd**",
+    "【4:0†source】[cited](http://x)",
+    "**a __b** c__",
+    "**a _b ~~c** d~~ e_",
+    "> a `b\nc` d",
+]
+
+
+def test_tokenizer_matches_regex_engine():
+    for text in SAMPLES:
+        expected = telegram_format(text)
+        assert telegram_format(text, engine="tokenizer") == expected, text
+
+
+def test_blockquote_ending_inside_code():
+    for text in ["> ```\ncode\n```", "> ```\ncode\n```\nafter"]:
+        assert telegram_format(text, engine="tokenizer") == telegram_format(text), text
+
+
+def test_quote_markers_inside_code_block():
+    for text in [
+        "```python\n>>> print(1)\n1\n```\n> quote\n```\n> not a quote\n```",
+        "> ```\n> >>> x\n> ```\nafter",
+    ]:
+        assert telegram_format(text, engine="tokenizer") == telegram_format(text), text
+
+
+def test_link_label_is_not_linked_again():
+    text = "[![badge](https://img/x.svg)](https://github.com/x)"
+    assert telegram_format(text, engine="tokenizer") == (
+        '<a href="https://github.com/x">![badge](https://img/x.svg)</a>'
+    )
+
+
+def test_unknown_engine():
+    with pytest.raises(ValueError):
+        telegram_format("text", engine="nope")
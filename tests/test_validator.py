@@ -0,0 +1,59 @@
+import random
+
+import pytest
+
+from chatgpt_md_converter import InvalidHTMLError, sanitize_html, telegram_format
+
+
+def test_valid_html_is_returned_unchanged():
+    html = (
+        '<b>a <i>b</i></b> <a href="http://x.io/?a=1&amp;b=2">x</a> &lt;&#33;'
+        '<pre><code class="language-py">1 &lt; 2</code></pre>'
+        '<blockquote expandable><span class="tg-spoiler">s</span></blockquote>'
+    )
+    assert sanitize_html(html) == (html, [])
+
+
+@pytest.mark.parametrize(
+    "html, expected, kinds",
+    [
+        ("<b>a <i>b</b> c</i>", "<b>a <i>b</i></b><i> c</i>", ["overlap"]),
+        ("a</span> b", "a b", ["unmatched_closing_tag"]),
+        ("<b>open", "<b>open</b>", ["unclosed_tag"]),
+        ("<span>x</span>", "&lt;span&gt;x", ["unsupported_tag", "unmatched_closing_tag"]),
+        ('<a href="a"b">x</a>', '<a href="a&quot;b">x</a>', ["attribute"]),
+        ("<code><b>x</b></code>", "<code>x</code>", ["nesting", "unmatched_closing_tag"]),
+        (
+            "<blockquote>a <blockquote>b</blockquote> c</blockquote>",
+            "<blockquote>a b</blockquote> c",
+            ["nesting", "unmatched_closing_tag"],
+        ),
+        ("1 < 2 &nbsp;", "1 &lt; 2 &amp;nbsp;", ["unescaped_character"] * 2),
+    ],
+)
+def test_repairs(html, expected, kinds):
+    output, repairs = sanitize_html(html)
+    assert output == expected
+    assert [repair.kind for repair in repairs] == kinds
+    assert sanitize_html(output) == (output, [])
+
+
+def test_strict_mode_raises():
+    with pytest.raises(InvalidHTMLError) as error:
+        sanitize_html("<b>a <i>b</b> c</i>", strict=True)
+    assert error.value.repairs[0].markup == "</b>"
+    assert error.value.repairs[0].position == 9
+
+
+@pytest.mark.parametrize("engine", ["regex", "tokenizer"])
+def test_pipeline_output_is_sanitized(engine):
+    assert telegram_format("**a _b** c_", engine=engine) == "<b>a <i>b</i></b><i> c</i>"
+    with pytest.raises(InvalidHTMLError):
+        telegram_format("[x](http://a\"b)", engine=engine, strict=True)
+
+    pieces = ["**", "*", "_", "__", "~~", "||", "`", "[", "](", ")", "<", "&", "a", " ", "\n"]
+    generator = random.Random(20)
+    for _ in range(300):
+        text = "".join(generator.choice(pieces) for _ in range(generator.randint(1, 30)))
+        html = telegram_format(text, engine=engine)
+        assert sanitize_html(html) == (html, []), text